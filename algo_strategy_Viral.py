@@ -126,6 +126,7 @@ class AlgoStrategy(gamelib.AlgoCore):
 
         self.att_dir = {}
         self.my_paths = {}
+        self.edge_paths = game_state.find_all_edge_paths(0)
         damages = [self.netProtect(game_state, edge) for edge in self.my_edges]
 
         SC_health = 15
@@ -174,37 +175,12 @@ class AlgoStrategy(gamelib.AlgoCore):
 
     #given path, calculate shielding recieved PER UNIT
     def get_shielders(self, game_state, location_list, player_index = 0):
-
-
           if not player_index == 0 and not player_index == 1:
               self._invalid_player_index(player_index)
 
-          attackers = []
-
-          shieldT = 0
-
-          checked_locs = []
-          max_range = 0
-          for unit in self.config["unitInformation"]:
-              if unit.get('shieldRange', 0) >= max_range:
-                  max_range = unit.get('shieldRange', 0)
-
           if location_list == None:
               return -10000
-          #gamelib.debug_write(len(location_list))
-          for location in location_list:
-              possible_locations= game_state.game_map.get_locations_in_range(location, max_range)
-              for loc in possible_locations:
-                  if loc in checked_locs:
-                      possible_locations.remove(loc)
-              for loc in possible_locations:
-                  checked_locs.append(loc)
-              for location_unit in possible_locations:
-                  for unit in game_state.game_map[location_unit]:
-                      if unit.player_index == player_index and game_state.game_map.distance_between_locations(location, location_unit) <= unit.shieldRange:
-                          attackers.append(unit)
-                          shieldT += unit.shieldPerUnit
-          return shieldT
+          return game_state.get_shield_map().path_shielding(location_list, player_index)
 
     #given path, estimate damage
     def least_damage_spawn_location(self, game_state, path):
@@ -219,22 +195,16 @@ class AlgoStrategy(gamelib.AlgoCore):
         if path == None:
             return 100000
 
-        damage = 0
-        for path_location in path:
-            # Get number of enemy turrets that can attack each location and multiply by turret damage
-            if tuple(path_location) in self.att_dir:
-                damage += sum([unit.damage_i for unit in game_state.get_attackers(path_location, 0)])
-            else:
-                temp = sum([unit.damage_i for unit in game_state.get_attackers(path_location, 0)])
-                damage += temp
-                self.att_dir[tuple(path_location)] = temp
+        # Sum the damage enemy turrets deal on each location of the path
+        damage = game_state.get_threat_map().path_damage(path, 0)
         damages.append(damage)
 
         # Now just return the location that takes the least damage
         return damages[0]
 
     def netProtect(self, game_state, start):
-        path = game_state.find_path_to_edge(start)
+        cells = self.edge_paths[tuple(start)]
+        path = None if cells is None else [list(game_state.game_map.geometry.xy[cell]) for cell in cells]
         self.my_paths[tuple(start)] = path
         defe = self.get_shielders(game_state, path)
         atk = self.least_damage_spawn_location(game_state, path)
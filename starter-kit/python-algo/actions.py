@@ -71,7 +71,7 @@ def build_defences(game_state, units):
 """
 This function builds reactive defenses based on where the enemy scored on us from.
 We can track where the opponent scored by looking at events in action frames 
-as shown in the on_action_frame function
+as shown in the on_action_frame function. gamelib.EventMap.locations gives each location once, most scored on first.
 """
 def build_reactive_defense(game_state, units, scored_on_locations):
     for location in scored_on_locations:
@@ -142,11 +142,9 @@ def least_damage_spawn_location(game_state, units, location_options):
 
 def detect_enemy_unit(game_state, unit_type=None, valid_x = None, valid_y = None):
     total_units = 0
-    for location in game_state.game_map:
-        if game_state.contains_stationary_unit(location):
-            for unit in game_state.game_map[location]:
-                if unit.player_index == 1 and (unit_type is None or unit.unit_type == unit_type) and (valid_x is None or location[0] in valid_x) and (valid_y is None or location[1] in valid_y):
-                    total_units += 1
+    for location in game_state.game_map.structure_locations(1, unit_type):
+        if (valid_x is None or location[0] in valid_x) and (valid_y is None or location[1] in valid_y):
+            total_units += 1
     return total_units
     
 def filter_blocked_locations(locations, game_state):
@@ -4,6 +4,7 @@ import math
 import warnings
 from sys import maxsize
 import json
+from gamelib.build_plan import NEVER, IDLE, at_turn, after_turn, before_turn, between_turns
 
 
 """
@@ -43,6 +44,8 @@ class AlgoStrategy(gamelib.AlgoCore):
         SP = 0
         # This is a good place to do initial setup
         self.scored_on_locations = []
+        self.defense_plan = self.build_plan()
+        self.defense_plan.compile(config)
 
     def on_turn(self, turn_state):
         """
@@ -107,7 +110,7 @@ class AlgoStrategy(gamelib.AlgoCore):
                 support_locations = [[13, 2], [14, 2], [13, 3], [14, 3]]
                 game_state.attempt_spawn(SUPPORT, support_locations)
 
-    def strategy(self, game_state):
+    def build_plan(self):
         primary_turret_locs = [[3, 12],[24,12],[9,6],[18,6]]
         secondary_turret_locs = [[2,12],[25,12],[21,9],[6,9]]
         extra_turret_locs = [[14,6],[1,12],[26,12],[7,8],[20,8]]
@@ -120,52 +123,53 @@ class AlgoStrategy(gamelib.AlgoCore):
 
         support_locations1 = [[i,6] for i in range(9,14)]
         support_locations2  = [[i,5] for i in range(10,14)]
+        back_support_locs = [[i+11,2] for i in range(3)]
+
+        plan = gamelib.BuildPlan(stop=NEVER)
+
+        # reorganize the turrets at turn 25
+        plan.remove([[2,12],[6,9],[7,8],[9,6],[14,6],[18,6]], when=at_turn(25))
+        late = after_turn(25)
+        plan.spawn(WALL, special_wall_locs, when=late)
+        plan.spawn(TURRET,turret_reorg_locs, when=late)
+        plan.upgrade(turret_reorg_locs, when=late)
+        plan.spawn(WALL,[[19,11],[20,12],[22,12]], when=late)
+        plan.spawn(WALL, primary_wall_locs + secondary_wall_locs, when=late)
+        plan.upgrade(support_locations2, when=late)
+        plan.upgrade(primary_wall_locs+secondary_wall_locs, when=late)
+        plan.spawn(SUPPORT,back_support_locs, when=late)
+        plan.upgrade(support_locations1, when=late)
+        plan.upgrade(back_support_locs, when=late)
+
+        plan.spawn(TURRET, primary_turret_locs, when=before_turn(25))
+        plan.upgrade(primary_turret_locs, when=before_turn(25))
+
+        plan.spawn(TURRET, secondary_turret_locs, when=between_turns(6, 24))
+        plan.upgrade(secondary_turret_locs, when=between_turns(6, 24))
+        plan.spawn(WALL, primary_wall_locs, when=between_turns(6, 24))
+
+        plan.spawn(WALL,[11,4], when=between_turns(16, 24))
+        plan.spawn(TURRET, extra_turret_locs, when=between_turns(16, 24))
+        plan.upgrade(extra_turret_locs, when=between_turns(16, 24))
+        plan.spawn(WALL, primary_wall_locs, when=between_turns(16, 24))
+        plan.spawn(WALL, secondary_wall_locs, when=between_turns(16, 24))
+
+        # the rest only once the supports could be upgraded
+        plan.spawn(SUPPORT, support_locations2, when=between_turns(21, 24))
+        plan.upgrade(support_locations2, when=between_turns(21, 24), stop=IDLE)
+        plan.spawn(SUPPORT, support_locations1, when=between_turns(21, 24))
+        plan.upgrade(support_locations1, when=between_turns(21, 24))
+        plan.spawn(WALL, special_wall_locs, when=between_turns(21, 24))
+        plan.upgrade(primary_wall_locs, when=between_turns(21, 24))
+        return plan
 
+    def strategy(self, game_state):
         turn = game_state.turn_number
         [mySP, myMP] = game_state.get_resources(0)
         [enemySP, enemyMP] = game_state.get_resources(1)
 
         # build defences
-        if turn == 25:
-            game_state.attempt_remove([[2,12],[6,9],[7,8],[9,6],[14,6],[18,6]])
-        if turn > 25:
-            game_state.attempt_spawn(WALL, special_wall_locs)
-            game_state.attempt_spawn(TURRET,turret_reorg_locs)
-            game_state.attempt_upgrade(turret_reorg_locs)
-            game_state.attempt_spawn(WALL,[[19,11],[20,12],[22,12]])
-            game_state.attempt_spawn(WALL, primary_wall_locs + secondary_wall_locs)
-            game_state.attempt_upgrade(support_locations2)
-            game_state.attempt_upgrade(primary_wall_locs+secondary_wall_locs)
-            game_state.attempt_spawn(SUPPORT,[[i+11,2] for i in range(3)])
-            game_state.attempt_upgrade(support_locations1)
-            game_state.attempt_upgrade([[i+11,2] for i in range(3)])
-
-        if turn < 25:
-            game_state.attempt_spawn(TURRET, primary_turret_locs)
-            game_state.attempt_upgrade(primary_turret_locs)
-
-            if turn > 5:
-                game_state.attempt_spawn(TURRET, secondary_turret_locs)
-                game_state.attempt_upgrade(secondary_turret_locs)
-
-                if game_state.attempt_upgrade(secondary_turret_locs) == 0:
-                    game_state.attempt_spawn(WALL, primary_wall_locs)
-
-            if turn > 15:
-                game_state.attempt_spawn(WALL,[11,4])
-                game_state.attempt_spawn(TURRET, extra_turret_locs)
-                game_state.attempt_upgrade(extra_turret_locs)
-                game_state.attempt_spawn(WALL, primary_wall_locs)
-                game_state.attempt_spawn(WALL, secondary_wall_locs)
-
-            if turn > 20:
-                game_state.attempt_spawn(SUPPORT, support_locations2)
-                temp = game_state.attempt_upgrade(support_locations2)
-                if temp != 0:
-                    game_state.attempt_spawn(SUPPORT, support_locations1)
-                    game_state.attempt_upgrade(support_locations1)
-                    game_state.attempt_spawn(WALL, special_wall_locs)
-                    game_state.attempt_upgrade(primary_wall_locs)
+        self.defense_plan.execute(game_state)
 
         # attacks
         if turn < 5:
@@ -160,37 +160,12 @@ class AlgoStrategy(gamelib.AlgoCore):
           if not game_state.game_map.in_arena_bounds(start_location):
               self.warn("Location {} is not in the arena bounds.".format(start_location))
 
-          attackers = []
-          """
-          Get locations in the range of support units
-          """
-
-          shieldT = 0
-
-          checked_locs = []
-          max_range = 0
-          for unit in self.config["unitInformation"]:
-              if unit.get('shieldRange', 0) >= max_range:
-                  max_range = unit.get('shieldRange', 0)
-
           location_list = game_state.find_path_to_edge(start_location)
 
           if location_list == None:
               return -10000
 
-          for location in location_list:
-              possible_locations= game_state.game_map.get_locations_in_range(location, max_range)
-              for loc in possible_locations:
-                  if loc in checked_locs:
-                      possible_locations.remove(loc)
-              for loc in possible_locations:
-                  checked_locs.append(loc)
-              for location_unit in possible_locations:
-                  for unit in game_state.game_map[location_unit]:
-                      if unit.damage_i + unit.damage_f == 0 and unit.player_index != player_index and game_state.game_map.distance_between_locations(location, location_unit) <= unit.shieldRange:
-                          attackers.append(unit)
-                          shieldT += unit.shieldPerUnit
-          return shieldT
+          return game_state.get_shield_map().path_shielding(location_list, 1 - player_index)
 
 
 
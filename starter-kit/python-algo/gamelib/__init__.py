@@ -2,7 +2,8 @@
 The gamelib package contains modules that assist in algo creation \n
 
 The GameState class in game_state.py is the main class most players interact with. 
-It contains functions that let you get information about resources, deploy units, and help you strategize your move. \n
+It contains functions that let you get information about resources, deploy units, and help you strategize your move. 
+GameState.fork() makes a cheap independent copy of a turn for trying out builds and deploys. \n
 
 The GameMap class in game_map.py represents the current game map. It can be used to access information related to the locations of units. 
 Investigating it is useful for any player that wants to access more information about the current state of the game. \n
@@ -11,11 +12,38 @@ The GameUnit class in unit.py represetns a single unit.
 Investigating it is useful for any player that wants to access information about units. \n
 
 The AlgoCore class in algocore.py handles communication with the game engine, and forms the bones of an algo. AlgoStrategy inherits from it. 
-Investigating it is useful for advanced players interested in getting data from the action phase or communicating directly with the game engine. \n
+Investigating it is useful for advanced players interested in getting data from the action phase or communicating directly with the game engine. 
+AlgoCore.enable_precompute() runs AlgoCore.precompute() in a background thread during the action phase, so on_turn can start from warm results. \n
 
 The Navigation class in navigation.py contains functions related to pathfinding, which are used by GameState in pathing related functions. 
 Investigating it is useful for advanced player who want to optimize the slow default pathing algorithm we provide. \n 
 
+The ThreatMap class in threat_map.py tracks the damage each player's structures can deal to every tile. 
+GameState.get_threat_map() builds one and keeps it up to date as you spawn and upgrade, which makes scoring paths cheap. 
+The ShieldMap class in shield_map.py does the same for the shielding your supports give mobile units. \n
+
+The Simulator class in simulator.py plays out an action phase frame by frame from a GameState, so you can score a turn's builds and deploys before sending them. 
+BatchSimulator in batch_simulator.py runs many variations of one turn side by side in NumPy arrays, for comparing hundreds of candidate deploys at once. It needs numpy. \n
+
+The AnytimePlanner class in planning.py tries candidate turns best first and keeps the best one found before GameState.deadline(), 
+so on_turn can search for as long as the turn timer allows and still submit on time. \n
+
+The EventMap class in event_map.py adds up where and in which turn each player was breached, took damage and lost units, 
+from on_action_frame or from past replays, in fixed size arrays with optional decay. It answers "where do I keep getting scored on" 
+in time proportional to the number of distinct locations. \n
+
+The BuildPlan class in build_plan.py runs a defense declared as ordered stages of spawns, upgrades, repairs and removals, 
+each with a condition and a rule for when to stop. Stages are compiled to cell ids once per game and run in one pass against your SP, 
+and describe() and diff() show how two strategies' plans differ. \n
+
+cache.py holds the AnalysisCache shared by every GameState of a game. Results in it are keyed by GameMap.structure_hash, 
+an incrementally updated hash of the structures on the board, so find_path_to_edge and your own analyses are reused across turns and forks. \n
+
+referee.py plays whole games between two algos in one process, with Simulator in place of the engine, 
+and writes replays in the engine's format. It is much faster than running matches for tuning a strategy over many games. \n
+
+protocol.py reads messages from the game engine. It sorts them by type without decoding them, and decodes each one at most once, with orjson or ujson when installed. \n
+
 util.py contains a small handful of functions that help with communication, including the debug-printing function, debug_write().
 """
 
@@ -24,6 +52,13 @@ from .util import debug_write
 from .game_state import GameState
 from .unit import GameUnit
 from .game_map import GameMap
+from .threat_map import ThreatMap
+from .shield_map import ShieldMap
+from .simulator import Simulator, SimulationResult, simulate
+from .batch_simulator import BatchSimulator, BatchResult, spawn_scenarios
+from .planning import AnytimePlanner, Deadline
+from .event_map import EventMap
+from .build_plan import BuildPlan, BuildResult
 
-__all__ = ["algocore", "game_state", "game_map", "navigation", "unit", "util"]
+__all__ = ["algocore", "batch_simulator", "build_plan", "cache", "event_map", "game_state", "game_map", "navigation", "planning", "protocol", "referee", "shield_map", "simulator", "threat_map", "unit", "util"]
  
\ No newline at end of file
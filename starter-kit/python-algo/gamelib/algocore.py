@@ -1,7 +1,110 @@
-import json
+import threading
 
 from .game_state import GameState
 from .util import get_command, debug_write, BANNER_TEXT, send_command
+from .protocol import read_message, CONFIG, TURN, ACTION_FRAME, GAME_OVER
+
+
+class PrecomputeWorker:
+    """Runs a function in a background thread on the most recent of a stream of inputs
+
+    Inputs that arrive while the function is busy replace each other, so only the newest one is worked on next.
+    The main loop of an algo spends the action phase blocked reading stdin, which leaves the thread free to run.
+    A thread cannot be interrupted, so work still running when collect gives up on it goes on competing with the
+    turn for the interpreter. The function should check stale() in its loops and return early once it is True.
+
+    Attributes :
+        * function (function): Called with each input that gets worked on, its return value is the result
+
+    """
+    def __init__(self, function):
+        """Starts the worker thread
+
+        Args:
+            function: The function to run on inputs
+
+        """
+        self.function = function
+        self.__condition = threading.Condition()
+        self.__pending = None
+        self.__has_pending = False
+        self.__busy = False
+        self.__stopped = False
+        self.__generation = 0
+        self.__running_generation = None
+        self.__result = None
+        self.__thread = threading.Thread(target=self.__run, name="precompute", daemon=True)
+        self.__thread.start()
+
+    def submit(self, item):
+        """Queues an input, replacing one that has not been started yet"""
+        with self.__condition:
+            self.__pending = item
+            self.__has_pending = True
+            self.__condition.notify_all()
+
+    def collect(self, wait_ms=0):
+        """Takes the result of the newest finished input
+
+        Waits up to wait_ms for queued and running work to finish, then drops anything not yet started.
+        Work still running after that is not reported here or by later calls, and stale() is True for it from then on.
+
+        Args:
+            wait_ms: How many milliseconds to wait for work in progress
+
+        Returns:
+            The result of the newest input worked on since the last collect, or None if there is none
+
+        """
+        with self.__condition:
+            finished = self.__condition.wait_for(lambda: not (self.__busy or self.__has_pending), wait_ms / 1000.0)
+            if not finished and self.__busy:
+                debug_write("Precompute overran its {} ms and was told to stop".format(wait_ms))
+            result = self.__result
+            self.__pending = None
+            self.__has_pending = False
+            self.__result = None
+            self.__generation += 1
+            return result
+
+    def stale(self):
+        """True when the work running on the worker thread will be thrown away, because collect or stop
+        has been called since it started. Meant to be called from the function, to stop early"""
+        return self.__stopped or self.__running_generation != self.__generation
+
+    def stop(self):
+        """Stops the worker thread once it finishes what it is running"""
+        with self.__condition:
+            self.__stopped = True
+            self.__pending = None
+            self.__has_pending = False
+            self.__condition.notify_all()
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__has_pending or self.__stopped)
+                if self.__stopped:
+                    return
+                item = self.__pending
+                generation = self.__generation
+                self.__running_generation = generation
+                self.__pending = None
+                self.__has_pending = False
+                self.__busy = True
+            try:
+                result = self.function(item)
+                failed = False
+            except Exception as error:
+                debug_write("Precompute failed: {}".format(error))
+                failed = True
+            with self.__condition:
+                self.__busy = False
+                self.__running_generation = None
+                if not failed and generation == self.__generation:
+                    self.__result = result
+                self.__condition.notify_all()
+
 
 class AlgoCore(object):
     """
@@ -10,10 +113,14 @@ class AlgoCore(object):
 
     Attributes :
         * config (JSON): json object containing information about the game
+        * precomputed: What precompute() returned for the latest action frame it finished before this turn, or None
 
     """
     def __init__(self):
         self.config = None
+        self.precomputed = None
+        self._precompute_worker = None
+        self._precompute_wait_ms = 0
 
     def on_game_start(self, config):
         """
@@ -43,6 +150,35 @@ class AlgoCore(object):
         """
         pass
 
+    def enable_precompute(self, wait_ms=100):
+        """
+        Turns on background precomputation, usually called from on_game_start. \n
+        While the engine plays out the action phase, precompute() runs in a worker thread on the newest action frame,
+        and its result is in self.precomputed when on_turn is called for the next turn.
+        When the turn arrives, up to wait_ms milliseconds are spent letting work in progress finish.
+        """
+        if self._precompute_worker is None:
+            self._precompute_worker = PrecomputeWorker(self.precompute)
+        self._precompute_wait_ms = wait_ms
+
+    def precompute(self, action_frame_game_state):
+        """
+        Runs in a background thread on action frames once enable_precompute() has been called. \n
+        Override it to start next turn's analysis early, for example with
+        gamelib.GameState(self.config, action_frame_game_state).get_threat_map().
+        Frames that arrive while it is running are skipped, and only the newest is passed in next.
+        It should not send commands or change anything on_turn is using.
+        Long running work should check precompute_expired() as it goes and return once it is True,
+        so that it does not slow down the on_turn it was meant to speed up.
+        """
+        return None
+
+    def precompute_expired(self):
+        """
+        True once the turn precompute() is working towards has started, or the game has ended, so its result will not be used.
+        Only meaningful when called from precompute().
+        """
+        return self._precompute_worker is None or self._precompute_worker.stale()
 
     def start(self):
         """ 
@@ -56,38 +192,39 @@ class AlgoCore(object):
         while True:
             # Note: Python blocks and hangs on stdin. Can cause issues if connections aren't setup properly and may need to
             # manually kill this Python program.
-            game_state_string = get_command()
-            if "replaySave" in game_state_string:
+            # Messages are classified without decoding them. A turn is decoded once, by GameState, and an action
+            # frame only if on_action_frame or precompute reads it.
+            game_state_string = read_message(get_command())
+            stateType = game_state_string.state_type
+            if stateType == CONFIG:
                 """
                 This means this must be the config file. So, load in the config file as a json and add it to your AlgoStrategy class.
                 """
-                parsed_config = json.loads(game_state_string)
+                parsed_config = game_state_string.data
                 self.on_game_start(parsed_config)
-            elif "turnInfo" in game_state_string:
-                state = json.loads(game_state_string)
-                stateType = int(state.get("turnInfo")[0])
-                if stateType == 0:
-                    """
-                    This is the game turn game state message. Algo must now print to stdout 2 lines, one for build phase one for
-                    deploy phase. Printing is handled by the provided functions.
-                    """
-                    self.on_turn(game_state_string)
-                elif stateType == 1:
-                    """
-                    If stateType == 1, this game_state_string string represents a single frame of an action phase
-                    """
-                    self.on_action_frame(game_state_string)
-                elif stateType == 2:
-                    """
-                    This is the end game message. This means the game is over so break and finish the program.
-                    """
-                    debug_write("Got end state, game over. Stopping algo.")
-                    break
-                else:
-                    """
-                    Something is wrong? Received an incorrect or improperly formatted string.
-                    """
-                    debug_write("Got unexpected string with turnInfo: {}".format(game_state_string))
+            elif stateType == TURN:
+                """
+                This is the game turn game state message. Algo must now print to stdout 2 lines, one for build phase one for
+                deploy phase. Printing is handled by the provided functions.
+                """
+                if self._precompute_worker is not None:
+                    self.precomputed = self._precompute_worker.collect(self._precompute_wait_ms)
+                self.on_turn(game_state_string)
+            elif stateType == ACTION_FRAME:
+                """
+                If stateType == 1, this game_state_string string represents a single frame of an action phase
+                """
+                self.on_action_frame(game_state_string)
+                if self._precompute_worker is not None:
+                    self._precompute_worker.submit(game_state_string)
+            elif stateType == GAME_OVER:
+                """
+                This is the end game message. This means the game is over so break and finish the program.
+                """
+                debug_write("Got end state, game over. Stopping algo.")
+                if self._precompute_worker is not None:
+                    self._precompute_worker.stop()
+                break
             else:
                 """
                 Something is wrong? Received an incorrect or improperly formatted string.
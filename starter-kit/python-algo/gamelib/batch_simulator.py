@@ -0,0 +1,543 @@
+from .game_state import is_stationary
+from .navigation import PathField, ShortestPathFinder
+from .simulator import Simulator, unit_stats
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Outcome codes of the mobile unit slots
+_ACTIVE = 0
+_BREACHED = 1
+_SELF_DESTRUCTED = 2
+_DESTROYED = 3
+_EMPTY = 4
+_HALTED = 5
+
+# Marks next step table entries that have not been computed yet
+_UNKNOWN = -2
+
+
+class BatchResult:
+    """The outcome of every scenario of a BatchSimulator, as NumPy arrays indexed by scenario
+
+    Attributes :
+        * frames (ndarray): The number of frames each scenario's action phase lasted
+        * health_delta (ndarray): An (N, 2) array of the change in health of player 0 and player 1
+        * sp_delta (ndarray): An (N, 2) array of the SP each player earned from breaches
+        * breaches (ndarray): An (N, 2) array of how many of each player's units breached
+        * damage_dealt (ndarray): An (N, 2) array of the damage each player's mobile units dealt
+        * structures_destroyed (ndarray): An (N, 2) array of how many of each player's structures were destroyed
+        * mobile_outcomes (ndarray): An (N, U) array of "breached", "self_destructed", "destroyed" or None for every mobile unit slot.
+          Slots follow Simulator.mobile_units, then the scenario's units in the order they were given
+        * game_over (ndarray): True for the scenarios where a player's health reached 0, ending the action phase early
+
+    """
+    def __init__(self, frames, health_delta, sp_delta, breaches, damage_dealt, structures_destroyed, mobile_outcomes, game_over):
+        self.frames = frames
+        self.health_delta = health_delta
+        self.sp_delta = sp_delta
+        self.breaches = breaches
+        self.damage_dealt = damage_dealt
+        self.structures_destroyed = structures_destroyed
+        self.mobile_outcomes = mobile_outcomes
+        self.game_over = game_over
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __repr__(self):
+        return "BatchResult(scenarios={})".format(len(self))
+
+
+class BatchSimulator:
+    """Plays out many variations of one action phase at once
+
+    Every scenario starts from the same GameState, the same board a Simulator would copy, and then adds
+    its own units. Scenario entries are (unit_type, location), (unit_type, location, player_index) or
+    (unit_type, location, player_index, num) tuples. Structures are placed on empty tiles and act after the
+    existing ones, mobile units are deployed after the existing ones, in the order given.
+
+    Units are stored in NumPy arrays with one row per scenario and every frame is advanced for all
+    scenarios together, so the Python work per frame depends on the number of unit slots rather than the
+    number of scenarios. The rules are the same as Simulator's and each scenario ends up exactly where a
+    Simulator given the same units would.
+
+    Requires NumPy.
+
+    Attributes :
+        * game_state (:obj: GameState): The game state every scenario starts from
+        * scenarios (list): The scenario entries, as given
+        * frame (int): The number of frames simulated so far
+        * frames (ndarray): The number of frames each scenario has lasted so far
+        * game_over (ndarray): True for the scenarios that ended because a player's health reached 0
+        * health_delta, sp_delta, breaches, structures_destroyed (ndarray): Running (N, 2) totals, see BatchResult
+        * s_cell, s_owner, s_alive, s_health (ndarray): (N, structure slots) arrays of the structures' cell ids, owners, whether they still stand and their health
+        * m_cell, m_owner, m_health (ndarray): (N, mobile slots) arrays of the mobile units' cell ids, owners and health
+
+    """
+    def __init__(self, game_state, scenarios):
+        """Lays out the unit arrays for a list of scenarios
+
+        Args:
+            game_state: The GameState to simulate. It is not modified.
+            scenarios: A list of scenarios, each a list of entries as described above
+
+        """
+        if np is None:
+            raise ImportError("BatchSimulator requires numpy")
+        self.game_state = game_state
+        self.scenarios = [list(scenario) for scenario in scenarios]
+        self.frame = 0
+
+        config = game_state.config
+        self.__unit_information = config["unitInformation"]
+        self.__type_index = dict((unit_info.get("shorthand"), index) for index, unit_info in enumerate(self.__unit_information))
+        self.__stats = [(unit_stats(self.__unit_information, index, False), unit_stats(self.__unit_information, index, True)) for index in range(len(self.__unit_information))]
+        self.__breach_reward = config.get("resources", {}).get("coresForPlayerDamage", 1.0)
+
+        geometry = game_state.game_map.geometry
+        self.__geometry = geometry
+        size = geometry.arena_size
+        self.__x_of = np.array([xy[0] for xy in geometry.xy], dtype=np.int64)
+        self.__y_of = np.array([xy[1] for xy in geometry.xy], dtype=np.int64)
+        self.__on_edge = np.zeros((len(geometry.edges), size * size), dtype=bool)
+        for edge, cells in enumerate(geometry.edge_cells):
+            self.__on_edge[edge, list(cells)] = True
+        self.__half = geometry.half_arena - 0.5
+        self.__fields = []
+        self.__table_index = {}
+        self.__next = np.zeros((0, size * size * 3), dtype=np.int64)
+
+        base = Simulator(game_state)
+        self.__layout(base)
+
+    def __scenario_units(self, scenario):
+        """Splits a scenario into the structures and mobile units it adds"""
+        structures = []
+        mobiles = []
+        for entry in scenario:
+            unit_type, location = entry[0], entry[1]
+            player_index = entry[2] if len(entry) > 2 else 0
+            num = entry[3] if len(entry) > 3 else 1
+            type_index = self.__type_index[unit_type]
+            x, y = int(location[0]), int(location[1])
+            if not self.__geometry.contains([x, y]):
+                self.game_state.warn("Could not add {} at {}, it is outside the arena".format(unit_type, location))
+                continue
+            if is_stationary(unit_type):
+                structures.append((type_index, x, y, player_index))
+            else:
+                mobiles.extend([(type_index, x, y, player_index)] * num)
+        return structures, mobiles
+
+    def __layout(self, base):
+        count = len(self.scenarios)
+        split = [self.__scenario_units(scenario) for scenario in self.scenarios]
+        base_structures = base.structures
+        base_mobiles = base.mobile_units
+        structure_slots = len(base_structures) + max([len(structures) for structures, _ in split] + [0])
+        mobile_slots = len(base_mobiles) + max([len(mobiles) for _, mobiles in split] + [0])
+        self.__structure_slots = structure_slots
+        self.__mobile_slots = mobile_slots
+
+        # Structures
+        self.s_cell = np.zeros((count, structure_slots), dtype=np.int64)
+        self.s_owner = np.zeros((count, structure_slots), dtype=np.int64)
+        self.s_alive = np.zeros((count, structure_slots), dtype=bool)
+        self.s_health = np.zeros((count, structure_slots))
+        self.s_range = np.zeros((count, structure_slots))
+        self.s_damage_i = np.zeros((count, structure_slots))
+        self.s_damage_f = np.zeros((count, structure_slots))
+        self.s_shield_range_squared = np.full((count, structure_slots), -1.0)
+        self.s_shield = np.zeros((count, structure_slots))
+        # Mobile units
+        self.m_cell = np.zeros((count, mobile_slots), dtype=np.int64)
+        self.m_owner = np.zeros((count, mobile_slots), dtype=np.int64)
+        self.m_outcome = np.full((count, mobile_slots), _EMPTY, dtype=np.int64)
+        self.m_outcome_frame = np.full((count, mobile_slots), -1, dtype=np.int64)
+        self.m_health = np.zeros((count, mobile_slots))
+        self.m_speed = np.zeros((count, mobile_slots))
+        self.m_progress = np.zeros((count, mobile_slots))
+        self.m_direction = np.zeros((count, mobile_slots), dtype=np.int64)
+        self.m_edge = np.zeros((count, mobile_slots), dtype=np.int64)
+        self.m_steps = np.zeros((count, mobile_slots), dtype=np.int64)
+        self.m_range = np.zeros((count, mobile_slots))
+        self.m_range_squared = np.zeros((count, mobile_slots))
+        self.m_damage_i = np.zeros((count, mobile_slots))
+        self.m_damage_f = np.zeros((count, mobile_slots))
+        self.m_breach_damage = np.zeros((count, mobile_slots))
+        self.m_self_destruct_range_squared = np.zeros((count, mobile_slots))
+        self.m_self_destruct_i = np.zeros((count, mobile_slots))
+        self.m_self_destruct_f = np.zeros((count, mobile_slots))
+        self.m_self_destruct_steps = np.zeros((count, mobile_slots), dtype=np.int64)
+        self.m_damage_dealt = np.zeros((count, mobile_slots))
+        self.m_shielded = np.zeros((count, mobile_slots, structure_slots), dtype=bool)
+
+        self.health_delta = np.zeros((count, 2))
+        self.sp_delta = np.zeros((count, 2))
+        self.breaches = np.zeros((count, 2), dtype=np.int64)
+        self.structures_destroyed = np.zeros((count, 2), dtype=np.int64)
+        self.frames = np.zeros(count, dtype=np.int64)
+        self.game_over = np.zeros(count, dtype=bool)
+        self.__start_health = np.array([self.game_state.my_health, self.game_state.enemy_health])
+
+        base_blocked = bytearray(len(self.__geometry.in_bounds))
+        for unit in base_structures:
+            base_blocked[unit.cell] = 1
+        self.__blocked = []
+        self.__tables = np.zeros((count, len(self.__geometry.edges)), dtype=np.int64)
+
+        # The board every scenario shares is written to all rows at once
+        for slot, unit in enumerate(base_structures):
+            self.__set_structure(slice(None), slot, unit.cell, unit.player_index, unit.health, unit._stats)
+        for slot, unit in enumerate(base_mobiles):
+            self.__set_mobile(slice(None), slot, unit.cell, unit.player_index, unit.health, unit._stats, unit._target_edge)
+
+        for scenario, (structures, mobiles) in enumerate(split):
+            slot = len(base_structures)
+            blocked = bytearray(base_blocked)
+            for type_index, x, y, player_index in structures:
+                cell = self.__geometry.cell_id([x, y])
+                if blocked[cell]:
+                    self.game_state.warn("Could not place {} at {}, the tile is taken".format(self.__unit_information[type_index].get("shorthand"), [x, y]))
+                    continue
+                stats = self.__stats[type_index][0]
+                self.__set_structure(scenario, slot, cell, player_index, stats["start_health"], stats)
+                blocked[cell] = 1
+                slot += 1
+            self.__blocked.append(blocked)
+            self.__update_tables(scenario)
+
+            slot = len(base_mobiles)
+            for type_index, x, y, player_index in mobiles:
+                stats = self.__stats[type_index][0]
+                self.__set_mobile(scenario, slot, self.__geometry.cell_id([x, y]), player_index, stats["start_health"], stats, self.game_state.get_target_edge([x, y]))
+                slot += 1
+
+        # Walls never shield or attack, so the frame loop only looks at these columns
+        self.__support_slots = np.nonzero((self.s_shield_range_squared > 0).any(axis=0))[0]
+        self.__attacker_slots = np.nonzero(((self.s_damage_i > 0) | (self.s_damage_f > 0)).any(axis=0))[0]
+
+    def __set_structure(self, scenario, slot, cell, player_index, health, stats):
+        self.s_cell[scenario, slot] = cell
+        self.s_owner[scenario, slot] = player_index
+        self.s_alive[scenario, slot] = True
+        self.s_health[scenario, slot] = health
+        self.s_range[scenario, slot] = stats["attack_range"]
+        self.s_damage_i[scenario, slot] = stats["damage_i"]
+        self.s_damage_f[scenario, slot] = stats["damage_f"]
+        if stats["shield_range_squared"] > 0:
+            y = self.__geometry.xy[cell][1]
+            rows_forward = y if player_index == 0 else self.__geometry.arena_size - 1 - y
+            amount = stats["shield_per_unit"] + stats["shield_bonus_per_y"] * rows_forward
+            if amount > 0:
+                self.s_shield_range_squared[scenario, slot] = stats["shield_range_squared"]
+                self.s_shield[scenario, slot] = amount
+
+    def __set_mobile(self, scenario, slot, cell, player_index, health, stats, target_edge):
+        self.m_cell[scenario, slot] = cell
+        self.m_owner[scenario, slot] = player_index
+        self.m_outcome[scenario, slot] = _ACTIVE
+        self.m_health[scenario, slot] = health
+        self.m_speed[scenario, slot] = stats["speed"]
+        self.m_edge[scenario, slot] = target_edge
+        self.m_range[scenario, slot] = stats["attack_range"]
+        self.m_range_squared[scenario, slot] = stats["attack_range_squared"]
+        self.m_damage_i[scenario, slot] = stats["damage_i"]
+        self.m_damage_f[scenario, slot] = stats["damage_f"]
+        self.m_breach_damage[scenario, slot] = stats["breach_damage"]
+        self.m_self_destruct_range_squared[scenario, slot] = stats["self_destruct_range_squared"]
+        self.m_self_destruct_i[scenario, slot] = stats["self_destruct_damage_i"]
+        self.m_self_destruct_f[scenario, slot] = stats["self_destruct_damage_f"]
+        self.m_self_destruct_steps[scenario, slot] = stats["self_destruct_steps"]
+
+    def __update_tables(self, scenario):
+        """Points a scenario at the next step tables for its current board, adding tables for boards not seen before"""
+        blocked = bytes(self.__blocked[scenario])
+        for edge, end_points in enumerate(self.__geometry.edges):
+            key = (blocked, edge)
+            index = self.__table_index.get(key)
+            if index is None:
+                index = len(self.__fields)
+                self.__fields.append(PathField(self.__geometry, blocked, end_points))
+                self.__table_index[key] = index
+                table = np.full((1, self.__next.shape[1]), _UNKNOWN, dtype=np.int64)
+                self.__next = np.concatenate((self.__next, table))
+            self.__tables[scenario, edge] = index
+
+    def __next_cells(self, tables, cells, directions):
+        """Looks up the next step of many units, filling in table entries the first time they are needed"""
+        columns = cells * 3 + directions
+        result = self.__next[tables, columns]
+        missing = result == _UNKNOWN
+        if missing.any():
+            for table, column in set(zip(tables[missing].tolist(), columns[missing].tolist())):
+                self.__next[table, column] = self.__fields[table].next_step(column // 3, column % 3)
+            result[missing] = self.__next[tables[missing], columns[missing]]
+        return result
+
+    def run(self, max_frames=None):
+        """Simulates frames until every scenario is out of mobile units
+
+        Args:
+            max_frames: Stop after this many frames even if units remain, Simulator.MAX_FRAMES if None
+
+        Returns:
+            A BatchResult
+
+        """
+        limit = Simulator.MAX_FRAMES if max_frames is None else max_frames
+        while self.frame < limit and self.step():
+            pass
+        return self.result()
+
+    def result(self):
+        """Summarizes the scenarios as they stand, see BatchResult"""
+        damage_dealt = np.zeros((len(self.scenarios), 2))
+        for player_index in (0, 1):
+            damage_dealt[:, player_index] = (self.m_damage_dealt * (self.m_owner == player_index) * (self.m_outcome != _EMPTY)).sum(axis=1)
+        names = np.array([None, "breached", "self_destructed", "destroyed", None, None], dtype=object)
+        return BatchResult(self.frames.copy(), self.health_delta.copy(), self.sp_delta.copy(), self.breaches.copy(),
+                           damage_dealt, self.structures_destroyed.copy(), names[self.m_outcome], self.game_over.copy())
+
+    def step(self):
+        """Simulates a single frame of every scenario that still has mobile units
+
+        Returns:
+            True if any scenario still has mobile units afterwards
+
+        """
+        running = (self.m_outcome == _ACTIVE).any(axis=1)
+        if not running.any():
+            return False
+        self.frames += running
+        self.__move()
+        self.__shield()
+        self.__attack()
+        self.__remove_dead()
+        self.frame += 1
+        # The game ends with the frame that takes a player's health to 0, leaving the remaining units where they stand
+        over = running & ((self.__start_health + self.health_delta) <= 0).any(axis=1)
+        if over.any():
+            self.game_over |= over
+            halted = over[:, None] & (self.m_outcome == _ACTIVE)
+            self.m_outcome[halted] = _HALTED
+        return bool((self.m_outcome == _ACTIVE).any())
+
+    def __move(self):
+        x_of = self.__x_of
+        active = self.m_outcome == _ACTIVE
+        self.m_progress[active] += self.m_speed[active]
+        rows, slots = np.nonzero(active & (self.m_progress >= 1 - 1e-9))
+        if not len(rows):
+            return
+        self.m_progress[rows, slots] -= 1
+        start_cells = self.m_cell.copy()
+        cells = start_cells[rows, slots]
+        edges = self.m_edge[rows, slots]
+        next_cells = self.__next_cells(self.__tables[rows, edges], cells, self.m_direction[rows, slots])
+
+        moved = next_cells != cells
+        vertical = x_of[next_cells[moved]] == x_of[cells[moved]]
+        self.m_direction[rows[moved], slots[moved]] = np.where(vertical, ShortestPathFinder.VERTICAL, ShortestPathFinder.HORIZONTAL)
+        self.m_cell[rows[moved], slots[moved]] = next_cells[moved]
+        self.m_steps[rows[moved], slots[moved]] += 1
+
+        on_edge = self.__on_edge[edges, cells]
+        breached = ~moved & on_edge
+        if breached.any():
+            breached_rows, breached_slots = rows[breached], slots[breached]
+            owners = self.m_owner[breached_rows, breached_slots]
+            damage = self.m_breach_damage[breached_rows, breached_slots]
+            np.add.at(self.health_delta, (breached_rows, 1 - owners), -damage)
+            np.add.at(self.sp_delta, (breached_rows, owners), damage * self.__breach_reward)
+            np.add.at(self.breaches, (breached_rows, owners), 1)
+            self.m_outcome[breached_rows, breached_slots] = _BREACHED
+            self.m_outcome_frame[breached_rows, breached_slots] = self.frame
+        destructed = ~moved & ~on_edge
+        if destructed.any():
+            destructed_rows, destructed_slots = rows[destructed], slots[destructed]
+            self.m_outcome[destructed_rows, destructed_slots] = _SELF_DESTRUCTED
+            self.m_outcome_frame[destructed_rows, destructed_slots] = self.frame
+            exploding = self.m_steps[destructed_rows, destructed_slots] >= self.m_self_destruct_steps[destructed_rows, destructed_slots]
+            # Units move one at a time, so an explosion sees the units before it where they moved to and the units after it where they started
+            for slot in np.unique(destructed_slots[exploding]):
+                self.__self_destruct(destructed_rows[exploding & (destructed_slots == slot)], slot, active, start_cells)
+
+    def __self_destruct(self, scenarios, slot, start_active, start_cells):
+        x_of, y_of = self.__x_of, self.__y_of
+        cells = self.m_cell[scenarios, slot]
+        x, y = x_of[cells][:, None], y_of[cells][:, None]
+        enemy = (1 - self.m_owner[scenarios, slot])[:, None]
+        range_squared = self.m_self_destruct_range_squared[scenarios, slot][:, None]
+
+        before = np.arange(self.__mobile_slots) < slot
+        other_cells = np.where(before, self.m_cell[scenarios], start_cells[scenarios])
+        other_active = np.where(before, self.m_outcome[scenarios] == _ACTIVE, start_active[scenarios])
+        hit = (other_active & (self.m_owner[scenarios] == enemy)
+               & ((x_of[other_cells] - x) ** 2 + (y_of[other_cells] - y) ** 2 <= range_squared))
+        damage_i = self.m_self_destruct_i[scenarios, slot]
+        self.m_health[scenarios] -= hit * damage_i[:, None]
+
+        structure_cells = self.s_cell[scenarios]
+        hit_structures = (self.s_alive[scenarios] & (self.s_owner[scenarios] == enemy)
+                          & (np.sqrt((x_of[structure_cells] - x) ** 2 + (y_of[structure_cells] - y) ** 2) <= np.sqrt(range_squared)))
+        damage_f = self.m_self_destruct_f[scenarios, slot]
+        self.s_health[scenarios] -= hit_structures * damage_f[:, None]
+        self.m_damage_dealt[scenarios, slot] += hit.sum(axis=1) * damage_i + hit_structures.sum(axis=1) * damage_f
+
+    def __shield(self):
+        slots = self.__support_slots
+        if not len(slots):
+            return
+        supports = self.s_alive[:, slots]
+        mobiles = np.nonzero((self.m_outcome == _ACTIVE).any(axis=0))[0]
+        if not supports.any() or not len(mobiles):
+            return
+        x_of, y_of = self.__x_of, self.__y_of
+        mobile_cells = self.m_cell[:, mobiles]
+        support_cells = self.s_cell[:, slots]
+        # (N, supports, mobile units) of every support that has a unit to shield this frame
+        new = (supports[:, :, None] & (self.m_outcome[:, mobiles] == _ACTIVE)[:, None, :]
+               & (self.s_owner[:, slots][:, :, None] == self.m_owner[:, mobiles][:, None, :])
+               & ((x_of[support_cells][:, :, None] - x_of[mobile_cells][:, None, :]) ** 2 + (y_of[support_cells][:, :, None] - y_of[mobile_cells][:, None, :]) ** 2
+                  <= self.s_shield_range_squared[:, slots][:, :, None])
+               & ~self.m_shielded[:, mobiles][:, :, slots].transpose(0, 2, 1))
+        # Added one support at a time, like the engine, so the totals round the same way
+        for index in np.nonzero(new.any(axis=(0, 2)))[0]:
+            slot = slots[index]
+            shielded = np.zeros(self.m_outcome.shape, dtype=bool)
+            shielded[:, mobiles] = new[:, index, :]
+            self.m_shielded[:, :, slot] |= shielded
+            self.m_health += shielded * self.s_shield[:, slot][:, None]
+
+    def __attack(self):
+        x_of, y_of = self.__x_of, self.__y_of
+        mobiles = np.nonzero((self.m_outcome == _ACTIVE).any(axis=0))[0]
+        targets = (self.m_outcome[:, mobiles] == _ACTIVE) & (self.m_health[:, mobiles] > 0)
+        mobile_cells = self.m_cell[:, mobiles]
+        mobile_x, mobile_y = x_of[mobile_cells], y_of[mobile_cells]
+        mobile_owner = self.m_owner[:, mobiles]
+
+        # Attackers with nothing in range are skipped, which leaves most structures idle most frames
+        slots = self.__attacker_slots
+        if len(slots):
+            structure_cells = self.s_cell[:, slots]
+            in_reach = (((x_of[structure_cells][:, :, None] - mobile_x[:, None, :]) ** 2 + (y_of[structure_cells][:, :, None] - mobile_y[:, None, :]) ** 2
+                         <= (self.s_range[:, slots] ** 2)[:, :, None])
+                        & targets[:, None, :] & (self.s_owner[:, slots][:, :, None] != mobile_owner[:, None, :])).any(axis=2)
+            ready = self.s_alive[:, slots] & (((self.s_damage_i[:, slots] > 0) & in_reach) | (self.s_damage_f[:, slots] > 0))
+            for index in np.nonzero(ready.any(axis=0))[0]:
+                slot = slots[index]
+                attackers = np.nonzero(ready[:, index])[0]
+                self.__attack_with(attackers, self.s_cell[attackers, slot], self.s_owner[attackers, slot], self.s_range[attackers, slot] ** 2, self.s_range[attackers, slot],
+                                   self.s_damage_i[attackers, slot], self.s_damage_f[attackers, slot], None)
+
+        # Units that self destructed this frame get one last attack
+        can_attack = (self.m_outcome == _ACTIVE) | ((self.m_outcome == _SELF_DESTRUCTED) & (self.m_outcome_frame == self.frame))
+        slots = np.nonzero(can_attack.any(axis=0))[0]
+        if not len(slots):
+            return
+        attacker_cells = self.m_cell[:, slots]
+        attacker_x, attacker_y = x_of[attacker_cells][:, :, None], y_of[attacker_cells][:, :, None]
+        range_squared = self.m_range_squared[:, slots][:, :, None]
+        attacker_owner = self.m_owner[:, slots][:, :, None]
+        reach_mobile = (((attacker_x - mobile_x[:, None, :]) ** 2 + (attacker_y - mobile_y[:, None, :]) ** 2 <= range_squared)
+                        & targets[:, None, :] & (attacker_owner != mobile_owner[:, None, :])).any(axis=2)
+        structure_cells = self.s_cell
+        reach_structure = (((attacker_x - x_of[structure_cells][:, None, :]) ** 2 + (attacker_y - y_of[structure_cells][:, None, :]) ** 2 <= range_squared)
+                           & self.s_alive[:, None, :] & (attacker_owner != self.s_owner[:, None, :])).any(axis=2)
+        ready = can_attack[:, slots] & (((self.m_damage_i[:, slots] > 0) & reach_mobile) | ((self.m_damage_f[:, slots] > 0) & reach_structure))
+        for index in np.nonzero(ready.any(axis=0))[0]:
+            slot = slots[index]
+            attackers = np.nonzero(ready[:, index])[0]
+            self.__attack_with(attackers, self.m_cell[attackers, slot], self.m_owner[attackers, slot], self.m_range_squared[attackers, slot], self.m_range[attackers, slot],
+                               self.m_damage_i[attackers, slot], self.m_damage_f[attackers, slot], slot)
+
+    def __pick(self, candidates, distance, health, y, x, ordered):
+        """Narrows each row of candidates down to the target GameState.get_target would pick, see Simulator.get_target.
+        Returns the chosen column of every row and whether the row had any candidate"""
+        if candidates.shape[1] == 0:
+            # Nothing of this kind is on the board, for example no structures at all
+            return np.zeros(len(candidates), dtype=np.int64), np.zeros(len(candidates), dtype=bool)
+        y_sign = np.where(ordered, 1, -1)[:, None]
+        for key in (distance, health, y * y_sign, -np.abs(self.__half - x)):
+            keyed = np.where(candidates, key, np.inf)
+            candidates = candidates & (keyed == keyed.min(axis=1)[:, None])
+        found = candidates.any(axis=1)
+        # The most recently created unit wins the final tie
+        columns = candidates.shape[1] - 1 - np.argmax(candidates[:, ::-1], axis=1)
+        return columns, found
+
+    def __attack_with(self, scenarios, cells, owners, range_squared, attack_range, damage_i, damage_f, mobile_slot):
+        x_of, y_of = self.__x_of, self.__y_of
+        x, y = x_of[cells][:, None], y_of[cells][:, None]
+        enemy = (1 - owners)[:, None]
+        ordered = owners == 0
+        chosen = np.full(len(scenarios), -1, dtype=np.int64)
+
+        hits_mobile = damage_i > 0
+        if hits_mobile.any():
+            target_cells = self.m_cell[scenarios]
+            target_x, target_y = x_of[target_cells], y_of[target_cells]
+            distance = (target_x - x) ** 2 + (target_y - y) ** 2
+            health = self.m_health[scenarios]
+            candidates = (hits_mobile[:, None] & (self.m_outcome[scenarios] == _ACTIVE) & (self.m_owner[scenarios] == enemy)
+                          & (health > 0) & (distance <= range_squared[:, None]))
+            columns, found = self.__pick(candidates, distance, health, target_y, target_x, ordered)
+            rows = scenarios[found]
+            if len(rows):
+                self.m_health[rows, columns[found]] -= damage_i[found]
+                if mobile_slot is not None:
+                    self.m_damage_dealt[rows, mobile_slot] += damage_i[found]
+            chosen[found] = columns[found]
+
+        hits_structure = (damage_f > 0) & (chosen < 0)
+        if hits_structure.any():
+            target_cells = self.s_cell[scenarios]
+            target_x, target_y = x_of[target_cells], y_of[target_cells]
+            distance = (target_x - x) ** 2 + (target_y - y) ** 2
+            health = self.s_health[scenarios]
+            candidates = (hits_structure[:, None] & self.s_alive[scenarios] & (self.s_owner[scenarios] == enemy)
+                          & (health > 0) & (np.sqrt(distance) <= attack_range[:, None]))
+            columns, found = self.__pick(candidates, distance, health, target_y, target_x, ordered)
+            rows = scenarios[found]
+            if len(rows):
+                self.s_health[rows, columns[found]] -= damage_f[found]
+                if mobile_slot is not None:
+                    self.m_damage_dealt[rows, mobile_slot] += damage_f[found]
+
+    def __remove_dead(self):
+        dying = (self.m_outcome == _ACTIVE) & (self.m_health <= 0)
+        self.m_outcome[dying] = _DESTROYED
+        self.m_outcome_frame[dying] = self.frame
+
+        falling = self.s_alive & (self.s_health <= 0)
+        if not falling.any():
+            return
+        self.s_alive[falling] = False
+        for player_index in (0, 1):
+            self.structures_destroyed[:, player_index] += (falling & (self.s_owner == player_index)).sum(axis=1)
+        for scenario in np.nonzero(falling.any(axis=1))[0]:
+            blocked = self.__blocked[scenario]
+            for cell in self.s_cell[scenario, falling[scenario]]:
+                blocked[cell] = 0
+            self.__update_tables(scenario)
+
+
+def spawn_scenarios(unit_type, locations, num=1, player_index=0):
+    """Builds one BatchSimulator scenario per location, each deploying num units there
+
+    Args:
+        unit_type: The type of mobile unit to deploy
+        locations: A list of [x, y] deploy locations
+        num: How many units each scenario deploys
+        player_index: The player deploying them
+
+    Returns:
+        A list of scenarios for BatchSimulator
+
+    """
+    return [[(unit_type, location, player_index, num)] for location in locations]
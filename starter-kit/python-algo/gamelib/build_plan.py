@@ -0,0 +1,353 @@
+import difflib
+from array import array
+from collections import namedtuple
+
+from .geometry import ARENA_SIZE
+from .unit import get_unit_stats
+
+SPAWN = "spawn"
+UPGRADE = "upgrade"
+BUILD = "build"
+REMOVE = "remove"
+
+INCOMPLETE = "incomplete"
+BUILT = "built"
+IDLE = "idle"
+NEVER = "never"
+
+Stage = namedtuple("Stage", ["kind", "unit_type", "locations", "repair", "when", "stop", "name"])
+Stage.__doc__ = """One step of a BuildPlan, as it was declared. stop is None for stages that use the plan's stop"""
+
+
+def after_turn(turn):
+    """A stage condition that holds on every turn after this one"""
+    return _turn_condition(lambda number: number > turn, "turn > {}".format(turn))
+
+
+def before_turn(turn):
+    """A stage condition that holds on every turn before this one"""
+    return _turn_condition(lambda number: number < turn, "turn < {}".format(turn))
+
+
+def at_turn(turn):
+    """A stage condition that holds on this turn only"""
+    return _turn_condition(lambda number: number == turn, "turn == {}".format(turn))
+
+
+def between_turns(first, last):
+    """A stage condition that holds from turn first to turn last, both included"""
+    return _turn_condition(lambda number: first <= number <= last, "turns {} to {}".format(first, last))
+
+
+def _turn_condition(test, name):
+    def condition(game_state):
+        return test(game_state.turn_number)
+    condition.__name__ = name
+    return condition
+
+
+class BuildResult:
+    """What one BuildPlan.execute call did
+
+    Attributes :
+        * spawned (list): The [x, y] locations structures were spawned on, in order
+        * upgraded (list): The [x, y] locations structures were upgraded on, in order
+        * removed (list): The [x, y] locations structures were flagged for removal on, in order, repairs included
+        * completed (bool): True if every stage whose condition held was run and left nothing to do
+        * stopped_at (int): The index of the stage the plan stopped after, None if it ran to the end
+
+    """
+    def __init__(self):
+        self.spawned = []
+        self.upgraded = []
+        self.removed = []
+        self.completed = True
+        self.stopped_at = None
+
+    def __repr__(self):
+        return "BuildResult(spawned={}, upgraded={}, removed={}, completed={})".format(
+            len(self.spawned), len(self.upgraded), len(self.removed), self.completed)
+
+
+class BuildPlan:
+    """An ordered list of build stages that a strategy declares once and runs every turn
+
+    A stage spawns structures, upgrades them, builds them (spawns and upgrades one location at a time,
+    moving to the next only once the last one is upgraded) or removes them, on a list of locations. Spawning
+    and building stages can also repair: remove their structures that are below a share of their max health,
+    so they are spawned again fresh once removal has happened.
+
+    Locations are turned into cell id arrays once per game config by compile. execute then goes over
+    the stages in order in one pass, reading the GameMap's structure arrays to skip what is already
+    there and comparing costs against the SP left before calling attempt_spawn, attempt_upgrade or attempt_remove.
+
+    After each stage, its stop rule decides whether the plan goes on:
+        * INCOMPLETE: stop if the stage left something unbuilt, so later stages wait for earlier ones
+        * BUILT: stop if the stage spawned, upgraded or removed anything
+        * IDLE: stop if the stage did nothing
+        * NEVER: always go on
+    A stage that spends SP is not started once there is no SP left, and counts as having left everything unbuilt.
+    Stages with a when condition that does not hold on the turn are skipped and do not count at all.
+
+    describe() lists the stages as text, and diff() compares two plans line by line, so strategies can be told apart at a glance.
+
+    Attributes :
+        * stop (str): The stop rule of stages that do not have their own
+        * stages (list): The Stage of every step, in order
+
+    """
+    def __init__(self, stop=INCOMPLETE):
+        """Makes an empty BuildPlan
+
+        Args:
+            stop: The stop rule of stages that do not have their own, INCOMPLETE, BUILT, IDLE or NEVER
+
+        """
+        self.stop = stop
+        self.stages = []
+        self.__compiled_for = None
+        self.__compiled = []
+        self.__upgrade_costs = []
+        self.__max_health = []
+
+    def spawn(self, unit_type, locations, repair=None, when=None, stop=None, name=None):
+        """Adds a stage that spawns a structure on each location that has none
+
+        The stage is complete once every location holds a structure of this type.
+
+        Args:
+            unit_type: The structure to spawn
+            locations: A list of [x, y] locations, spawned in this order
+            repair: If given, first remove structures on these locations whose health is below this share of their max health
+            when: If given, a function of the GameState, the stage only runs on turns it returns True
+            stop: The stage's stop rule, the plan's if None
+            name: A name to describe the stage by
+
+        Returns:
+            The plan, so stages can be chained
+
+        """
+        return self.__add(SPAWN, unit_type, locations, repair, when, stop, name)
+
+    def upgrade(self, locations, when=None, stop=None, name=None):
+        """Adds a stage that upgrades whatever structure is on each location
+
+        The stage is complete once every location holds an upgraded structure. Arguments are as for spawn.
+        """
+        return self.__add(UPGRADE, None, locations, None, when, stop, name)
+
+    def build(self, unit_type, locations, repair=None, when=None, stop=None, name=None):
+        """Adds a stage that spawns and upgrades a structure on each location in turn
+
+        The stage moves on to the next location only once the structure on the current one is upgraded,
+        and is complete once every location holds an upgraded structure of this type. Arguments are as for spawn.
+        """
+        return self.__add(BUILD, unit_type, locations, repair, when, stop, name)
+
+    def remove(self, locations, when=None, stop=None, name=None):
+        """Adds a stage that removes your structures on the locations
+
+        The stage costs nothing, so it runs even without SP. Arguments are as for spawn.
+        """
+        return self.__add(REMOVE, None, locations, None, when, stop, name)
+
+    def __add(self, kind, unit_type, locations, repair, when, stop, name):
+        if locations and type(locations[0]) == int:
+            locations = [locations]
+        locations = [[int(location[0]), int(location[1])] for location in locations]
+        self.stages.append(Stage(kind, unit_type, locations, repair, when, stop, name))
+        self.__compiled_for = None
+        return self
+
+    def compile(self, config):
+        """Turns every stage's locations into cell ids and looks up costs and health for a game config
+
+        execute calls it when it gets a GameState with a different config, so calling it from
+        on_game_start only moves that work out of the first turn.
+
+        Args:
+            config: The game config
+
+        Returns:
+            The plan
+
+        """
+        unit_information = config["unitInformation"]
+        type_index = dict((unit_info.get("shorthand"), index) for index, unit_info in enumerate(unit_information))
+        self.__upgrade_costs = []
+        self.__max_health = []
+        for unit_info in unit_information:
+            upgrade = unit_info.get("upgrade", None)
+            self.__upgrade_costs.append(None if upgrade is None else upgrade.get("cost1", unit_info.get("cost1", 0)))
+            if unit_info.get("unitCategory") == 0:
+                shorthand = unit_info.get("shorthand")
+                self.__max_health.append((get_unit_stats(config, shorthand).max_health, get_unit_stats(config, shorthand, True).max_health))
+            else:
+                self.__max_health.append((0, 0))
+
+        self.__compiled = []
+        for stage in self.stages:
+            cells = array('i', [location[1] * ARENA_SIZE + location[0] for location in stage.locations])
+            if stage.unit_type is None:
+                self.__compiled.append((cells, -1, 0))
+            else:
+                index = type_index[stage.unit_type]
+                self.__compiled.append((cells, index, unit_information[index].get("cost1", 0)))
+        self.__compiled_for = config
+        return self
+
+    def execute(self, game_state):
+        """Runs the plan's stages in order against a GameState
+
+        Args:
+            game_state: The turn to spend SP on
+
+        Returns:
+            A BuildResult
+
+        """
+        if self.__compiled_for is not game_state.config:
+            self.compile(game_state.config)
+        result = BuildResult()
+        for index, (stage, compiled) in enumerate(zip(self.stages, self.__compiled)):
+            if stage.when is not None and not stage.when(game_state):
+                continue
+            changes = len(result.spawned) + len(result.upgraded) + len(result.removed)
+            if stage.kind == REMOVE:
+                complete = self.__remove(game_state, stage, compiled, result)
+            elif game_state.get_resource(game_state.SP) <= 0:
+                complete = False
+            elif stage.kind == UPGRADE:
+                complete = self.__upgrade(game_state, stage, compiled, result)
+            else:
+                if stage.repair is not None:
+                    self.__repair(game_state, stage, compiled, result)
+                if stage.kind == SPAWN:
+                    complete = self.__spawn(game_state, stage, compiled, result)
+                else:
+                    complete = self.__build(game_state, stage, compiled, result)
+            result.completed = result.completed and complete
+
+            stop = stage.stop if stage.stop is not None else self.stop
+            changed = len(result.spawned) + len(result.upgraded) + len(result.removed) > changes
+            if (stop == INCOMPLETE and not complete) or (stop == BUILT and changed) or (stop == IDLE and not changed):
+                result.stopped_at = index
+                if index < len(self.stages) - 1:
+                    result.completed = False
+                break
+        return result
+
+    def __spawn(self, game_state, stage, compiled, result):
+        cells, type_index, cost = compiled
+        types = game_state.game_map.structure_types
+        complete = True
+        for location, cell in zip(stage.locations, cells):
+            if types[cell] >= 0:
+                if types[cell] != type_index:
+                    complete = False
+                continue
+            if game_state.get_resource(game_state.SP) < cost:
+                return False        # every location costs the same, so none of the rest can be afforded either
+            if game_state.attempt_spawn(stage.unit_type, location):
+                result.spawned.append(location)
+            else:
+                complete = False
+        return complete
+
+    def __upgrade(self, game_state, stage, compiled, result):
+        complete = True
+        for location, cell in zip(stage.locations, compiled[0]):
+            if not self.__upgrade_cell(game_state, location, cell, result):
+                complete = False
+        return complete
+
+    def __upgrade_cell(self, game_state, location, cell, result):
+        """Upgrades the structure on a cell if it can, and tells whether there is an upgraded structure there"""
+        game_map = game_state.game_map
+        type_index = game_map.structure_types[cell]
+        if type_index < 0:
+            return False
+        if game_map.structure_upgraded[cell]:
+            return True
+        cost = self.__upgrade_costs[type_index]
+        if cost is None or game_state.get_resource(game_state.SP) < cost or not game_state.attempt_upgrade(location):
+            return False
+        result.upgraded.append(location)
+        return True
+
+    def __build(self, game_state, stage, compiled, result):
+        cells, type_index, cost = compiled
+        types = game_state.game_map.structure_types
+        complete = True
+        for location, cell in zip(stage.locations, cells):
+            if types[cell] < 0 and game_state.get_resource(game_state.SP) >= cost and game_state.attempt_spawn(stage.unit_type, location):
+                result.spawned.append(location)
+            if not self.__upgrade_cell(game_state, location, cell, result):
+                return False
+            if types[cell] != type_index:
+                complete = False
+        return complete
+
+    def __repair(self, game_state, stage, compiled, result):
+        cells = compiled[0]
+        game_map = game_state.game_map
+        types = game_map.structure_types
+        health = game_map.structure_health
+        upgraded = game_map.structure_upgraded
+        for location, cell in zip(stage.locations, cells):
+            type_index = types[cell]
+            if type_index < 0 or game_map.structure_owners[cell] != 0:
+                continue
+            max_health = self.__max_health[type_index][upgraded[cell]]
+            if health[cell] / max_health < stage.repair and game_state.attempt_remove(location):
+                result.removed.append(location)
+
+    def __remove(self, game_state, stage, compiled, result):
+        cells = compiled[0]
+        game_map = game_state.game_map
+        complete = True
+        for location, cell in zip(stage.locations, cells):
+            if game_map.structure_types[cell] < 0 or game_map.structure_owners[cell] != 0:
+                continue
+            if game_state.attempt_remove(location):
+                result.removed.append(location)
+            else:
+                complete = False
+        return complete
+
+    def describe(self):
+        """The plan's stages as text, one line per stage
+
+        Returns:
+            A list of strings, like "2. build DF at [3, 12] [24, 12], repair below 0.5, stop if incomplete"
+
+        """
+        lines = []
+        for index, stage in enumerate(self.stages):
+            line = "{}. ".format(index + 1)
+            if stage.name is not None:
+                line += stage.name + ": "
+            line += stage.kind if stage.unit_type is None else "{} {}".format(stage.kind, stage.unit_type)
+            line += " at " + " ".join(str(location) for location in stage.locations)
+            if stage.repair is not None:
+                line += ", repair below {}".format(stage.repair)
+            if stage.when is not None:
+                line += ", when {}".format(getattr(stage.when, "__name__", repr(stage.when)))
+            stop = stage.stop if stage.stop is not None else self.stop
+            line += ", never stop" if stop == NEVER else ", stop if {}".format(stop)
+            lines.append(line)
+        return lines
+
+    def diff(self, other, name="this plan", other_name="other plan"):
+        """Compares this plan's stages with another plan's
+
+        Args:
+            other: The BuildPlan to compare with
+            name: What to call this plan in the diff's header
+            other_name: What to call the other plan
+
+        Returns:
+            The lines of a unified diff of the two plans' describe(), empty if they are the same
+
+        """
+        return list(difflib.unified_diff(self.describe(), other.describe(), name, other_name, lineterm=""))
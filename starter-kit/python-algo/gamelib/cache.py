@@ -0,0 +1,137 @@
+import random
+import threading
+from collections import OrderedDict
+
+_ZOBRIST_KEYS = {}
+_SHARED_CACHES = {}
+_ZOBRIST_SEED = 0x5EED
+
+
+def zobrist_keys(cell_count, type_count):
+    """Gets the random 64 bit keys GameMap combines into its structure_hash
+
+    Args:
+        cell_count: The number of cell ids on the board
+        type_count: The number of unit types in the config
+
+    Returns:
+        A list where ((cell * type_count + type_index) * 2 + player_index) * 2 + upgraded is the key of one structure.
+        The keys come from a fixed seed, so equal boards hash equally in every process.
+
+    """
+    key = (cell_count, type_count)
+    keys = _ZOBRIST_KEYS.get(key)
+    if keys is None:
+        generator = random.Random(_ZOBRIST_SEED)
+        keys = [generator.getrandbits(64) for _ in range(cell_count * type_count * 4)]
+        _ZOBRIST_KEYS[key] = keys
+    return keys
+
+
+class AnalysisCache:
+    """A size bounded least recently used cache for results derived from a board
+
+    Keys should include GameMap.structure_hash, or whatever else the result depends on, so entries stay valid
+    for as long as they are kept. One cache is shared by every GameState built from the same config, see
+    shared_cache, which lets results carry over between turns and between forks of a turn. It is safe to use
+    from the precompute thread and on_turn at the same time.
+
+    Attributes :
+        * max_size (int): The number of entries kept before the least recently used is dropped
+        * hits (int): How many lookups found an entry
+        * misses (int): How many lookups did not
+
+    """
+    def __init__(self, max_size=4096):
+        """Makes an empty cache
+
+        Args:
+            max_size: The number of entries to keep
+
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Looks up a key, marking it as recently used
+
+        Args:
+            key: A hashable key
+            default: Returned if the key is not in the cache
+
+        Returns:
+            The cached value, or default
+
+        """
+        with self.__lock:
+            try:
+                value = self.__entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Stores a value, dropping the least recently used entry if the cache is full"""
+        with self.__lock:
+            self.__entries[key] = value
+            self.__entries.move_to_end(key)
+            if len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    def memoize(self, key, compute):
+        """Gets the value for a key, computing and storing it if it is missing
+
+        Args:
+            key: A hashable key
+            compute: A function of no arguments giving the value. It runs outside the cache's lock
+
+        Returns:
+            The cached or newly computed value
+
+        """
+        missing = self.__entries
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        """Forgets every entry"""
+        with self.__lock:
+            self.__entries.clear()
+
+    def __deepcopy__(self, memo):
+        # Shared on purpose, so a deep copied GameState keeps reusing the same results
+        return self
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+
+def shared_cache(config):
+    """Gets the AnalysisCache shared by every GameState built from a config
+
+    Args:
+        config (JSON): Contains information about the game
+
+    Returns:
+        The AnalysisCache for this config object, made the first time it is asked for
+
+    """
+    entry = _SHARED_CACHES.get(id(config))
+    if entry is None or entry[0] is not config:
+        if len(_SHARED_CACHES) >= 8:
+            _SHARED_CACHES.clear()
+        entry = (config, AnalysisCache())
+        _SHARED_CACHES[id(config)] = entry
+    return entry[1]
@@ -0,0 +1,178 @@
+from array import array
+
+from . import protocol
+from .geometry import ARENA_SIZE
+
+BREACHES = 0
+DAMAGE = 1
+UNITS_LOST = 2
+
+
+class EventMap:
+    """Adds up where and when a game's breaches, damage and unit losses happened, per player
+
+    Events are read from action frames, live in on_action_frame or offline from replays, and
+    added to fixed size arrays: one weight per cell and one total per turn, for each kind of event
+    and each player it happened to. So asking which cells were breached costs as much as the number
+    of distinct cells, however many breaches there were.
+
+    Per cell weights decay: at the start of every turn they are multiplied by decay, so an event
+    k turns ago counts decay ** k. The default of 1.0 keeps plain counts. Per turn totals do not decay.
+
+    Player indexes are 0 for yourself and 1 for the enemy, as in the rest of gamelib, and always
+    name the player the event happened to: the player scored on, the owner of the damaged or lost unit.
+    Units removed by their owner and units that die scoring are not counted as lost.
+
+    Attributes :
+        * decay (float): What per cell weights are multiplied by at the start of every turn
+        * turn (int): The turn of the latest frame added, None before the first one
+        * turn_totals (list): turn_totals[kind][player_index] is an array('d') with the total of that kind of event in every turn. Turns past its end are added to the last entry
+
+    """
+    def __init__(self, decay=1.0, turns=100, arena_size=ARENA_SIZE):
+        """Makes an empty EventMap
+
+        Args:
+            decay: What per cell weights are multiplied by at the start of every turn
+            turns: How many turns turn_totals has room for
+            arena_size: The size of the arena
+
+        """
+        self.decay = decay
+        self.turn = None
+        self.arena_size = arena_size
+        cells = arena_size * arena_size
+        self.turn_totals = [[array('d', [0.0]) * turns for _ in range(2)] for _ in range(3)]
+        self.__weights = [[array('d', [0.0]) * cells for _ in range(2)] for _ in range(3)]
+        self.__seen = [[{} for _ in range(2)] for _ in range(3)]
+        self.__scale = 1.0
+
+    def add_frame(self, frame, player=1):
+        """Adds the events of an action frame
+
+        Args:
+            frame: The frame, as the string on_action_frame gets, a protocol.Message or decoded JSON
+            player: Which player of the frame is player index 0. Frames sent to your algo always have you as player 1.
+                With 2, locations are turned around the way the engine turns them for an algo playing as player 2
+
+        """
+        if isinstance(frame, protocol.Message):
+            frame = frame.data
+        elif isinstance(frame, (str, bytes)):
+            frame = protocol.loads(frame)
+        self.start_turn(frame["turnInfo"][1])
+        events = frame["events"]
+        top = self.arena_size - 1
+        place = (lambda location: location) if player == 1 else (lambda location: [top - location[0], top - location[1]])
+        breached = set()
+        for breach in events.get("breach", ()):
+            # breach[4] owns the unit that scored, so the other player was scored on
+            self.add_event(BREACHES, 1 - self.__player_index(breach[4], player), place(breach[0]))
+            breached.add(breach[3])
+        for damage in events.get("damage", ()):
+            self.add_event(DAMAGE, self.__player_index(damage[4], player), place(damage[0]), damage[1])
+        for death in events.get("death", ()):
+            # units that scored also die, and death[4] is true for units their owner removed
+            if not death[4] and death[2] not in breached:
+                self.add_event(UNITS_LOST, self.__player_index(death[3], player), place(death[0]))
+
+    def add_replay(self, path, player=1):
+        """Adds the action frames of a replay file, for starting a game from what happened in earlier ones
+
+        Turns keep their numbers, so turn_totals adds up every game's turn 0, turn 1 and so on. Per cell
+        weights are decayed along each replay's turns, and the next frame added after it does not decay them further.
+
+        Args:
+            path: The replay file
+            player: Which player of the replay to treat as player index 0, 1 or 2, see add_frame
+
+        """
+        with open(path) as f:
+            for line in f:
+                message = protocol.read_message(line)
+                if message.state_type == protocol.ACTION_FRAME:
+                    self.add_frame(message, player)
+        self.turn = None
+
+    def start_turn(self, turn):
+        """Decays the per cell weights once for every turn between the latest frame's turn and this one
+
+        Called by add_frame, so it only needs calling directly when adding events with add_event.
+
+        Args:
+            turn: The turn number
+
+        """
+        if self.turn is not None and turn > self.turn and self.decay != 1.0:
+            self.__scale *= self.decay ** (turn - self.turn)
+            if self.__scale < 1e-150:
+                self.__rescale()
+        if self.turn is None or turn > self.turn:
+            self.turn = turn
+
+    def add_event(self, kind, player_index, location, amount=1.0):
+        """Adds one event in the current turn
+
+        Args:
+            kind: BREACHES, DAMAGE or UNITS_LOST
+            player_index: The player it happened to
+            location: Where it happened, [x, y]
+            amount: How much it counts for, 1 by default. Damage events add the damage dealt
+
+        """
+        cell = location[1] * self.arena_size + location[0]
+        self.__weights[kind][player_index][cell] += amount / self.__scale
+        seen = self.__seen[kind][player_index]
+        if cell not in seen:
+            seen[cell] = True
+        turn = self.turn if self.turn is not None else 0
+        totals = self.turn_totals[kind][player_index]
+        totals[min(turn, len(totals) - 1)] += amount
+
+    def weight(self, kind, player_index, location):
+        """The decayed weight of a kind of event on a location
+
+        Args:
+            kind: BREACHES, DAMAGE or UNITS_LOST
+            player_index: The player it happened to
+            location: The [x, y] location
+
+        Returns:
+            The sum of the events' amounts, each multiplied by decay once per turn since it happened
+
+        """
+        return self.__weights[kind][player_index][location[1] * self.arena_size + location[0]] * self.__scale
+
+    def locations(self, kind, player_index, min_weight=0.0):
+        """The locations a kind of event happened on, heaviest first
+
+        Args:
+            kind: BREACHES, DAMAGE or UNITS_LOST
+            player_index: The player it happened to
+            min_weight: Leave out locations whose decayed weight is below this
+
+        Returns:
+            A list of [x, y] locations, each once, sorted by weight with ties in the order they first happened
+
+        """
+        weights = self.__weights[kind][player_index]
+        scale = self.__scale
+        found = [(cell, weights[cell] * scale) for cell in self.__seen[kind][player_index]]
+        found = [(cell, weight) for cell, weight in found if weight > 0 and weight >= min_weight]
+        found.sort(key=lambda item: -item[1])
+        return [[cell % self.arena_size, cell // self.arena_size] for cell, _ in found]
+
+    def total(self, kind, player_index):
+        """The total of a kind of event over every turn, without decay"""
+        return sum(self.turn_totals[kind][player_index])
+
+    def __player_index(self, frame_player, player):
+        return 0 if frame_player == player else 1
+
+    def __rescale(self):
+        scale = self.__scale
+        for by_player in self.__weights:
+            for weights in by_player:
+                for index in range(len(weights)):
+                    weights[index] *= scale
+        self.__scale = 1.0
@@ -1,6 +1,63 @@
+import copy
 import math
+from array import array
 from .unit import GameUnit
 from .util import debug_write
+from .geometry import board_geometry
+from .cache import zobrist_keys
+
+
+class _StructureView(GameUnit):
+    """A GameUnit backed by a GameMap's structure arrays.
+
+    Reading or writing health, pending_removal or upgraded on a view reads or writes
+    the parallel arrays of the map that owns it. Once the structure is removed from
+    the map the view is detached and keeps the last values it saw.
+    """
+    __slots__ = ("_map", "_cell", "_health", "_pending_removal", "_upgraded")
+
+    def __init__(self, game_map, cell, unit_type, player_index, x, y):
+        self._map = None
+        self._cell = cell
+        GameUnit.__init__(self, unit_type, game_map.config, player_index, game_map.structure_health[cell], x, y)
+        if game_map.structure_upgraded[cell]:
+            GameUnit.upgrade(self)
+        self._pending_removal = bool(game_map.structure_pending_removal[cell])
+        self._map = game_map
+
+    def _detach(self):
+        game_map = self._map
+        self._health = game_map.structure_health[self._cell]
+        self._pending_removal = bool(game_map.structure_pending_removal[self._cell])
+        self._upgraded = bool(game_map.structure_upgraded[self._cell])
+        self._map = None
+
+
+def _mirrored_field(name, cast, notify=False):
+    """Property for a _StructureView field stored in the GameMap array called name.
+    If notify is set, writes are reported to the map's structure listeners"""
+    detached = "_" + name.split("_", 1)[1]
+
+    def fget(self):
+        if self._map is None:
+            return getattr(self, detached)
+        return cast(getattr(self._map, name)[self._cell])
+
+    def fset(self, value):
+        if self._map is None:
+            setattr(self, detached, value)
+        else:
+            getattr(self._map, name)[self._cell] = value
+            if notify:
+                self._map._structure_changed(self._cell)
+
+    return property(fget, fset)
+
+
+_StructureView.health = _mirrored_field("structure_health", float)
+_StructureView.pending_removal = _mirrored_field("structure_pending_removal", bool)
+_StructureView.upgraded = _mirrored_field("structure_upgraded", bool, notify=True)
+
 
 class GameMap:
     """Holds data about the current game map and provides functions
@@ -9,6 +66,15 @@ class GameMap:
     game_map[x, y] will return a list of Units located at that location, 
     or an empty list if there are no units at the location
 
+    Structures are not stored as objects. Their type, owner, health and flags live in
+    parallel arrays indexed by cell id (see cell_id), and mobile units live in a separate
+    stack per cell. game_map[x, y] builds GameUnit views over those arrays, so changing the
+    health, pending_removal or upgraded fields of a returned structure updates the map.
+
+    Objects that derive data from the structures, like ThreatMap, can register a callback with
+    add_structure_listener. It is called with the cell id whenever a structure is placed, removed
+    or upgraded through the map or one of its views.
+
     Attributes :
         * config (JSON): Contains information about the current game rules
         * enable_warnings (bool): If true, debug messages for game_map functions will print out
@@ -18,6 +84,15 @@ class GameMap:
         * TOP_LEFT (int): A constant that represents the top left edge
         * BOTTOM_LEFT (int): Hidden challenge! Can you guess what this constant represents???
         * BOTTOM_RIGHT (int): A constant that represents the bottom right edge
+        * geometry (:obj: BoardGeometry): Precomputed board tables shared by every GameMap using this config
+        * structure_types (array): Per cell, the unitInformation index of the structure there, or -1 if the cell has none
+        * structure_owners (array): Per cell, the player index of the structure there, or -1
+        * structure_health (array): Per cell, the current health of the structure there
+        * structure_upgraded (bytearray): Per cell, 1 if the structure there is upgraded
+        * structure_pending_removal (bytearray): Per cell, 1 if the structure there is marked for removal
+        * structure_ids (array): Per cell, the engine's id for the structure there, or -1 if it is not known
+        * structure_hash (int): A 64 bit Zobrist hash of the type, owner and upgrade of every structure, kept up to date as they change.
+          Maps with the same structures have the same hash, whatever order they were placed in
 
     """
     def __init__(self, config):
@@ -35,45 +110,169 @@ class GameMap:
         self.TOP_LEFT = 1
         self.BOTTOM_LEFT = 2
         self.BOTTOM_RIGHT = 3
-        self.__map = self.__empty_grid()
-        self.__start = [13,0]
-    
+        self.geometry = board_geometry(config, self.ARENA_SIZE)
+        self.__in_bounds = self.geometry.in_bounds
+        self.__type_index = {}
+        self.__type_names = []
+        self.__stationary = []
+        self.__attack_stats = []
+        for index, unit_info in enumerate(config["unitInformation"]):
+            self.__type_index[unit_info.get("shorthand")] = index
+            self.__type_names.append(unit_info.get("shorthand"))
+            self.__stationary.append(unit_info.get("unitCategory") == 0)
+            upgrade_info = unit_info.get("upgrade", {})
+            base_range = unit_info.get("attackRange", 0)
+            base_damage = unit_info.get("attackDamageWalker", 0) + unit_info.get("attackDamageTower", 0)
+            upgraded_damage = upgrade_info.get("attackDamageWalker", unit_info.get("attackDamageWalker", 0)) + upgrade_info.get("attackDamageTower", unit_info.get("attackDamageTower", 0))
+            self.__attack_stats.append(((base_range, base_damage), (upgrade_info.get("attackRange", base_range), upgraded_damage)))
+        self.__type_count = len(self.__type_names)
+        self.__zobrist = zobrist_keys(self.ARENA_SIZE * self.ARENA_SIZE, self.__type_count)
+        self.__listeners = []
+        self.__clear_grid()
+        self.__iter_index = 0
+
+    def __clear_grid(self):
+        cells = self.ARENA_SIZE * self.ARENA_SIZE
+        self.structure_types = array('b', [-1]) * cells
+        self.structure_owners = array('b', [-1]) * cells
+        self.structure_health = array('d', [0.0]) * cells
+        self.structure_upgraded = bytearray(cells)
+        self.structure_pending_removal = bytearray(cells)
+        self.structure_ids = array('l', [-1]) * cells
+        self.__views = [None] * cells
+        self.__mobile = {}
+        self.__cell_hashes = [0] * cells
+        self.structure_hash = 0
+
+    def fork(self):
+        """Makes a copy of this map that can be changed without affecting this one
+
+        The structure arrays and mobile unit stacks are copied, while the config, geometry and unit
+        tables are shared. Structure listeners are not carried over.
+
+        Returns:
+            A new GameMap with the same units
+        """
+        fork = GameMap.__new__(GameMap)
+        fork.__dict__.update(self.__dict__)
+        fork.structure_types = self.structure_types[:]
+        fork.structure_owners = self.structure_owners[:]
+        fork.structure_health = self.structure_health[:]
+        fork.structure_upgraded = self.structure_upgraded[:]
+        fork.structure_pending_removal = self.structure_pending_removal[:]
+        fork.structure_ids = self.structure_ids[:]
+        fork.__views = [None] * len(self.__views)
+        fork.__cell_hashes = list(self.__cell_hashes)
+        fork.__mobile = {cell: [copy.copy(unit) for unit in units] for cell, units in self.__mobile.items()}
+        fork.__listeners = []
+        fork.__iter_index = 0
+        return fork
+
+    def cell_id(self, location):
+        """The index of a location in the structure arrays
+
+        Args:
+            location: A map location
+
+        Returns:
+            y * ARENA_SIZE + x
+        """
+        return location[1] * self.ARENA_SIZE + location[0]
+
     def __getitem__(self, location):
         if len(location) == 2 and self.in_arena_bounds(location):
-            x,y = location
-            return self.__map[x][y]
+            cell = self.cell_id(location)
+            units = self.__mobile.get(cell, [])
+            if self.structure_types[cell] >= 0:
+                return [self.__view(cell)] + units
+            return list(units)
         self._invalid_coordinates(location)
 
     def __setitem__(self, location, val):
         if type(location) == tuple and len(location) == 2 and self.in_arena_bounds(location):
-            self.__map[location[0]][location[1]] = val
+            cell = self.cell_id(location)
+            self.__clear_cell(cell)
+            for unit in val:
+                if unit.stationary:
+                    self.__set_structure(cell, self.__type_index[unit.unit_type], unit.player_index, unit.health, unit.upgraded, unit.pending_removal)
+                else:
+                    self.__mobile.setdefault(cell, []).append(unit)
             return
         self._invalid_coordinates(location)
 
+    def __view(self, cell):
+        view = self.__views[cell]
+        if view is None:
+            x = cell % self.ARENA_SIZE
+            y = cell // self.ARENA_SIZE
+            view = _StructureView(self, cell, self.__type_names[self.structure_types[cell]], self.structure_owners[cell], x, y)
+            self.__views[cell] = view
+        return view
+
+    def __set_structure(self, cell, type_index, player_index, health, upgraded=False, pending_removal=False, unit_id=-1):
+        self.__drop_view(cell)
+        self.structure_ids[cell] = unit_id
+        self.structure_types[cell] = type_index
+        self.structure_owners[cell] = player_index
+        self.structure_health[cell] = health
+        self.structure_upgraded[cell] = 1 if upgraded else 0
+        self.structure_pending_removal[cell] = 1 if pending_removal else 0
+        self._structure_changed(cell)
+
+    def __drop_view(self, cell):
+        view = self.__views[cell]
+        if view is not None:
+            view._detach()
+            self.__views[cell] = None
+
+    def __clear_cell(self, cell):
+        had_structure = self.structure_types[cell] >= 0
+        self.__drop_view(cell)
+        self.structure_types[cell] = -1
+        self.structure_owners[cell] = -1
+        self.structure_health[cell] = 0.0
+        self.structure_upgraded[cell] = 0
+        self.structure_pending_removal[cell] = 0
+        self.structure_ids[cell] = -1
+        self.__mobile.pop(cell, None)
+        if had_structure:
+            self._structure_changed(cell)
+
+    def add_structure_listener(self, callback):
+        """Registers a function to call whenever a structure is placed, removed or upgraded
+
+        Args:
+            callback: A function taking the cell id (see cell_id) of the structure that changed
+        """
+        self.__listeners.append(callback)
+
+    def remove_structure_listener(self, callback):
+        """Stops calling a function registered with add_structure_listener"""
+        if callback in self.__listeners:
+            self.__listeners.remove(callback)
+
+    def _structure_changed(self, cell):
+        type_index = self.structure_types[cell]
+        if type_index < 0:
+            cell_hash = 0
+        else:
+            cell_hash = self.__zobrist[((cell * self.__type_count + type_index) * 2 + (self.structure_owners[cell] & 1)) * 2 + self.structure_upgraded[cell]]
+        self.structure_hash ^= self.__cell_hashes[cell] ^ cell_hash
+        self.__cell_hashes[cell] = cell_hash
+        for callback in self.__listeners:
+            callback(cell)
+
     def __iter__(self):
-        self.__start = [13,0]
+        self.__iter_index = 0
         return self
     
     def __next__(self):
-        location = self.__start
-        if location == [15,27]:
+        cells = self.geometry.cells
+        if self.__iter_index >= len(cells):
             raise StopIteration
-        new_location = [location[0]+1, location[1]]
-        while not self.in_arena_bounds(new_location) and not location == [14,27]:
-            if new_location[0] == self.ARENA_SIZE:
-                new_location = [0, new_location[1]+1]
-            else:
-                new_location = [new_location[0]+1, new_location[1]]
-        self.__start = new_location
-        return location 
-
-    def __empty_grid(self):
-        grid = []
-        for x in range(0, self.ARENA_SIZE):
-            grid.append([])
-            for _ in range(0, self.ARENA_SIZE):
-                grid[x].append([])
-        return grid
+        x, y = self.geometry.xy[cells[self.__iter_index]]
+        self.__iter_index += 1
+        return [x, y]
 
     def _invalid_coordinates(self, location):
         self.warn("{} is out of bounds.".format(str(location)))
@@ -89,6 +288,11 @@ class GameMap:
         
         """
         x, y = location
+        size = self.ARENA_SIZE
+        if type(x) is int and type(y) is int:
+            return 0 <= x < size and 0 <= y < size and self.__in_bounds[y * size + x] == 1
+
+        # The table only has whole tiles, so other locations are checked against the diamond's edges
         half_board = self.HALF_ARENA
 
         row_size = y + 1
@@ -117,8 +321,7 @@ class GameMap:
             self.warn("Passed invalid quadrant_description '{}'. See the documentation for valid inputs for get_edge_locations.".format(quadrant_description))
             return
 
-        edges = self.get_edges()
-        return edges[quadrant_description]
+        return [[x, y] for x, y in self.geometry.edges[quadrant_description]]
 
     def get_edges(self):
         """Gets all of the edges and their edge locations
@@ -127,27 +330,19 @@ class GameMap:
             A list with four lists inside of it of locations corresponding to the four edges.
             [0] = top_right, [1] = top_left, [2] = bottom_left, [3] = bottom_right.
         """
-        top_right = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA + num
-            y = self.ARENA_SIZE - 1 - num
-            top_right.append([int(x), int(y)])
-        top_left = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA - 1 - num
-            y = self.ARENA_SIZE - 1 - num
-            top_left.append([int(x), int(y)])
-        bottom_left = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA - 1 - num
-            y = num
-            bottom_left.append([int(x), int(y)])
-        bottom_right = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA + num
-            y = num
-            bottom_right.append([int(x), int(y)])
-        return [top_right, top_left, bottom_left, bottom_right]
+        return [[[x, y] for x, y in edge] for edge in self.geometry.edges]
+
+    def is_on_edge(self, location, quadrant_description):
+        """Checks if a location lies on an edge without building the edge list
+
+        Args:
+            location: A map location
+            quadrant_description: A constant corresponding to one of the 4 edges. See game_map.TOP_LEFT, game_map.BOTTOM_RIGHT, and similar constants.
+
+        Returns:
+            True if the location is one of the edge's locations
+        """
+        return (location[0], location[1]) in self.geometry.edge_sets[quadrant_description]
     
     def add_unit(self, unit_type, location, player_index=0):
         """Add a single GameUnit to the map at the given location.
@@ -167,11 +362,35 @@ class GameMap:
             self.warn("Player index {} is invalid. Player index should be 0 or 1.".format(player_index))
 
         x, y = location
-        new_unit = GameUnit(unit_type, self.config, player_index, None, location[0], location[1])
-        if not new_unit.stationary:
-            self.__map[x][y].append(new_unit)
+        self._place_unit(self.__type_index[unit_type], x, y, player_index)
+
+    def _place_unit(self, type_index, x, y, player_index, health=None, unit_id=-1):
+        """Places a unit given its unitInformation index, without any bounds checking.
+        Structures replace everything on their cell, mobile units stack.
+        Used internally by GameState when parsing the board, which passes the engine's unit_id along.
+        """
+        cell = y * self.ARENA_SIZE + x
+        if self.__stationary[type_index]:
+            self.__clear_cell(cell)
+            if health is None:
+                health = self.config["unitInformation"][type_index].get("startHealth", 0)
+            self.__set_structure(cell, type_index, player_index, health, unit_id=unit_id)
+        else:
+            unit = GameUnit(self.__type_names[type_index], self.config, player_index, health, x, y)
+            self.__mobile.setdefault(cell, []).append(unit)
+
+    def _attack_stats(self, type_index, upgraded):
+        """The (attackRange, attackDamageWalker + attackDamageTower) of a unit type, upgraded or not"""
+        return self.__attack_stats[type_index][1 if upgraded else 0]
+
+    def _upgrade_structure(self, cell):
+        """Upgrades the structure on a cell, keeping any existing view in sync"""
+        view = self.__views[cell]
+        if view is not None:
+            view.upgrade()
         else:
-            self.__map[x][y] = [new_unit]
+            self.structure_upgraded[cell] = 1
+            self._structure_changed(cell)
 
     def remove_unit(self, location):
         """Remove all units on the map in the given location.
@@ -185,8 +404,66 @@ class GameMap:
         if not self.in_arena_bounds(location):
             self._invalid_coordinates(location)
         
-        x, y = location
-        self.__map[x][y] = []
+        self.__clear_cell(self.cell_id(location))
+
+    def get_structure(self, location):
+        """Gets the structure at a location
+
+        Args:
+            location: A map location
+
+        Returns:
+            A GameUnit view of the structure at the location, or None if there is no structure
+        """
+        cell = self.cell_id(location)
+        if self.structure_types[cell] < 0:
+            return None
+        return self.__view(cell)
+
+    def has_structure(self, location):
+        """Checks if there is a structure at a location without building a GameUnit view
+
+        Args:
+            location: A map location
+
+        Returns:
+            True if a structure occupies the location
+        """
+        return self.structure_types[location[1] * self.ARENA_SIZE + location[0]] >= 0
+
+    def has_mobile_units(self, location):
+        """Checks if any mobile units are at a location
+
+        Args:
+            location: A map location
+
+        Returns:
+            True if at least one mobile unit is at the location
+        """
+        return bool(self.__mobile.get(self.cell_id(location)))
+
+    def structure_locations(self, player_index=None, unit_type=None):
+        """Lists the locations of structures on the map, scanning only the structure arrays
+
+        Args:
+            player_index: If given, only structures owned by this player (0 for you, 1 for the enemy)
+            unit_type: If given, only structures of this type
+
+        Returns:
+            A list of [x, y] locations
+        """
+        type_index = -1 if unit_type is None else self.__type_index.get(unit_type, -2)
+        locations = []
+        types = self.structure_types
+        owners = self.structure_owners
+        for cell in range(len(types)):
+            current_type = types[cell]
+            if current_type < 0 or (type_index != -1 and current_type != type_index):
+                continue
+            if player_index is not None and owners[cell] != player_index:
+                continue
+            locations.append([cell % self.ARENA_SIZE, cell // self.ARENA_SIZE])
+        return locations
 
     def get_locations_in_range(self, location, radius):
         """Gets locations in a circular area around a location
@@ -205,9 +482,13 @@ class GameMap:
             self._invalid_coordinates(location)
 
         x, y = location
+        if type(x) is int and type(y) is int and self.in_arena_bounds(location):
+            xy = self.geometry.xy
+            return [list(xy[cell]) for cell in self.geometry.cells_in_range(self.cell_id(location), radius)]
+
         locations = []
         search_radius = math.ceil(radius)
-        getHitRadius = self.config["unitInformation"][0]['getHitRadius']
+        getHitRadius = self.geometry.hit_radius
         for i in range(int(x - search_radius), int(x + search_radius + 1)):
             for j in range(int(y - search_radius), int(y + search_radius + 1)):
                 new_location = [i, j]
@@ -1,11 +1,20 @@
 import math
 import json
 import sys
+import time
+from array import array
 
 from .navigation import ShortestPathFinder
-from .util import send_command, debug_write
+from .util import send_command, command_receiver, debug_write
 from .unit import GameUnit
 from .game_map import GameMap
+from .threat_map import ThreatMap
+from .shield_map import ShieldMap
+from .planning import Deadline
+from .protocol import Message, loads
+from .cache import shared_cache
+
+_configured_for = None
 
 def is_stationary(unit_type):
     """
@@ -44,6 +53,7 @@ class GameState:
         * my_time (int): The time you took to submit your previous turn
         * enemy_health (int): Your opponents current remaining health
         * enemy_time (int): Your opponents current remaining time
+        * cache (:obj: AnalysisCache): A cache shared with every GameState of this game, for results keyed by game_map.structure_hash
 
     """
 
@@ -52,34 +62,40 @@ class GameState:
 
         Args:
             * config (JSON): A json object containing information about the game
-            * serialized_string (string): A string containing information about the game state at the start of this turn
+            * serialized_string (string): A string containing information about the game state at the start of this turn.
+                The protocol.Message AlgoCore passes to on_turn is decoded only once however many GameStates are made from it
 
         """
+        self._created_at = time.perf_counter()
         self.serialized_string = serialized_string
         self.config = config
         self.enable_warnings = True
 
-        global WALL, SUPPORT, TURRET, SCOUT, DEMOLISHER, INTERCEPTOR, REMOVE, UPGRADE, STRUCTURE_TYPES, ALL_UNITS, UNIT_TYPE_TO_INDEX
-        UNIT_TYPE_TO_INDEX = {}
-        WALL = config["unitInformation"][0]["shorthand"]
-        UNIT_TYPE_TO_INDEX[WALL] = 0
-        SUPPORT = config["unitInformation"][1]["shorthand"]
-        UNIT_TYPE_TO_INDEX[SUPPORT] = 1
-        TURRET = config["unitInformation"][2]["shorthand"]
-        UNIT_TYPE_TO_INDEX[TURRET] = 2
-        SCOUT = config["unitInformation"][3]["shorthand"]
-        UNIT_TYPE_TO_INDEX[SCOUT] = 3
-        DEMOLISHER = config["unitInformation"][4]["shorthand"]
-        UNIT_TYPE_TO_INDEX[DEMOLISHER] = 4
-        INTERCEPTOR = config["unitInformation"][5]["shorthand"]
-        UNIT_TYPE_TO_INDEX[INTERCEPTOR] = 5
-        REMOVE = config["unitInformation"][6]["shorthand"]
-        UNIT_TYPE_TO_INDEX[REMOVE] = 6
-        UPGRADE = config["unitInformation"][7]["shorthand"]
-        UNIT_TYPE_TO_INDEX[UPGRADE] = 7
-
-        ALL_UNITS = [SCOUT, DEMOLISHER, INTERCEPTOR, WALL, SUPPORT, TURRET]
-        STRUCTURE_TYPES = [WALL, SUPPORT, TURRET]
+        # The unit constants only need rebuilding when a different config is used
+        global _configured_for
+        if config is not _configured_for:
+            _configured_for = config
+            global WALL, SUPPORT, TURRET, SCOUT, DEMOLISHER, INTERCEPTOR, REMOVE, UPGRADE, STRUCTURE_TYPES, ALL_UNITS, UNIT_TYPE_TO_INDEX
+            UNIT_TYPE_TO_INDEX = {}
+            WALL = config["unitInformation"][0]["shorthand"]
+            UNIT_TYPE_TO_INDEX[WALL] = 0
+            SUPPORT = config["unitInformation"][1]["shorthand"]
+            UNIT_TYPE_TO_INDEX[SUPPORT] = 1
+            TURRET = config["unitInformation"][2]["shorthand"]
+            UNIT_TYPE_TO_INDEX[TURRET] = 2
+            SCOUT = config["unitInformation"][3]["shorthand"]
+            UNIT_TYPE_TO_INDEX[SCOUT] = 3
+            DEMOLISHER = config["unitInformation"][4]["shorthand"]
+            UNIT_TYPE_TO_INDEX[DEMOLISHER] = 4
+            INTERCEPTOR = config["unitInformation"][5]["shorthand"]
+            UNIT_TYPE_TO_INDEX[INTERCEPTOR] = 5
+            REMOVE = config["unitInformation"][6]["shorthand"]
+            UNIT_TYPE_TO_INDEX[REMOVE] = 6
+            UPGRADE = config["unitInformation"][7]["shorthand"]
+            UNIT_TYPE_TO_INDEX[UPGRADE] = 7
+
+            ALL_UNITS = [SCOUT, DEMOLISHER, INTERCEPTOR, WALL, SUPPORT, TURRET]
+            STRUCTURE_TYPES = [WALL, SUPPORT, TURRET]
 
         self.ARENA_SIZE = 28
         self.HALF_ARENA = int(self.ARENA_SIZE / 2)
@@ -91,6 +107,9 @@ class GameState:
 
         self.game_map = GameMap(self.config)
         self._shortest_path_finder = ShortestPathFinder()
+        self.cache = shared_cache(config)
+        self._threat_map = None
+        self._shield_map = None
         self._build_stack = []
         self._deploy_stack = []
         self._player_resources = [
@@ -98,12 +117,31 @@ class GameState:
                 {'SP': 0, 'MP': 0}]  # player 1, which is the opponent
         self.__parse_state(serialized_string)
 
+    @classmethod
+    def from_dict(cls, config, state):
+        """Builds a GameState from a game state that has already been decoded from JSON
+
+        Args:
+            * config (JSON): A json object containing information about the game
+            * state (dict): The decoded game state at the start of a turn, or an action frame
+
+        Returns:
+            A GameState
+
+        """
+        return cls(config, state)
+
     def __parse_state(self, state_line):
         """
         Fills in map based on the serialized game state so that self.game_map[x,y] is a list of GameUnits at that location.
-        state_line is the game state as a json string.
+        state_line is the game state as a json string, or a protocol.Message or dict already decoded from one.
         """
-        state = json.loads(state_line)
+        if isinstance(state_line, Message):
+            state = state_line.data
+        elif isinstance(state_line, dict):
+            state = state_line
+        else:
+            state = loads(state_line)
 
         turn_info = state["turnInfo"]
         self.turn_number = int(turn_info[1])
@@ -130,24 +168,25 @@ class GameState:
         """
         Helper function for __parse_state to add units to the map.
         """
-        typedef = self.config.get("unitInformation")
+        game_map = self.game_map
         for i, unit_types in enumerate(units):
+            if not unit_types:
+                continue
+            unit_type = self.config["unitInformation"][i].get("shorthand")
             for uinfo in unit_types:
-                unit_type = typedef[i].get("shorthand")
                 sx, sy, shp = uinfo[:3]
-                x, y = map(int, [sx, sy])
-                hp = float(shp)
+                x, y = int(sx), int(sy)
                 # This depends on RM and UP always being the last types to be processed
                 if unit_type == REMOVE:
                     # Quick fix will deploy engine fix soon
-                    if self.contains_stationary_unit([x,y]):
-                        self.game_map[x,y][0].pending_removal = True
+                    if game_map.has_structure([x, y]):
+                        game_map.structure_pending_removal[game_map.cell_id([x, y])] = 1
                 elif unit_type == UPGRADE:
-                    if self.contains_stationary_unit([x,y]):
-                        self.game_map[x,y][0].upgrade()
+                    if game_map.has_structure([x, y]):
+                        game_map._upgrade_structure(game_map.cell_id([x, y]))
                 else:
-                    unit = GameUnit(unit_type, self.config, player_number, hp, x, y)
-                    self.game_map[x,y].append(unit)
+                    unit_id = int(uinfo[3]) if len(uinfo) > 3 and str(uinfo[3]).isdigit() else -1
+                    game_map._place_unit(i, x, y, player_number, float(shp), unit_id)
 
     def __resource_required(self, unit_type):
         return self.SP if is_stationary(unit_type) else self.MP
@@ -175,11 +214,59 @@ class GameState:
         """Submit and end your turn.
             Must be called at the end of your turn or the algo will hang.
         """
+        if command_receiver() is not None:
+            # Played in process by a referee, which takes the stacks as they are
+            send_command(list(self._build_stack))
+            send_command(list(self._deploy_stack))
+            return
         build_string = json.dumps(self._build_stack)
         deploy_string = json.dumps(self._deploy_stack)
         send_command(build_string)
         send_command(deploy_string)
 
+    def deadline(self, ms=None, margin_ms=250):
+        """Gets the time this turn has to be submitted by, counted from when this GameState was created
+
+        Args:
+            ms: The number of milliseconds to allow. If None, the engine's soft time limit from the config less margin_ms
+            margin_ms: How much of the soft limit to keep back for submitting the turn
+
+        Returns:
+            A Deadline, see planning.Deadline
+
+        """
+        if ms is None:
+            soft_limit = self.config.get("timingAndReplay", {}).get("waitTimeBotSoft", 5000)
+            ms = max(0, soft_limit - margin_ms)
+        return Deadline(ms, self._created_at)
+
+    def fork(self):
+        """Makes a copy of this GameState for trying out builds and deploys without affecting this one
+
+        The copy has its own GameMap, resources and build and deploy stacks, while the config, the turn's
+        serialized string and the path finder's cache are shared. Threat and shield maps already built
+        are carried over rather than rebuilt.
+
+        Returns:
+            A new GameState that can be changed independently of this one
+
+        """
+        fork = GameState.__new__(GameState)
+        fork.__dict__.update(self.__dict__)
+        fork.game_map = self.game_map.fork()
+        fork._build_stack = list(self._build_stack)
+        fork._deploy_stack = list(self._deploy_stack)
+        fork._player_resources = [dict(resources) for resources in self._player_resources]
+        if self._threat_map is not None and self._threat_map.game_map is self.game_map:
+            fork._threat_map = self._threat_map.fork(fork.game_map)
+        else:
+            fork._threat_map = None
+        if self._shield_map is not None and self._shield_map.game_map is self.game_map:
+            fork._shield_map = self._shield_map.fork(fork.game_map)
+        else:
+            fork._shield_map = None
+        return fork
+
     def get_resource(self, resource_type, player_index = 0):
         """Gets a players resources
 
@@ -331,9 +418,9 @@ class GameState:
 
         affordable = self.number_affordable(unit_type) >= num
         stationary = is_stationary(unit_type)
-        blocked = self.contains_stationary_unit(location) or (stationary and len(self.game_map[location[0],location[1]]) > 0)
+        blocked = self.game_map.has_structure(location) or (stationary and self.game_map.has_mobile_units(location))
         correct_territory = location[1] < self.HALF_ARENA
-        on_edge = location in (self.game_map.get_edge_locations(self.game_map.BOTTOM_LEFT) + self.game_map.get_edge_locations(self.game_map.BOTTOM_RIGHT))
+        on_edge = self.game_map.is_on_edge(location, self.game_map.BOTTOM_LEFT) or self.game_map.is_on_edge(location, self.game_map.BOTTOM_RIGHT)
 
         if self.enable_warnings:
             fail_reason = ""
@@ -430,10 +517,7 @@ class GameState:
         for location in locations:
             if location[1] < self.HALF_ARENA and self.contains_stationary_unit(location):
                 x, y = map(int, location)
-                existing_unit = None
-                for unit in self.game_map[x,y]:
-                    if unit.stationary:
-                        existing_unit = unit
+                existing_unit = self.game_map.get_structure([x, y])
 
                 if not existing_unit.upgraded and self.config["unitInformation"][UNIT_TYPE_TO_INDEX[existing_unit.unit_type]].get("upgrade", None) is not None:
                     costs = self.type_cost(existing_unit.unit_type, True)
@@ -491,8 +575,57 @@ class GameState:
         if target_edge is None:
             target_edge = self.get_target_edge(start_location)
 
-        end_points = self.game_map.get_edge_locations(target_edge)
-        return self._shortest_path_finder.navigate_multiple_endpoints(start_location, end_points, self)
+        game_map = self.game_map
+        if target_edge not in (game_map.TOP_RIGHT, game_map.TOP_LEFT, game_map.BOTTOM_LEFT, game_map.BOTTOM_RIGHT) or not game_map.in_arena_bounds(start_location):
+            end_points = game_map.get_edge_locations(target_edge)
+            return self._shortest_path_finder.navigate_multiple_endpoints(start_location, end_points, self)
+
+        # Paths only depend on where structures stand, so they are cached by the board hash and shared across turns and forks
+        geometry = game_map.geometry
+        cell = geometry.cell_id([int(start_location[0]), int(start_location[1])])
+        key = ("path", game_map.structure_hash, cell, target_edge)
+        cells = self.cache.memoize(key, lambda: tuple(self._shortest_path_finder.get_field(geometry.edges[target_edge], self).path(cell)))
+        xy = geometry.xy
+        return [start_location] + [list(xy[step]) for step in cells[1:]]
+
+    def find_all_edge_paths(self, player_index=0):
+        """Gets the path a unit would take from every edge location a player can deploy on.
+        Every start aiming at the same edge shares one distance field, so this costs at most two
+        breadth first searches instead of one per location like repeated find_path_to_edge calls.
+
+        Args:
+            player_index: The player deploying the units. 0 deploys from the bottom edges, 1 from the top
+
+        Returns:
+            A dict from each (x, y) deploy location, ordered by x, to an array('h') of the cell ids
+            (y * ARENA_SIZE + x) on the path from that location, start included. Locations blocked by a
+            structure map to None. numpy.frombuffer(path, dtype=numpy.int16) gives a path as a NumPy array.
+
+        """
+        if not player_index == 1 and not player_index == 0:
+            self._invalid_player_index(player_index)
+
+        game_map = self.game_map
+        geometry = game_map.geometry
+        if player_index == 0:
+            deploy_edges = [game_map.BOTTOM_LEFT, game_map.BOTTOM_RIGHT]
+        else:
+            deploy_edges = [game_map.TOP_LEFT, game_map.TOP_RIGHT]
+
+        fields = {}
+        paths = {}
+        for location in sorted(location for edge in deploy_edges for location in geometry.edges[edge]):
+            cell = geometry.cell_id(location)
+            if game_map.structure_types[cell] != -1:
+                paths[location] = None
+                continue
+            target_edge = self.get_target_edge(location)
+            field = fields.get(target_edge)
+            if field is None:
+                field = self._shortest_path_finder.get_field(geometry.edges[target_edge], self)
+                fields[target_edge] = field
+            paths[location] = array('h', field.path(cell))
+        return paths
 
     def contains_stationary_unit(self, location):
         """Check if a location is blocked, return structures unit if it is
@@ -508,10 +641,7 @@ class GameState:
             self.warn('Checked for stationary unit outside of arena bounds')
             return False
         x, y = map(int, location)
-        for unit in self.game_map[x,y]:
-            if unit.stationary:
-                return unit
-        return False
+        return self.game_map.get_structure([x, y]) or False
 
     def warn(self, message):
         """ Used internally by game_state to print warnings
@@ -610,6 +740,35 @@ class GameState:
                     target_x_distance = unit_x_distance
         return target
 
+    def get_threat_map(self):
+        """Gets the ThreatMap for this game state, building it the first time it is asked for.
+        It follows every later change to game_map, including spawns and upgrades made with attempt_spawn and attempt_upgrade.
+        Removals requested with attempt_remove only happen at the end of the turn, so they do not change it.
+
+        Returns:
+            A ThreatMap of the damage each player's structures can deal to every tile
+
+        """
+        if self._threat_map is None or self._threat_map.game_map is not self.game_map:
+            if self._threat_map is not None:
+                self._threat_map.detach()
+            self._threat_map = ThreatMap(self.game_map)
+        return self._threat_map
+
+    def get_shield_map(self):
+        """Gets the ShieldMap for this game state, building it the first time it is asked for.
+        Like get_threat_map, it follows every later change to game_map.
+
+        Returns:
+            A ShieldMap of the supports that can shield a mobile unit on every tile
+
+        """
+        if self._shield_map is None or self._shield_map.game_map is not self.game_map:
+            if self._shield_map is not None:
+                self._shield_map.detach()
+            self._shield_map = ShieldMap(self.game_map)
+        return self._shield_map
+
     def get_attackers(self, location, player_index):
         """Gets the stationary units threatening a given location
 
@@ -627,6 +786,9 @@ class GameState:
         if not self.game_map.in_arena_bounds(location):
             self.warn("Location {} is not in the arena bounds.".format(location))
 
+        if player_index in (0, 1) and self.game_map.in_arena_bounds(location) and location[0] == int(location[0]) and location[1] == int(location[1]):
+            return self.get_threat_map().get_attackers([int(location[0]), int(location[1])], player_index)
+
         attackers = []
         """
         Get locations in the range of TURRET units
@@ -635,9 +797,18 @@ class GameState:
         for unit in self.config["unitInformation"]:
             if unit.get('attackRange', 0) >= max_range:
                 max_range = unit.get('attackRange', 0)
-        possible_locations= self.game_map.get_locations_in_range(location, max_range)
-        for location_unit in possible_locations:
-            for unit in self.game_map[location_unit]:
-                if unit.damage_i + unit.damage_f > 0 and unit.player_index != player_index and self.game_map.distance_between_locations(location, location_unit) <= unit.attackRange:
-                    attackers.append(unit)
+        game_map = self.game_map
+        # Scanned around the location itself, a table for the tile it is on can miss structures near the range's edge
+        possible_cells = [game_map.cell_id(nearby) for nearby in game_map.get_locations_in_range(location, max_range)]
+        types = game_map.structure_types
+        owners = game_map.structure_owners
+        upgraded = game_map.structure_upgraded
+        xy = game_map.geometry.xy
+        for cell in possible_cells:
+            type_index = types[cell]
+            if type_index < 0 or owners[cell] == player_index:
+                continue
+            attack_range, damage = game_map._attack_stats(type_index, upgraded[cell])
+            if damage > 0 and game_map.distance_between_locations(location, xy[cell]) <= attack_range:
+                attackers.append(game_map.get_structure(xy[cell]))
         return attackers
@@ -0,0 +1,208 @@
+import math
+import threading
+from collections import OrderedDict
+
+ARENA_SIZE = 28
+
+_GEOMETRY_CACHE = {}
+
+
+def board_geometry(config, arena_size=ARENA_SIZE):
+    """Gets the shared BoardGeometry for a config, building it the first time it is asked for
+
+    Args:
+        config (JSON): Contains information about the game
+        arena_size: The size of the arena
+
+    Returns:
+        The BoardGeometry for this config. Every GameMap built from an equivalent config shares it.
+
+    """
+    unit_information = config["unitInformation"]
+    hit_radius = unit_information[0].get("getHitRadius", 0)
+    key = (arena_size, hit_radius)
+    geometry = _GEOMETRY_CACHE.get(key)
+    if geometry is None:
+        geometry = BoardGeometry(arena_size, hit_radius)
+        _GEOMETRY_CACHE[key] = geometry
+    for radius in unit_ranges(config):
+        geometry.add_range_table(radius)
+    return geometry
+
+
+def unit_ranges(config):
+    """Lists the distinct attackRange and shieldRange values in a config, upgrades included
+
+    Args:
+        config (JSON): Contains information about the game
+
+    Returns:
+        A sorted list of radii
+
+    """
+    radii = set()
+    for unit_info in config["unitInformation"]:
+        for stats in (unit_info, unit_info.get("upgrade", {})):
+            for key in ("attackRange", "shieldRange"):
+                if stats.get(key, 0) > 0:
+                    radii.add(stats[key])
+    return sorted(radii)
+
+
+class BoardGeometry:
+    """Tables describing the diamond shaped board, computed once and shared between GameMaps
+
+    Cells are numbered y * arena_size + x, so every square on the 28x28 grid has a cell id
+    whether or not it is in the arena.
+
+    Attributes :
+        * arena_size (int): The size of the arena
+        * half_arena (int): Half of the size of the arena
+        * hit_radius (float): The getHitRadius added to ranges, see GameMap.get_locations_in_range
+        * in_bounds (bytearray): 1 for every cell id inside the diamond, 0 otherwise
+        * xy (tuple): The (x, y) location of every cell id
+        * cells (tuple): The in bounds cell ids, in the order GameMap iterates over them
+        * edges (tuple): Four tuples of (x, y) edge locations, indexed like GameMap.TOP_RIGHT and friends
+        * edge_sets (tuple): The same four edges as frozensets of (x, y)
+        * edge_cells (tuple): The same four edges as frozensets of cell ids
+        * neighbors (tuple): For every in bounds cell id, the in bounds cell ids above, below, right and left of it, in that order. None for out of bounds cells
+        * RANGE_CACHE_SIZE (int): The number of radii whose cells_within lists are kept, least recently used are dropped first
+
+    """
+    RANGE_CACHE_SIZE = 16
+
+    def __init__(self, arena_size=ARENA_SIZE, hit_radius=0.01):
+        self.arena_size = arena_size
+        self.half_arena = arena_size // 2
+        self.hit_radius = hit_radius
+        self.xy = tuple((cell % arena_size, cell // arena_size) for cell in range(arena_size * arena_size))
+        self.in_bounds = bytearray(arena_size * arena_size)
+        for y in range(arena_size):
+            row_size = y + 1 if y < self.half_arena else arena_size - y
+            for x in range(self.half_arena - row_size, self.half_arena + row_size):
+                self.in_bounds[y * arena_size + x] = 1
+        self.cells = tuple(cell for cell in range(arena_size * arena_size) if self.in_bounds[cell])
+        self.edges = self.__build_edges()
+        self.edge_sets = tuple(frozenset(edge) for edge in self.edges)
+        self.edge_cells = tuple(frozenset(y * arena_size + x for x, y in edge) for edge in self.edges)
+        self.neighbors = tuple(self.__build_neighbors(cell) if self.in_bounds[cell] else None for cell in range(arena_size * arena_size))
+        self.__range_tables = {}
+        self.__within_tables = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        # The tables never change once built and are shared by every GameMap, so copies keep using them
+        return self
+
+    def __build_edges(self):
+        half = self.half_arena
+        top = self.arena_size - 1
+        top_right = tuple((half + num, top - num) for num in range(half))
+        top_left = tuple((half - 1 - num, top - num) for num in range(half))
+        bottom_left = tuple((half - 1 - num, num) for num in range(half))
+        bottom_right = tuple((half + num, num) for num in range(half))
+        return (top_right, top_left, bottom_left, bottom_right)
+
+    def __build_neighbors(self, cell):
+        x, y = self.xy[cell]
+        candidates = [(x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)]
+        return tuple(j * self.arena_size + i for i, j in candidates if 0 <= i < self.arena_size and 0 <= j < self.arena_size and self.in_bounds[j * self.arena_size + i])
+
+    def cell_id(self, location):
+        """The cell id of an [x, y] location"""
+        return location[1] * self.arena_size + location[0]
+
+    def contains(self, location):
+        """Checks if an integer [x, y] location is inside the diamond"""
+        x, y = location
+        return 0 <= x < self.arena_size and 0 <= y < self.arena_size and self.in_bounds[int(y) * self.arena_size + int(x)] == 1
+
+    def add_range_table(self, radius):
+        """Builds the neighbor lists for a radius, if they are not built yet.
+        board_geometry does this for every attackRange and shieldRange in the config
+
+        Args:
+            radius: The radius of the search area
+
+        Returns:
+            The table, see cells_in_range_table
+
+        """
+        table = self.__range_tables.get(radius)
+        if table is None:
+            table = tuple(self.__scan_range(cell, radius) if self.in_bounds[cell] else None for cell in range(len(self.in_bounds)))
+            with self.__lock:
+                self.__range_tables[radius] = table
+        return table
+
+    def cells_in_range_table(self, radius):
+        """Gets the neighbor lists for a radius
+
+        Args:
+            radius: The radius of the search area
+
+        Returns:
+            A tuple indexed by cell id, or None if no table was built for this radius with add_range_table.
+            Entries for in bounds cells are tuples of the cell ids whose centers are closer than radius + hit_radius,
+            in the order GameMap.get_locations_in_range has always returned them. Entries for out of bounds cells are None.
+
+        """
+        return self.__range_tables.get(radius)
+
+    def cells_in_range(self, cell, radius):
+        """The cell ids in range of an in bounds cell, see cells_in_range_table.
+        Radii without a table, which are not one of the config's ranges, are scanned for this cell only"""
+        table = self.__range_tables.get(radius)
+        if table is not None:
+            return table[cell]
+        return self.__scan_range(cell, radius)
+
+    def cells_within(self, cell, radius):
+        """The cell ids whose centers are at most radius away from an in bounds cell, without the hit radius.
+        This is the test GameState.get_attackers applies to attackRange. Computed per cell the first time it is asked for
+
+        Args:
+            cell: The cell id of the center
+            radius: The radius of the search area
+
+        Returns:
+            A tuple of cell ids, in the same order as cells_in_range
+
+        """
+        table = self.__cached(self.__within_tables, radius)
+        if table is None:
+            table = [None] * len(self.in_bounds)
+            self.__store(self.__within_tables, radius, table)
+        cells = table[cell]
+        if cells is None:
+            x, y = self.xy[cell]
+            xy = self.xy
+            cells = tuple(other for other in self.cells_in_range(cell, radius) if math.sqrt((x - xy[other][0]) ** 2 + (y - xy[other][1]) ** 2) <= radius)
+            table[cell] = cells
+        return cells
+
+    def __cached(self, tables, radius):
+        with self.__lock:
+            table = tables.get(radius)
+            if table is not None:
+                tables.move_to_end(radius)
+            return table
+
+    def __store(self, tables, radius, table):
+        # Callers can ask for any float radius, so only the most recently used radii are kept
+        with self.__lock:
+            tables[radius] = table
+            tables.move_to_end(radius)
+            if len(tables) > self.RANGE_CACHE_SIZE:
+                tables.popitem(last=False)
+
+    def __scan_range(self, cell, radius):
+        x, y = self.xy[cell]
+        search_radius = math.ceil(radius)
+        limit = radius + self.hit_radius
+        cells = []
+        for i in range(int(x - search_radius), int(x + search_radius + 1)):
+            for j in range(int(y - search_radius), int(y + search_radius + 1)):
+                if 0 <= i < self.arena_size and 0 <= j < self.arena_size and self.in_bounds[j * self.arena_size + i] and math.sqrt((x - i) ** 2 + (y - j) ** 2) < limit:
+                    cells.append(j * self.arena_size + i)
+        return tuple(cells)
@@ -1,24 +1,196 @@
-import heapq
-import math
 import sys
-import queue
+from array import array
+from collections import OrderedDict, deque
 from .util import debug_write
 
-class Node:
-    """A pathfinding node
+# Maps each byte of GameMap.structure_types to 1 if a structure is there and 0 if the tile is empty (-1)
+_BLOCKED_TABLE = bytes(0 if value == 0xff else 1 for value in range(256))
+
+
+def blocked_mask(structure_types):
+    """Gets the tiles structures are standing on
+
+    Args:
+        structure_types: An array('b') of unit type indices by cell id with -1 for empty tiles, like GameMap.structure_types
+
+    Returns:
+        A bytes object indexed by cell id, 1 where a structure blocks pathing and 0 elsewhere.
+        Two maps with structures on the same tiles give equal masks, so it can be used as a dictionary key.
+
+    """
+    return structure_types.tobytes().translate(_BLOCKED_TABLE)
+
+
+class PathField:
+    """The distances units follow to reach one set of end points on one board
+
+    Tiles that can reach the end points hold their distance to the nearest end point. A tile in a pocket
+    that is cut off from the end points holds its distance to the pocket's best self destruct tile instead.
+    Pockets are only resolved the first time a path starts inside them.
 
     Attributes :
-        * visited_idealness (bool): Have we visited this node during the idealness search step?
-        * visited_validate (bool): Have we visited this node during the validation step?
-        * blocked (bool): Is there a structures at this node's location
-        * pathlength: The distance between this node and the target location
+        * geometry (:obj: BoardGeometry): The board tables this field was built on
+        * blocked (bytes): 1 for every cell id holding a structure
+        * end_points (tuple): The (x, y) end points units are trying to reach
+        * end_cells (frozenset): The cell ids of end_points that are inside the arena
+        * direction (tuple): The (x, y) direction of the target edge, see ShortestPathFinder._get_direction_from_endpoints
+        * pathlength (array): The distance from every cell id to its target, -1 if it is not known yet
 
     """
-    def __init__(self):
-        self.visited_idealness = False
-        self.visited_validate = False
-        self.blocked = False
-        self.pathlength = -1
+    def __init__(self, geometry, blocked, end_points):
+        self.geometry = geometry
+        self.blocked = blocked
+        self.end_points = end_points
+        self.end_cells = frozenset(geometry.cell_id(point) for point in end_points if geometry.contains(point))
+        x, y = end_points[0]
+        self.direction = (-1 if x < geometry.half_arena else 1, -1 if y < geometry.half_arena else 1)
+        self.pathlength = array('h', [-1]) * len(geometry.in_bounds)
+        self.__search(list(self.end_cells))
+
+    def __search(self, targets):
+        """Breadth first search outwards from targets, setting the pathlength of every tile it reaches"""
+        pathlength = self.pathlength
+        blocked = self.blocked
+        neighbors = self.geometry.neighbors
+        current = deque()
+        for cell in targets:
+            pathlength[cell] = 0
+            if not blocked[cell]:
+                current.append(cell)
+        while current:
+            cell = current.popleft()
+            next_length = pathlength[cell] + 1
+            for neighbor in neighbors[cell]:
+                if pathlength[neighbor] == -1 and not blocked[neighbor]:
+                    pathlength[neighbor] = next_length
+                    current.append(neighbor)
+
+    def _get_idealness(self, cell):
+        """How much a unit wants to end up on a tile. End points are perfectly ideal, otherwise tiles further towards the target edge are better"""
+        if cell in self.end_cells:
+            return sys.maxsize
+        x, y = self.geometry.xy[cell]
+        last = self.geometry.arena_size - 1
+        idealness = self.geometry.arena_size * (y if self.direction[1] == 1 else last - y)
+        idealness += x if self.direction[0] == 1 else last - x
+        return idealness
+
+    def _resolve_pocket(self, start):
+        """Points every tile in a pocket that cannot reach the end points at the pocket's most ideal tile"""
+        blocked = self.blocked
+        neighbors = self.geometry.neighbors
+        seen = {start}
+        current = deque([start])
+        most_ideal = start
+        best_idealness = self._get_idealness(start)
+        while current:
+            cell = current.popleft()
+            for neighbor in neighbors[cell]:
+                if neighbor in seen or blocked[neighbor]:
+                    continue
+                seen.add(neighbor)
+                current.append(neighbor)
+                idealness = self._get_idealness(neighbor)
+                if idealness > best_idealness:
+                    best_idealness = idealness
+                    most_ideal = neighbor
+        self.__search([most_ideal])
+
+    def next_step(self, cell, move_direction=0):
+        """Chooses the tile a unit moves to next
+
+        Args:
+            cell: The cell id of the unblocked, in bounds tile the unit is on
+            move_direction: The direction of the unit's previous move, ShortestPathFinder.HORIZONTAL or VERTICAL, or 0 if it has not moved yet
+
+        Returns:
+            The cell id of the next tile, or cell itself if the unit has reached its target
+
+        """
+        pathlength = self.pathlength
+        if pathlength[cell] == -1:
+            self._resolve_pocket(cell)
+        blocked = self.blocked
+        xy = self.geometry.xy
+        ideal_neighbor = cell
+        best_pathlength = pathlength[cell]
+        if best_pathlength == 0:
+            return cell
+        for neighbor in self.geometry.neighbors[cell]:
+            if blocked[neighbor]:
+                continue
+            current_pathlength = pathlength[neighbor]
+            if current_pathlength > best_pathlength:
+                continue
+            if current_pathlength == best_pathlength and not _better_direction(xy[cell], xy[neighbor], xy[ideal_neighbor], move_direction, self.direction):
+                continue
+            ideal_neighbor = neighbor
+            best_pathlength = current_pathlength
+        return ideal_neighbor
+
+    def path(self, start):
+        """Walks from a tile to its target
+
+        Args:
+            start: The cell id of an unblocked, in bounds tile
+
+        Returns:
+            A list of the cell ids a unit starting at start steps through, start included
+
+        """
+        if self.pathlength[start] == -1:
+            self._resolve_pocket(start)
+
+        pathlength = self.pathlength
+        xy = self.geometry.xy
+        path = [start]
+        current = start
+        move_direction = 0
+        while pathlength[current] != 0:
+            next_cell = self.next_step(current, move_direction)
+            if xy[current][0] == xy[next_cell][0]:
+                move_direction = ShortestPathFinder.VERTICAL
+            else:
+                move_direction = ShortestPathFinder.HORIZONTAL
+            path.append(next_cell)
+            current = next_cell
+        return path
+
+
+def _better_direction(prev_tile, new_tile, prev_best, previous_move_direction, direction):
+    """Compare two tiles and return True if the unit would rather move to the new one
+
+    """
+    #True if we are moving in a different direction than prev move and prev is not
+    #If we previously moved horizontal, and now one of our options has a different x position then the other (the two options are not up/down)
+    if previous_move_direction == ShortestPathFinder.HORIZONTAL and not new_tile[0] == prev_best[0]:
+        #We want to go up now. If we have not changed our y, we are not going up
+        if prev_tile[1] == new_tile[1]:
+            return False
+        return True
+    if previous_move_direction == ShortestPathFinder.VERTICAL and not new_tile[1] == prev_best[1]:
+        if prev_tile[0] == new_tile[0]:
+            return False
+        return True
+    if previous_move_direction == 0:
+        if prev_tile[1] == new_tile[1]:
+            return False
+        return True
+
+    #To make it here, both moves are on the same axis
+    if new_tile[1] == prev_best[1]: #If they both moved horizontal...
+        if direction[0] == 1 and new_tile[0] > prev_best[0]: #If we moved right and right is our direction, we moved towards our direction
+            return True
+        if direction[0] == -1 and new_tile[0] < prev_best[0]: #If we moved left and left is our direction, we moved towards our direction
+            return True
+        return False
+    if new_tile[0] == prev_best[0]: #If they both moved vertical...
+        if direction[1] == 1 and new_tile[1] > prev_best[1]: #If we moved up and up is our direction, we moved towards our direction
+            return True
+        if direction[1] == -1 and new_tile[1] < prev_best[1]: #If we moved down and down is our direction, we moved towards our direction
+            return True
+        return False
+    return True
 
 """
 This class helps with pathfinding. We guarantee the results will
@@ -28,18 +200,26 @@ code to maximise time efficiency
 class ShortestPathFinder:
     """Handles pathfinding
 
+    Distance fields are cached by the tiles structures stand on and the end points being targeted, so repeated
+    queries against a board that has not changed only walk the path. The cache remembers the last FIELD_CACHE_SIZE fields.
+
     Attributes :
         * HORIZONTAL (int): A constant representing a horizontal movement
         * VERTICAL (int): A constant representing a vertical movement
+        * FIELD_CACHE_SIZE (int): The number of PathFields kept between queries
 
-        * game_state (:obj: GameState): The current gamestate
-        * game_map (:obj: GameMap): The current gamemap
+        * game_state (:obj: GameState): The gamestate of the most recent query
+        * field (:obj: PathField): The field used by the most recent query
 
     """
+    HORIZONTAL = 1
+    VERTICAL = 2
+    FIELD_CACHE_SIZE = 32
+
     def __init__(self):
-        self.HORIZONTAL = 1
-        self.VERTICAL = 2
         self.initialized = False
+        self.field = None
+        self.__fields = OrderedDict()
 
     def initialize_map(self, game_state):
         """Initializes the map
@@ -47,261 +227,76 @@ class ShortestPathFinder:
         Args:
             game_state: A GameState object representing the gamestate we want to traverse
         """
-        #Initialize map 
         self.initialized = True
         self.game_state = game_state
-        self.game_map = [[Node() for x in range(self.game_state.ARENA_SIZE)] for y in range(self.game_state.ARENA_SIZE)]
 
-    def navigate_multiple_endpoints(self, start_point, end_points, game_state):
-        """Finds the path a unit would take to reach a set of endpoints
+    def get_field(self, end_points, game_state):
+        """Gets the PathField for a set of end points on the current board, reusing a cached one if the structures have not moved
 
         Args:
-            * start_point: The starting location of the unit
             * end_points: The end points of the unit, should be a list of edge locations
             * game_state: The current game state
 
         Returns:
-            The path a unit at start_point would take when trying to reach end_points given the current game state.
-            Note that this path can change if a tower is destroyed during pathing, or if you or your enemy places structures.
+            A PathField
 
         """
-        if game_state.contains_stationary_unit(start_point):
-            return
-
-        #Initialize map 
         self.initialize_map(game_state)
-        #Fill in walls
-        for location in self.game_state.game_map:
-            if self.game_state.contains_stationary_unit(location):
-                self.game_map[location[0]][location[1]].blocked = True
-        #Do pathfinding
-        ideal_endpoints = self._idealness_search(start_point, end_points)
-        self._validate(ideal_endpoints, end_points)
-        return self._get_path(start_point, end_points)
-
-    def _idealness_search(self, start, end_points):
-        """
-        Finds the most ideal tile in our 'pocket' of pathable space. 
-        The edge if it is available, or the best self destruct location otherwise
-        """
-        current = queue.Queue()
-        current.put(start)
-        best_idealness = self._get_idealness(start, end_points)
-        self.game_map[start[0]][start[1]].visited_idealness = True
-        most_ideal = start
-
-        while not current.empty():
-            search_location = current.get()
-            for neighbor in self._get_neighbors(search_location):
-                if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
-                    continue
-
-                x, y = neighbor
-                current_idealness = self._get_idealness(neighbor, end_points)
-
-                if current_idealness > best_idealness:
-                    best_idealness = current_idealness
-                    most_ideal = neighbor
-
-                if not self.game_map[x][y].visited_idealness and not self.game_map[x][y].blocked:
-                    self.game_map[x][y].visited_idealness = True
-                    current.put(neighbor)
-
-        return most_ideal
+        game_map = game_state.game_map
+        blocked = blocked_mask(game_map.structure_types)
+        end_points = tuple((int(x), int(y)) for x, y in end_points)
+        key = (blocked, end_points)
+        field = self.__fields.get(key)
+        if field is None:
+            field = PathField(game_map.geometry, blocked, end_points)
+            self.__fields[key] = field
+            if len(self.__fields) > self.FIELD_CACHE_SIZE:
+                self.__fields.popitem(last=False)
+        else:
+            self.__fields.move_to_end(key)
+        self.field = field
+        return field
 
-    def _get_neighbors(self, location):
-        """Get the locations adjacent to a location
-        """
-        x, y = location
-        return [[x, y + 1], [x, y - 1], [x + 1, y], [x - 1, y]]
+    def clear_cache(self):
+        """Forgets every cached PathField"""
+        self.__fields.clear()
+        self.field = None
 
-    def _get_direction_from_endpoints(self, end_points):
-        """Prints a message to the games debug output
+    def navigate_multiple_endpoints(self, start_point, end_points, game_state):
+        """Finds the path a unit would take to reach a set of endpoints
 
         Args:
-            * end_points: A set of endpoints, should be an edge 
-
-        Returns:
-            A direction [x,y] representing the edge. For example, [1,1] for the top right and [-1, 1] for the top left
-
-        """
-        point = end_points[0]
-        x, y = point
-        direction = [1, 1]
-        if x < self.game_state.HALF_ARENA:
-           direction[0] = -1
-        if y < self.game_state.HALF_ARENA:
-            direction[1] = -1
-        return direction
-
-    def _get_idealness(self, location, end_points):
-        """Get the idealness of a tile, the reachable tile the unit most wants to path to.
-        Better self destruct locations are more ideal. The endpoints are perfectly ideal. 
+            * start_point: The starting location of the unit
+            * end_points: The end points of the unit, should be a list of edge locations
+            * game_state: The current game state
 
         Returns:
-            A location the unit will attempt to reach
-        """
-        if location in end_points:
-            return sys.maxsize
-
-        direction = self._get_direction_from_endpoints(end_points)
-
-        idealness = 0
-        if direction[1] == 1:
-            idealness += 28 * location[1]
-        else: 
-            idealness += 28 * (27 - location[1])
-        if direction[0] == 1:
-            idealness += location[0]
-        else: 
-            idealness += (27 - location[0])
-
-        return idealness
-
-    def _validate(self, ideal_tile, end_points):
-        """Breadth first search of the grid, setting the pathlengths of each node
-
-        """
-        #VALDIATION
-        #Add our most ideal tiles to current
-        current = queue.Queue()
-        if ideal_tile in end_points:
-            for location in end_points:
-               current.put(location)
-               #Set current pathlength to 0
-               self.game_map[location[0]][location[1]].pathlength = 0
-               self.game_map[location[0]][location[1]].visited_validate = True
-        else:
-            current.put(ideal_tile)
-            self.game_map[ideal_tile[0]][ideal_tile[1]].pathlength = 0
-            self.game_map[ideal_tile[0]][ideal_tile[1]].visited_validate = True
-
-        #While current is not empty
-        while not current.empty():
-            current_location = current.get()
-            current_node = self.game_map[current_location[0]][current_location[1]]
-            for neighbor in self._get_neighbors(current_location):
-                if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
-                    continue
-
-                neighbor_node = self.game_map[neighbor[0]][neighbor[1]]
-                if not neighbor_node.visited_validate and not current_node.blocked:
-                    neighbor_node.pathlength = current_node.pathlength + 1
-                    neighbor_node.visited_validate = True
-                    current.put(neighbor)
-
-        #debug_write("Print after validate")
-        #self.print_map()
-        return
-
-    def _get_path(self, start_point, end_points):
-        """Once all nodes are validated, and a target is found, the unit can path to its target
-
-        """
-        #GET THE PATH
-        path = [start_point]
-        current = start_point
-        move_direction = 0
-
-        while not self.game_map[current[0]][current[1]].pathlength == 0:
-            #debug_write("current tile {} has cost {}".format(current, self.game_map[current[0]][current[1]].pathlength))
-            next_move = self._choose_next_move(current, move_direction, end_points)
-            #debug_write(next_move)
+            The path a unit at start_point would take when trying to reach end_points given the current game state.
+            Note that this path can change if a tower is destroyed during pathing, or if you or your enemy places structures.
 
-            if current[0] == next_move[0]:
-                move_direction = self.VERTICAL
-            else:
-                move_direction = self.HORIZONTAL
-            path.append(next_move)
-            current = next_move
-        
-        #debug_write(path)
-        return path
-  
-    def _choose_next_move(self, current_point, previous_move_direction, end_points):
-        """Given the current location and adjacent locations, return the best 'next step' for a given unit to take
         """
-        neighbors = self._get_neighbors(current_point)
-        #debug_write("Unit at {} previously moved {} and has these neighbors {}".format(current_point, previous_move_direction, neighbors))
-
-        ideal_neighbor = current_point
-        best_pathlength = self.game_map[current_point[0]][current_point[1]].pathlength
-        for neighbor in neighbors:
-            #debug_write("Comparing champ {} and contender {}".format(ideal_neighbor, neighbor))
-            if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
-                continue
-
-            new_best = False
-            x, y = neighbor
-            current_pathlength = self.game_map[x][y].pathlength
-
-            #Filter by pathlength
-            if current_pathlength > best_pathlength:
-                continue
-            elif current_pathlength < best_pathlength:
-                #debug_write("Contender has better pathlength at {} vs champs {}".format(current_pathlength, best_pathlength))
-                new_best = True
-
-            #Filter by direction based on prev move
-            if not new_best and not self._better_direction(current_point, neighbor, ideal_neighbor, previous_move_direction, end_points):
-                continue
-
-            ideal_neighbor = neighbor
-            best_pathlength = current_pathlength
-
-        #debug_write("Gave unit at {} new tile {}".format(current_point, ideal_neighbor))
-        return ideal_neighbor
-
-    def _better_direction(self, prev_tile, new_tile, prev_best, previous_move_direction, end_points):
-        """Compare two tiles and return True if the unit would rather move to the new one
+        if game_state.contains_stationary_unit(start_point) or not game_state.game_map.in_arena_bounds(start_point):
+            return
 
-        """
-        #True if we are moving in a different direction than prev move and prev is not
-        #If we previously moved horizontal, and now one of our options has a different x position then the other (the two options are not up/down)
-        if previous_move_direction == self.HORIZONTAL and not new_tile[0] == prev_best[0]:
-            #We want to go up now. If we have not changed our y, we are not going up
-            if prev_tile[1] == new_tile[1]:
-                return False 
-            return True
-        if previous_move_direction == self.VERTICAL and not new_tile[1] == prev_best[1]:
-            if prev_tile[0] == new_tile[0]:
-                #debug_write("contender {} has the same x coord as prev tile {} so we will keep best move {}".format(new_tile, prev_tile, prev_best))
-                return False
-            return True
-        if previous_move_direction == 0: 
-            if prev_tile[1] == new_tile[1]: 
-                return False
-            return True
-        
-        #To make it here, both moves are on the same axis 
-        direction = self._get_direction_from_endpoints(end_points)
-        if new_tile[1] == prev_best[1]: #If they both moved horizontal...
-            if direction[0] == 1 and new_tile[0] > prev_best[0]: #If we moved right and right is our direction, we moved towards our direction
-                return True 
-            if direction[0] == -1 and new_tile[0] < prev_best[0]: #If we moved left and left is our direction, we moved towards our direction
-                return True 
-            return False 
-        if new_tile[0] == prev_best[0]: #If they both moved vertical...
-            if direction[1] == 1 and new_tile[1] > prev_best[1]: #If we moved up and up is our direction, we moved towards our direction
-                return True
-            if direction[1] == -1 and new_tile[1] < prev_best[1]: #If we moved down and down is our direction, we moved towards our direction
-                return True
-            return False
-        return True
+        field = self.get_field(end_points, game_state)
+        xy = field.geometry.xy
+        cells = field.path(field.geometry.cell_id([int(start_point[0]), int(start_point[1])]))
+        return [start_point] + [list(xy[cell]) for cell in cells[1:]]
 
     def print_map(self):
-        """Prints an ASCII version of the current game map for debug purposes
+        """Prints an ASCII version of the most recently used distance field for debug purposes
 
         """
-        if not self.initialized:
-            debug_write("Attempted to print_map before pathfinder initialization. Use 'this_object.initialize_map(game_state)' to initialize the map first")
+        if not self.initialized or self.field is None:
+            debug_write("Attempted to print_map before pathfinder initialization. Find a path first so there is a map to print")
             return
 
-        for y in range(28):
-            for x in range(28):
-                node = self.game_map[x][28 - y - 1]
-                if not node.blocked and not node.pathlength == -1:
-                    self._print_justified(node.pathlength)
+        size = self.field.geometry.arena_size
+        for y in range(size):
+            for x in range(size):
+                cell = (size - y - 1) * size + x
+                if not self.field.blocked[cell] and not self.field.pathlength[cell] == -1:
+                    self._print_justified(self.field.pathlength[cell])
                 else:
                     sys.stderr.write("   ")
             debug_write("")
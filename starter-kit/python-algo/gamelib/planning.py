@@ -0,0 +1,141 @@
+import time
+from .util import debug_write
+
+
+class Deadline:
+    """A point in time a turn has to be submitted by
+
+    Attributes :
+        * start (float): The time.perf_counter() value the budget is counted from
+        * end (float): The time.perf_counter() value of the deadline
+
+    """
+    def __init__(self, budget_ms, start=None):
+        """Starts a deadline
+
+        Args:
+            budget_ms: How many milliseconds there are to spend
+            start: The time.perf_counter() value the budget is counted from, now if None
+
+        """
+        self.start = time.perf_counter() if start is None else start
+        self.end = self.start + budget_ms / 1000.0
+
+    def remaining_ms(self):
+        """The milliseconds left before the deadline, negative once it has passed"""
+        return (self.end - time.perf_counter()) * 1000.0
+
+    def elapsed_ms(self):
+        """The milliseconds spent since the budget started"""
+        return (time.perf_counter() - self.start) * 1000.0
+
+    def expired(self):
+        """True once the deadline has passed"""
+        return time.perf_counter() >= self.end
+
+    def __repr__(self):
+        return "Deadline(remaining_ms={:.1f})".format(self.remaining_ms())
+
+
+class AnytimePlanner:
+    """Tries candidate turns in priority order until time runs out, always holding a turn that is safe to submit
+
+    Each candidate is a function that spends resources on a GameState with attempt_spawn, attempt_upgrade
+    and attempt_remove. The planner gives every candidate its own copy of the turn's GameState, including
+    anything already queued on the original, scores the copy and remembers the build and deploy stacks of the
+    best one. Before anything is tried, the original GameState as it stands is the best turn.
+
+    Candidates are tried from the highest priority down, and in the order they were added for equal priorities.
+    Before starting one, the planner checks that the deadline leaves room for it, judging by the slowest
+    candidate so far, so it stops early rather than running late.
+
+    Attributes :
+        * game_state (:obj: GameState): The turn being planned
+        * score (function): Maps a GameState with a candidate applied to a number, higher is better
+        * deadline (:obj: Deadline): When planning has to stop
+        * best_name (str): The name of the best candidate so far, None while it is the original GameState
+        * best_score (float): The score of the best candidate so far
+        * evaluated (int): How many candidates have been scored
+
+    """
+    def __init__(self, game_state, score, deadline=None):
+        """Sets up a planner for a turn
+
+        Args:
+            game_state: The GameState of this turn. Nothing is changed on it until submit() is called
+            score: A function taking a GameState and returning how good it is, higher is better
+            deadline: A Deadline, game_state.deadline() if None
+
+        """
+        self.game_state = game_state
+        self.score = score
+        self.deadline = game_state.deadline() if deadline is None else deadline
+        self.best_name = None
+        self.best_score = None
+        self.evaluated = 0
+        self.__candidates = []
+        self.__best_stacks = (list(game_state._build_stack), list(game_state._deploy_stack))
+        self.__slowest = 0.0
+
+    def add(self, name, action, priority=0):
+        """Adds a candidate turn
+
+        Args:
+            name: A label for the candidate, reported by best_name
+            action: A function taking a GameState and queueing the candidate's builds and deploys on it
+            priority: Candidates with a higher priority are tried first
+
+        """
+        self.__candidates.append((-priority, len(self.__candidates), name, action))
+
+    def run(self):
+        """Scores candidates until they are all done or the deadline is too close to start another
+
+        Returns:
+            The name of the best candidate, or None if none beat the original GameState
+
+        """
+        if self.best_score is None:
+            self.best_score = self.__timed_score(None, None)
+        candidates = sorted(self.__candidates)
+        self.__candidates = []
+        for index, (_, _, name, action) in enumerate(candidates):
+            if self.deadline.remaining_ms() < self.__slowest:
+                self.__candidates = candidates[index:]
+                break
+            score = self.__timed_score(name, action)
+            if score is not None and (self.best_score is None or score > self.best_score):
+                self.best_score = score
+                self.best_name = name
+        return self.best_name
+
+    def __timed_score(self, name, action):
+        start = time.perf_counter()
+        trial = self.game_state.fork()
+        try:
+            if action is not None:
+                action(trial)
+            score = self.score(trial)
+        except Exception as error:
+            debug_write("Candidate {} failed and was skipped: {}".format(name, error))
+            score = None
+        self.__slowest = max(self.__slowest, (time.perf_counter() - start) * 1000.0)
+        self.evaluated += 1
+        if score is not None and (self.best_score is None or score > self.best_score):
+            self.__best_stacks = (list(trial._build_stack), list(trial._deploy_stack))
+        return score
+
+    def pending(self):
+        """The names of the candidates the deadline cut off"""
+        return [name for _, _, name, _ in sorted(self.__candidates)]
+
+    def best_stacks(self):
+        """The build and deploy stacks of the best candidate so far, as lists of (unit_type, x, y)"""
+        return list(self.__best_stacks[0]), list(self.__best_stacks[1])
+
+    def submit(self):
+        """Queues the best candidate's turn on the GameState and submits it"""
+        build_stack, deploy_stack = self.best_stacks()
+        self.game_state._build_stack = build_stack
+        self.game_state._deploy_stack = deploy_stack
+        self.game_state.submit_turn()
@@ -0,0 +1,72 @@
+import json
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    try:
+        import ujson
+        loads = ujson.loads
+    except ImportError:
+        loads = json.loads
+
+CONFIG = -1
+TURN = 0
+ACTION_FRAME = 1
+GAME_OVER = 2
+UNKNOWN = -2
+
+TURN_INFO_KEY = '"turnInfo":['
+
+
+class Message(str):
+    """A line received from the game engine, only decoded the first time its contents are needed
+
+    A Message is the original string, so it can be used anywhere the raw line was used before.
+    GameState reads Message.data directly instead of parsing the string again.
+
+    Attributes :
+        * state_type (int): CONFIG, TURN, ACTION_FRAME, GAME_OVER or UNKNOWN
+
+    """
+    def __new__(cls, line, state_type):
+        message = str.__new__(cls, line)
+        message.state_type = state_type
+        message._data = None
+        return message
+
+    @property
+    def data(self):
+        """The decoded JSON of the message"""
+        if self._data is None:
+            self._data = loads(str(self))
+        return self._data
+
+
+def read_message(line):
+    """Works out what kind of message a line from the game engine is without decoding it
+
+    Game states are the only messages with a turnInfo key, and the state type is the first number in it.
+    The engine writes turnInfo near the start of the line, so it is found without reading the whole string.
+
+    Args:
+        line: A line received from the game engine
+
+    Returns:
+        A Message wrapping the line
+
+    """
+    index = line.find(TURN_INFO_KEY)
+    if index >= 0:
+        start = index + len(TURN_INFO_KEY)
+        if line[start:start + 1].isdigit() and line[start + 1:start + 2] in (",", "]"):
+            return Message(line, int(line[start]))
+        message = Message(line, UNKNOWN)
+        try:
+            message.state_type = int(message.data["turnInfo"][0])
+        except (ValueError, KeyError, IndexError, TypeError):
+            pass
+        return message
+    if "replaySave" in line:
+        return Message(line, CONFIG)
+    return Message(line, UNKNOWN)
@@ -0,0 +1,556 @@
+import contextlib
+import json
+import math
+import os
+import random
+import time
+import traceback
+
+from .game_state import GameState
+from .geometry import board_geometry
+from .protocol import Message, TURN, ACTION_FRAME
+from .simulator import Simulator, BREACHED, SELF_DESTRUCTED, DESTROYED
+from .util import set_command_receiver, command_receiver
+
+STRUCTURE_INDEXES = (0, 1, 2)
+MOBILE_INDEXES = (3, 4, 5)
+REMOVE_INDEX = 6
+UPGRADE_INDEX = 7
+EVENT_TYPES = ("selfDestruct", "breach", "damage", "shield", "move", "spawn", "death", "attack", "melee")
+MAX_TURNS = 100
+
+
+def empty_events():
+    """A frame's events with nothing in them"""
+    return dict((event_type, []) for event_type in EVENT_TYPES)
+
+
+class _Structure:
+    __slots__ = ("type_index", "player_index", "x", "y", "health", "unit_id", "upgraded", "removal_id")
+
+    def __init__(self, type_index, player_index, x, y, health, unit_id):
+        self.type_index = type_index
+        self.player_index = player_index
+        self.x = x
+        self.y = y
+        self.health = health
+        self.unit_id = unit_id
+        self.upgraded = False
+        self.removal_id = -1
+
+
+class GameResult:
+    """How a game played by a Referee ended
+
+    Attributes :
+        * winner (int): The winning player, 1 or 2
+        * turns (int): The number of turns played
+        * frames (int): The number of action frames played
+        * health (list): The final health of player 1 and player 2
+        * crashed (list): Whether each player raised an exception
+        * errors (list): The traceback of each player's exception, or None
+        * end_stats (dict): The endStats a replay of the game ends with
+        * replay_path (str): The replay file written, or None
+
+    """
+    def __init__(self, winner, turns, frames, health, crashed, errors, end_stats, replay_path):
+        self.winner = winner
+        self.turns = turns
+        self.frames = frames
+        self.health = health
+        self.crashed = crashed
+        self.errors = errors
+        self.end_stats = end_stats
+        self.replay_path = replay_path
+
+    def __repr__(self):
+        return "GameResult(winner={}, turns={}, frames={}, health={}, crashed={})".format(self.winner, self.turns, self.frames, self.health, self.crashed)
+
+
+class Referee:
+    """Plays a game between two algos in this process, in place of the engine
+
+    Each turn both algos get the turn's game state as a protocol.Message with its data already decoded, as AlgoCore would pass it,
+    and GameState.submit_turn hands the referee its build and deploy stacks through util.set_command_receiver.
+    Nothing is written to or read from a pipe. The action phase is played out with Simulator.
+
+    The rules follow the engine: builds are applied player 1 first then player 2, followed by both players'
+    deploys, and commands that are invalid or unaffordable are skipped. Removals happen at the end of the
+    action phase and refund refundPercentage of the structure's cost, scaled by its remaining health.
+    The game ends when a player's health reaches 0 or after max_turns turns, when the player with more health wins,
+    and if health is equal the one that spent less time on its turns. An algo that raises an exception loses.
+
+    Replays are written in the engine's format. Action frames carry the unit tables and the spawn, move, breach,
+    selfDestruct and death events, with self destructs not listing what they hit. Simulator does not report
+    individual attacks or shields, so those lists are empty.
+
+    Attributes :
+        * config (JSON): The game config both algos are given
+        * algos (list): The two AlgoCore instances playing, player 1's first. Set once play() starts
+        * names (list): The names of the two players, used in endStats
+        * replay_path (str): Where to write a replay of the game, or None
+        * action_frames (bool): Whether on_action_frame and precompute are given the action phase's frames.
+            Each frame is then encoded to JSON once per player, since that is what on_action_frame expects
+        * quiet (bool): Whether to silence what the algos print to stdout and stderr
+        * max_turns (int): The number of turns after which the game ends
+
+    """
+    def __init__(self, config, algo1, algo2, replay_path=None, action_frames=False, quiet=True, max_turns=MAX_TURNS, seed=None, names=None):
+        """Sets up a game
+
+        Args:
+            config (JSON): The game config
+            algo1: Player 1, an AlgoCore subclass or instance. Classes are instantiated when play() starts
+            algo2: Player 2, like algo1
+            replay_path: Where to write a replay, or None for no replay
+            action_frames: Whether to give the algos the action phase's frames
+            quiet: Whether to silence the algos' output
+            max_turns: The number of turns after which the game ends
+            seed: Seeds the random module before the algos are made, so a game can be repeated
+            names: The names of the players, the algos' class names if None
+
+        """
+        self.config = config
+        self.algos = None
+        self.names = list(names) if names is not None else [self.__name(algo1), self.__name(algo2)]
+        self.replay_path = replay_path
+        self.action_frames = action_frames
+        self.quiet = quiet
+        self.max_turns = max_turns
+        self.__players = (algo1, algo2)
+        self.__seed = seed
+
+        unit_information = config["unitInformation"]
+        resources = config["resources"]
+        self.__unit_information = unit_information
+        self.__resources = resources
+        self.__type_index = dict((unit_info.get("shorthand"), index) for index, unit_info in enumerate(unit_information))
+        self.__geometry = board_geometry(config)
+        self.__size = self.__geometry.arena_size
+        self.__half = self.__geometry.half_arena
+        edge_cells = self.__geometry.edge_cells
+        self.__deploy_cells = (edge_cells[2] | edge_cells[3], edge_cells[0] | edge_cells[1])
+
+        self.__health = [float(resources["startingHP"])] * 2
+        self.__sp = [float(resources["startingCores"])] * 2
+        self.__mp = [float(resources["startingBits"])] * 2
+        self.__turn_ms = [0, 0]
+        self.__total_ms = [0.0, 0.0]
+        self.__points = [0.0, 0.0]
+        self.__spent = [[0.0, 0.0], [0.0, 0.0]]
+        self.__spoiled = [0.0, 0.0]
+        self.__destroyed = [0.0, 0.0]
+        self.__crashed = [False, False]
+        self.__errors = [None, None]
+        self.__structures = {}
+        self.__next_id = 1
+        self.__global_frame = 0
+        self.__frames_played = 0
+        self.__replay = None
+        self.__last_units = []
+
+    @staticmethod
+    def __name(algo):
+        return algo.__name__ if isinstance(algo, type) else type(algo).__name__
+
+    def play(self):
+        """Plays the game through
+
+        Returns:
+            A GameResult
+
+        """
+        started = time.perf_counter()
+        receiver = command_receiver()
+        with contextlib.ExitStack() as stack:
+            if self.quiet:
+                devnull = stack.enter_context(open(os.devnull, "w"))
+                stack.enter_context(contextlib.redirect_stdout(devnull))
+                stack.enter_context(contextlib.redirect_stderr(devnull))
+            if self.replay_path is not None:
+                self.__replay = stack.enter_context(open(self.replay_path, "w"))
+                self.__replay.write("\n" + json.dumps(self.config, separators=(",", ":")) + "\n")
+            try:
+                if self.__seed is not None:
+                    random.seed(self.__seed)
+                self.algos = [player() if isinstance(player, type) else player for player in self.__players]
+                for player_index in (0, 1):
+                    self.__call(player_index, "on_game_start", self.config)
+                turn, frame_index, game_over = self.__play_turns()
+            finally:
+                set_command_receiver(receiver)
+                for algo in self.algos or []:
+                    worker = getattr(algo, "_precompute_worker", None)
+                    if worker is not None:
+                        worker.stop()
+            return self.__finish(turn, frame_index, game_over, started)
+
+    def __play_turns(self):
+        turn = 0
+        while True:
+            stacks = [self.__take_turn(player_index, turn) for player_index in (0, 1)]
+            spawns = empty_events()
+            mobiles = self.__apply_commands(stacks, spawns["spawn"])
+            frame_index, game_over = self.__action_phase(turn, spawns, mobiles)
+            if game_over or any(self.__crashed):
+                return turn, frame_index, True
+            if turn + 1 >= self.max_turns:
+                return turn + 1, frame_index, False
+            self.__end_turn(turn + 1)
+            turn += 1
+
+    def __call(self, player_index, method, *args):
+        """Calls a method of an algo, recording the exception if it raises one"""
+        try:
+            getattr(self.algos[player_index], method)(*args)
+            return True
+        except Exception:
+            self.__crashed[player_index] = True
+            self.__errors[player_index] = traceback.format_exc()
+            return False
+
+    def __take_turn(self, player_index, turn):
+        turn_info = [0, turn, -1, self.__global_frame]
+        if player_index == 0:
+            self.__write(self.__frame(turn_info, self.__board_units(), empty_events(), False))
+        if self.__crashed[player_index]:
+            return [], []
+        frame = self.__frame(turn_info, self.__board_units(), empty_events(), player_index == 1)
+        state = Message(json.dumps(frame, separators=(",", ":")), TURN)
+        state._data = frame
+        algo = self.algos[player_index]
+        received = []
+        set_command_receiver(received.append)
+        started = time.perf_counter()
+        worker = getattr(algo, "_precompute_worker", None)
+        if worker is not None:
+            algo.precomputed = worker.collect(algo._precompute_wait_ms)
+        finished = self.__call(player_index, "on_turn", state)
+        set_command_receiver(None)
+        elapsed = (time.perf_counter() - started) * 1000.0
+        self.__turn_ms[player_index] = int(elapsed)
+        self.__total_ms[player_index] += elapsed
+        if not finished:
+            return [], []
+        stacks = []
+        for command in received[:2]:
+            if isinstance(command, str):
+                try:
+                    command = json.loads(command)
+                except ValueError:
+                    command = []
+            stacks.append(command if isinstance(command, (list, tuple)) else [])
+        stacks.extend([] for _ in range(2 - len(stacks)))
+        return stacks
+
+    def __apply_commands(self, stacks, spawns):
+        """Applies both players' builds and then their deploys, returning the mobile units deployed"""
+        for player_index in (0, 1):
+            for command in stacks[player_index][0]:
+                parsed = self.__parse_command(player_index, command)
+                if parsed is not None:
+                    self.__build(player_index, parsed, spawns)
+        mobiles = []
+        for player_index in (0, 1):
+            for command in stacks[player_index][1]:
+                parsed = self.__parse_command(player_index, command)
+                if parsed is not None:
+                    self.__deploy(player_index, parsed, spawns, mobiles)
+        return mobiles
+
+    def __parse_command(self, player_index, command):
+        try:
+            type_index = self.__type_index[command[0]]
+            x, y = int(command[1]), int(command[2])
+        except (KeyError, IndexError, TypeError, ValueError):
+            return None
+        if player_index == 1:
+            # Player 2 sees the board upside down
+            x, y = self.__size - 1 - x, self.__size - 1 - y
+        if not self.__geometry.contains([x, y]):
+            return None
+        return type_index, x, y
+
+    def __pay(self, player_index, unit_info, fallback=None):
+        fallback = fallback or {}
+        costs = (unit_info.get("cost1", fallback.get("cost1", 0)), unit_info.get("cost2", fallback.get("cost2", 0)))
+        if self.__sp[player_index] < costs[0] - 1e-9 or self.__mp[player_index] < costs[1] - 1e-9:
+            return False
+        self.__sp[player_index] -= costs[0]
+        self.__mp[player_index] -= costs[1]
+        self.__spent[player_index][0] += costs[0]
+        self.__spent[player_index][1] += costs[1]
+        return True
+
+    def __new_id(self):
+        unit_id = self.__next_id
+        self.__next_id += 1
+        return unit_id
+
+    def __build(self, player_index, parsed, spawns):
+        type_index, x, y = parsed
+        if (y < self.__half) != (player_index == 0):
+            return
+        cell = self.__geometry.cell_id([x, y])
+        structure = self.__structures.get(cell)
+        unit_info = self.__unit_information[type_index]
+        if type_index in STRUCTURE_INDEXES:
+            if structure is not None or not self.__pay(player_index, unit_info):
+                return
+            structure = _Structure(type_index, player_index, x, y, float(unit_info.get("startHealth", 0)), self.__new_id())
+            self.__structures[cell] = structure
+            unit_id = structure.unit_id
+        elif type_index == UPGRADE_INDEX:
+            if structure is None or structure.player_index != player_index or structure.upgraded:
+                return
+            base = self.__unit_information[structure.type_index]
+            upgrade = base.get("upgrade")
+            if upgrade is None or not self.__pay(player_index, upgrade, base):
+                return
+            # The engine gives the upgraded structure a new id and the upgrade's extra startHealth
+            structure.upgraded = True
+            structure.unit_id = unit_id = self.__new_id()
+            structure.health += upgrade.get("startHealth", base.get("startHealth", 0)) - base.get("startHealth", 0)
+        elif type_index == REMOVE_INDEX:
+            if structure is None or structure.player_index != player_index or structure.removal_id >= 0:
+                return
+            structure.removal_id = unit_id = self.__new_id()
+        else:
+            return
+        spawns.append([[x, y], type_index, str(unit_id), player_index + 1])
+
+    def __deploy(self, player_index, parsed, spawns, mobiles):
+        type_index, x, y = parsed
+        cell = self.__geometry.cell_id([x, y])
+        if type_index not in MOBILE_INDEXES or cell not in self.__deploy_cells[player_index] or cell in self.__structures:
+            return
+        unit_info = self.__unit_information[type_index]
+        if not self.__pay(player_index, unit_info):
+            return
+        unit_id = self.__new_id()
+        mobiles.append((unit_info.get("shorthand"), [x, y], player_index, unit_id))
+        spawns.append([[x, y], type_index, str(unit_id), player_index + 1])
+
+    def __action_phase(self, turn, spawns, mobiles):
+        """Plays out the action phase, returning the index of its last frame and whether the game ended"""
+        game_state = GameState.from_dict(self.config, self.__frame([ACTION_FRAME, turn, 0, 0], self.__board_units(), empty_events(), False))
+        simulator = Simulator(game_state)
+        for unit_type, location, player_index, unit_id in mobiles:
+            simulator.add_unit(unit_type, location, player_index, unit_id=unit_id)
+        start_health = list(self.__health)
+        start_sp = list(self.__sp)
+        recording = self.__replay is not None or self.action_frames
+        events = spawns
+        frame_index = 0
+        while True:
+            if recording:
+                before = [(unit.x, unit.y) for unit in simulator.mobile_units]
+            running = simulator.step() and simulator.frame < Simulator.MAX_FRAMES
+            for player_index in (0, 1):
+                self.__health[player_index] = start_health[player_index] + simulator.health_delta[player_index]
+                self.__sp[player_index] = start_sp[player_index] + simulator.sp_delta[player_index]
+            if recording:
+                self.__record_events(simulator, frame_index, before, events)
+                self.__send_frame([ACTION_FRAME, turn, frame_index, self.__global_frame], self.__simulated_units(simulator), events)
+            self.__frames_played += 1
+            if not running:
+                break
+            frame_index += 1
+            events = empty_events()
+
+        for player_index in (0, 1):
+            self.__points[player_index] -= simulator.health_delta[1 - player_index]
+        for unit in simulator.mobile_units:
+            if unit.outcome == DESTROYED:
+                self.__destroyed[unit.player_index] += self.__unit_information[unit.type_index].get("cost2", 0)
+        for unit in simulator.structures:
+            if unit.outcome is not None:
+                del self.__structures[unit.cell]
+            else:
+                self.__structures[unit.cell].health = unit.health
+        return frame_index, simulator.game_over
+
+    def __record_events(self, simulator, frame_index, before, events):
+        for index, unit in enumerate(simulator.mobile_units):
+            if index < len(before) and before[index] != (unit.x, unit.y):
+                events["move"].append([list(before[index]), [unit.x, unit.y], [0, 0], unit.type_index, str(unit.unit_id), unit.player_index + 1])
+        for frame, location, unit in simulator.breaches:
+            if frame == frame_index:
+                events["breach"].append([location, unit._stats["breach_damage"], unit.type_index, str(unit.unit_id), unit.player_index + 1])
+        for frame, location, unit in simulator.self_destructs:
+            if frame == frame_index:
+                events["selfDestruct"].append([location, [], unit._stats["self_destruct_damage_i"], unit.type_index, str(unit.unit_id), unit.player_index + 1])
+        for units in (simulator.structures, simulator.mobile_units):
+            for unit in units:
+                if unit.outcome_frame == frame_index and unit.outcome in (BREACHED, SELF_DESTRUCTED, DESTROYED):
+                    events["death"].append([[unit.x, unit.y], unit.type_index, str(unit.unit_id), unit.player_index + 1, False])
+
+    def __send_frame(self, turn_info, units, events):
+        self.__last_units = units
+        self.__write(self.__frame(turn_info, units, events, False))
+        if not self.action_frames:
+            return
+        for player_index, algo in enumerate(self.algos):
+            if self.__crashed[player_index]:
+                continue
+            frame = self.__frame(turn_info, units, events, player_index == 1)
+            message = Message(json.dumps(frame, separators=(",", ":")), ACTION_FRAME)
+            message._data = frame
+            self.__call(player_index, "on_action_frame", message)
+            worker = getattr(algo, "_precompute_worker", None)
+            if worker is not None:
+                worker.submit(message)
+
+    def __end_turn(self, next_turn):
+        """Removes the structures flagged for removal and hands out the next turn's resources"""
+        for cell, structure in list(self.__structures.items()):
+            if structure.removal_id < 0:
+                continue
+            base = self.__unit_information[structure.type_index]
+            upgrade = base.get("upgrade", {}) if structure.upgraded else {}
+            cost = base.get("cost1", 0) + (upgrade.get("cost1", base.get("cost1", 0)) if structure.upgraded else 0)
+            max_health = upgrade.get("startHealth", base.get("startHealth", 1))
+            self.__sp[structure.player_index] += base.get("refundPercentage", 0) * cost * max(0.0, structure.health) / max_health
+            del self.__structures[cell]
+
+        resources = self.__resources
+        gained = resources["bitsPerRound"] + resources["bitGrowthRate"] * (next_turn // resources["turnIntervalForBitSchedule"])
+        for player_index in (0, 1):
+            self.__sp[player_index] = _one_decimal(self.__sp[player_index] + resources["coresPerRound"])
+            decayed = self.__mp[player_index] * resources["bitDecayPerRound"]
+            self.__spoiled[player_index] += decayed
+            self.__mp[player_index] = min(resources["maxBits"], _one_decimal(self.__mp[player_index] + gained - decayed))
+
+    def __board_units(self):
+        """The structures on the board as (type_index, player_index, x, y, health, unit_id) tuples, with their
+        upgrade and removal markers"""
+        units = []
+        markers = []
+        for structure in self.__structures.values():
+            units.append((structure.type_index, structure.player_index, structure.x, structure.y, structure.health, structure.unit_id))
+            if structure.upgraded:
+                markers.append((UPGRADE_INDEX, structure.player_index, structure.x, structure.y, 0.0, structure.unit_id))
+            if structure.removal_id >= 0:
+                markers.append((REMOVE_INDEX, structure.player_index, structure.x, structure.y, 0.0, structure.removal_id))
+        return units + markers
+
+    def __simulated_units(self, simulator):
+        units = [(unit.type_index, unit.player_index, unit.x, unit.y, unit.health, unit.unit_id)
+                 for unit in simulator.structures if unit.outcome is None]
+        for unit in simulator.structures:
+            structure = self.__structures[unit.cell]
+            if unit.outcome is None and structure.upgraded:
+                units.append((UPGRADE_INDEX, unit.player_index, unit.x, unit.y, 0.0, unit.unit_id))
+            if unit.outcome is None and structure.removal_id >= 0:
+                units.append((REMOVE_INDEX, unit.player_index, unit.x, unit.y, 0.0, structure.removal_id))
+        units.extend((unit.type_index, unit.player_index, unit.x, unit.y, unit.health, unit.unit_id)
+                     for unit in simulator.mobile_units if unit.outcome is None)
+        return units
+
+    def __frame(self, turn_info, units, events, flip):
+        """Builds a game state in the engine's format, from player 2's side of the board if flip is True"""
+        top = self.__size - 1
+        tables = ([[] for _ in self.__unit_information], [[] for _ in self.__unit_information])
+        for type_index, player_index, x, y, health, unit_id in units:
+            if flip:
+                x, y, player_index = top - x, top - y, 1 - player_index
+            tables[player_index][type_index].append([x, y, health, str(unit_id)])
+        stats = [[round(self.__health[index], 1), round(self.__sp[index], 1), round(self.__mp[index], 1), self.__turn_ms[index]] for index in (0, 1)]
+        if flip:
+            stats.reverse()
+            events = flip_events(events, self.__size)
+        return {"p2Units": tables[1], "turnInfo": list(turn_info), "p1Stats": stats[0], "p1Units": tables[0], "p2Stats": stats[1], "events": events}
+
+    def __write(self, frame):
+        if self.__replay is not None:
+            self.__replay.write(json.dumps(frame, separators=(",", ":")) + "\n")
+        self.__global_frame += 1
+
+    def __finish(self, turn, frame_index, game_over, started):
+        if self.__crashed[0] != self.__crashed[1]:
+            winner = 1 if self.__crashed[1] else 2
+        else:
+            # More health wins, then less time spent
+            winner = 1 if (self.__health[0], -self.__total_ms[0]) > (self.__health[1], -self.__total_ms[1]) else 2
+        end_stats = {
+            "duration": int((time.perf_counter() - started) * 1000),
+            "winner": winner,
+            "turns": turn,
+            "frames": self.__frames_played,
+        }
+        for player_index in (0, 1):
+            left_on_board = 0.0
+            for structure in self.__structures.values():
+                if structure.player_index == player_index:
+                    base = self.__unit_information[structure.type_index]
+                    left_on_board += base.get("cost1", 0)
+                    if structure.upgraded:
+                        left_on_board += base.get("upgrade", {}).get("cost1", base.get("cost1", 0))
+            end_stats["player{}".format(player_index + 1)] = {
+                "name": self.names[player_index],
+                "crashed": self.__crashed[player_index],
+                "timeout_death": False,
+                "points_scored": self.__points[player_index],
+                "total_computation_time": int(self.__total_ms[player_index]),
+                "stationary_resource_spent": self.__spent[player_index][0],
+                "dynamic_resource_spent": self.__spent[player_index][1],
+                "dynamic_resource_spoiled": self.__spoiled[player_index],
+                "dynamic_resource_destroyed": self.__destroyed[player_index],
+                "stationary_resource_left_on_board": left_on_board,
+                "time_damage_taken": 0,
+            }
+        if self.__replay is not None:
+            final = self.__frame([2, turn, frame_index, self.__global_frame - 1], self.__last_units, empty_events(), False)
+            final["endStats"] = end_stats
+            self.__replay.write(json.dumps(final, separators=(",", ":")) + "\n")
+        return GameResult(winner, turn, self.__frames_played, list(self.__health), list(self.__crashed), list(self.__errors), end_stats, self.replay_path)
+
+
+def _one_decimal(value):
+    # The engine keeps resources rounded half up to one decimal place between turns
+    return math.floor(value * 10 + 0.5) / 10
+
+
+def flip_events(events, arena_size):
+    """Turns a frame's events around to be seen from the other player's side of the board
+
+    Args:
+        events: The events of a frame, as the engine sends them
+        arena_size: The size of the arena
+
+    Returns:
+        New events with locations mirrored and players 1 and 2 swapped
+
+    """
+    top = arena_size - 1
+    flipped = {}
+    for event_type, entries in events.items():
+        positions = (0, 1) if event_type in ("move", "attack", "shield") else (0,)
+        owner = 3 if event_type == "death" else -1
+        flipped_entries = []
+        for entry in entries:
+            entry = list(entry)
+            for index in positions:
+                entry[index] = [top - entry[index][0], top - entry[index][1]]
+            if event_type == "selfDestruct":
+                entry[1] = [[top - x, top - y] for x, y in entry[1]]
+            entry[owner] = 3 - entry[owner]
+            flipped_entries.append(entry)
+        flipped[event_type] = flipped_entries
+    return flipped
+
+
+def play_game(config, algo1, algo2, **kwargs):
+    """Plays one game between two algos in this process, see Referee
+
+    Args:
+        config (JSON): The game config
+        algo1: Player 1, an AlgoCore subclass or instance
+        algo2: Player 2, an AlgoCore subclass or instance
+        kwargs: Any other argument Referee takes, like replay_path or seed
+
+    Returns:
+        A GameResult
+
+    """
+    return Referee(config, algo1, algo2, **kwargs).play()
@@ -0,0 +1,177 @@
+from array import array
+
+
+class ShieldMap:
+    """Tracks which supports can shield a mobile unit on every tile of a GameMap
+
+    Like ThreatMap, it is filled once from the board and then kept in sync through
+    GameMap.add_structure_listener. Upgraded shieldRange and shieldPerUnit are honored.
+
+    A support shields a friendly mobile unit once, the first time the unit comes within
+    shieldRange of it. The amount is shieldPerUnit plus shieldBonusPerY for every row the
+    support sits away from its owner's back corner, y for player 0 and ARENA_SIZE - 1 - y for player 1.
+
+    Attributes :
+        * game_map (:obj: GameMap): The map being tracked
+        * shield_total (list): Two array('d') indexed by cell id, one per support owner. shield_total[p][cell] is the total shielding player p's supports in range of that tile would give
+
+    """
+    def __init__(self, game_map):
+        """Builds the coverage from the supports currently on a map and starts listening for changes
+
+        Args:
+            game_map: The GameMap to track
+
+        """
+        self.game_map = game_map
+        self.__geometry = game_map.geometry
+        cells = len(self.__geometry.in_bounds)
+        self.shield_total = [array('d', [0.0]) * cells, array('d', [0.0]) * cells]
+        self.__shielders = [[None] * cells, [None] * cells]
+        self.__amounts = [0.0] * cells
+        self.__applied = [None] * cells
+        self.__stats = []
+        for unit_info in game_map.config["unitInformation"]:
+            upgrade_info = unit_info.get("upgrade", {})
+            base = (unit_info.get("shieldRange", 0), unit_info.get("shieldPerUnit", 0), unit_info.get("shieldBonusPerY", 0))
+            upgraded = (upgrade_info.get("shieldRange", base[0]), upgrade_info.get("shieldPerUnit", base[1]), upgrade_info.get("shieldBonusPerY", base[2]))
+            self.__stats.append((base, upgraded))
+
+        types = game_map.structure_types
+        for cell in self.__geometry.cells:
+            if types[cell] >= 0:
+                self.__apply(cell)
+        game_map.add_structure_listener(self.structure_changed)
+
+    def structure_changed(self, cell):
+        """Recomputes the coverage of the structure on a cell. Called by the GameMap
+
+        Args:
+            cell: The cell id of the structure that was placed, removed or upgraded
+
+        """
+        self.__withdraw(cell)
+        self.__apply(cell)
+
+    def fork(self, game_map):
+        """Copies this ShieldMap onto a fork of the map it tracks, without rebuilding it from the board
+        The per tile tuples of structure cells are never changed in place, so the fork shares them.
+
+        Args:
+            game_map: A GameMap forked from this one's game_map, with no changes made to it since
+
+        Returns:
+            A ShieldMap following game_map
+
+        """
+        fork = ShieldMap.__new__(ShieldMap)
+        fork.__dict__.update(self.__dict__)
+        fork.game_map = game_map
+        fork.shield_total = [totals[:] for totals in self.shield_total]
+        fork.__shielders = [list(shielders) for shielders in self.__shielders]
+        fork.__amounts = list(self.__amounts)
+        fork.__applied = list(self.__applied)
+        game_map.add_structure_listener(fork.structure_changed)
+        return fork
+
+    def detach(self):
+        """Stops following changes to the GameMap"""
+        self.game_map.remove_structure_listener(self.structure_changed)
+
+    def __apply(self, cell):
+        game_map = self.game_map
+        type_index = game_map.structure_types[cell]
+        if type_index < 0:
+            return
+        shield_range, shield_per_unit, bonus_per_y = self.__stats[type_index][1 if game_map.structure_upgraded[cell] else 0]
+        owner = game_map.structure_owners[cell]
+        if shield_range <= 0 or owner not in (0, 1):
+            return
+        y = self.__geometry.xy[cell][1]
+        rows_forward = y if owner == 0 else self.__geometry.arena_size - 1 - y
+        amount = shield_per_unit + bonus_per_y * rows_forward
+        if amount <= 0:
+            return
+        covered = self.__geometry.cells_within(cell, shield_range)
+        totals = self.shield_total[owner]
+        shielders = self.__shielders[owner]
+        for target in covered:
+            totals[target] += amount
+            shielders[target] = (cell,) if shielders[target] is None else shielders[target] + (cell,)
+        self.__amounts[cell] = amount
+        self.__applied[cell] = (owner, covered)
+
+    def __withdraw(self, cell):
+        applied = self.__applied[cell]
+        if applied is None:
+            return
+        owner, covered = applied
+        amount = self.__amounts[cell]
+        totals = self.shield_total[owner]
+        shielders = self.__shielders[owner]
+        for target in covered:
+            totals[target] -= amount
+            shielders[target] = tuple(other for other in shielders[target] if other != cell) or None
+        self.__amounts[cell] = 0.0
+        self.__applied[cell] = None
+
+    def shield_amount(self, cell):
+        """The shielding the support on a cell gives each unit it shields, 0 if there is none"""
+        return self.__amounts[cell]
+
+    def shielder_cells(self, location, player_index):
+        """Gets the cells of the supports that can shield a tile
+
+        Args:
+            location: An in bounds [x, y] location
+            player_index: The player controlling the mobile unit on the tile, 0 for you 1 for the enemy
+
+        Returns:
+            The cell ids of player_index's supports in range, ordered by x then y
+
+        """
+        cells = self.__shielders[player_index][self.__geometry.cell_id(location)]
+        if not cells:
+            return []
+        return sorted(cells, key=self.__geometry.xy.__getitem__)
+
+    def shield_events(self, path, player_index):
+        """Lists when a unit following a path picks up each shield
+
+        Args:
+            path: A list of [x, y] locations, or cell ids such as the arrays from GameState.find_all_edge_paths
+            player_index: The player controlling the unit, 0 for you 1 for the enemy
+
+        Returns:
+            A list of (path index, support cell id, amount) tuples, one per support, at the first
+            step of the path within that support's range
+
+        """
+        shielders = self.__shielders[player_index]
+        size = self.__geometry.arena_size
+        xy = self.__geometry.xy
+        seen = set()
+        events = []
+        for index, step in enumerate(path):
+            cell = int(step[1]) * size + int(step[0]) if isinstance(step, (list, tuple)) else step
+            covering = shielders[cell]
+            if not covering:
+                continue
+            for support in sorted(covering, key=xy.__getitem__):
+                if support not in seen:
+                    seen.add(support)
+                    events.append((index, support, self.__amounts[support]))
+        return events
+
+    def path_shielding(self, path, player_index):
+        """Adds up the shielding a unit following a path would receive, counting each support once
+
+        Args:
+            path: A list of [x, y] locations, or cell ids such as the arrays from GameState.find_all_edge_paths
+            player_index: The player controlling the unit, 0 for you 1 for the enemy
+
+        Returns:
+            The total shield the unit picks up along the path
+
+        """
+        return sum(amount for _, _, amount in self.shield_events(path, player_index))
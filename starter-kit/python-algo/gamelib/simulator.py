@@ -0,0 +1,503 @@
+import math
+from array import array
+from .navigation import PathField, ShortestPathFinder, blocked_mask
+
+BREACHED = "breached"
+SELF_DESTRUCTED = "self_destructed"
+DESTROYED = "destroyed"
+
+# unitInformation index of the upgrade action, as in GameState
+UPGRADE_INDEX = 7
+
+
+def unit_stats(unit_information, type_index, upgraded=False):
+    """Collects the stats the simulators read for a unit type
+
+    Args:
+        unit_information: The unitInformation list from the game config
+        type_index: The index of the unit type in unit_information
+        upgraded: Whether to apply the type's upgrade
+
+    Returns:
+        A dictionary of the unit's speed, attack, shield, breach and self destruct stats
+
+    """
+    unit_info = unit_information[type_index]
+    stats = dict(unit_info)
+    if upgraded:
+        stats.update(unit_info.get("upgrade", {}))
+    shield_range = stats.get("shieldRange", 0)
+    return {
+        "speed": stats.get("speed", 0),
+        "attack_range_squared": stats.get("attackRange", 0) ** 2,
+        "attack_range": stats.get("attackRange", 0),
+        "damage_i": stats.get("attackDamageWalker", 0),
+        "damage_f": stats.get("attackDamageTower", 0),
+        "shield_range_squared": shield_range ** 2 if shield_range > 0 else -1,
+        "shield_per_unit": stats.get("shieldPerUnit", 0),
+        "shield_bonus_per_y": stats.get("shieldBonusPerY", 0),
+        "start_health": stats.get("startHealth", 0),
+        "breach_damage": stats.get("playerBreachDamage", 1.0),
+        "self_destruct_range_squared": stats.get("selfDestructRange", 0) ** 2,
+        "self_destruct_damage_i": stats.get("selfDestructDamageWalker", stats.get("startHealth", 0)),
+        "self_destruct_damage_f": stats.get("selfDestructDamageTower", stats.get("startHealth", 0)),
+        "self_destruct_steps": stats.get("selfDestructStepsRequired", 0),
+    }
+
+
+class SimulatedUnit:
+    """A unit taking part in a simulated action phase
+
+    Attributes :
+        * unit_type (str): This unit's type
+        * type_index (int): The unitInformation index of unit_type
+        * player_index (int): The player that controls this unit. 0 for you, 1 for your opponent.
+        * stationary (bool): Whether or not this unit is a structure
+        * upgraded (bool): If this unit is upgraded
+        * unit_id (int): The engine's id for this unit, or -1 if it is not known
+        * x (int): The x coordinate of the unit
+        * y (int): The y coordinate of the unit
+        * spawn_location (list): Where the unit started the action phase
+        * health (float): The current health of this unit, shields included
+        * steps (int): How many tiles this unit has moved
+        * damage_dealt (float): The total damage this unit's attacks and self destruct have dealt
+        * outcome (str): None while the unit is on the board, otherwise BREACHED, SELF_DESTRUCTED or DESTROYED
+        * outcome_frame (int): The frame the unit left the board on, or -1
+
+    """
+    __slots__ = ("unit_type", "type_index", "player_index", "stationary", "upgraded", "unit_id", "x", "y", "cell",
+                 "spawn_location", "health", "steps", "damage_dealt", "outcome", "outcome_frame",
+                 "_stats", "_order", "_progress", "_move_direction", "_target_edge", "_shielded_by")
+
+    def __init__(self, unit_type, type_index, player_index, stationary, x, y, cell, health, stats, upgraded=False, unit_id=-1):
+        self.unit_type = unit_type
+        self.type_index = type_index
+        self.player_index = player_index
+        self.stationary = stationary
+        self.upgraded = upgraded
+        self.unit_id = unit_id
+        self.x = x
+        self.y = y
+        self.cell = cell
+        self.spawn_location = [x, y]
+        self.health = health
+        self.steps = 0
+        self.damage_dealt = 0.0
+        self.outcome = None
+        self.outcome_frame = -1
+        self._stats = stats
+        self._order = 0
+        self._progress = 0.0
+        self._move_direction = 0
+        self._target_edge = None
+        self._shielded_by = None
+
+    def __repr__(self):
+        owner = "Friendly" if self.player_index == 0 else "Enemy"
+        return "{} {} {}, health: {} location: {} outcome: {}".format(owner, self.unit_type, self.unit_id, self.health, [self.x, self.y], self.outcome)
+
+
+class SimulationResult:
+    """The outcome of a simulated action phase
+
+    Attributes :
+        * frames (int): The number of frames the action phase lasted
+        * game_over (bool): True if a player's health reached 0, ending the game and the action phase early
+        * health_delta (list): The change in health of player 0 and player 1
+        * sp_delta (list): The SP each player earned from breaches
+        * mp_delta (list): The change in MP of each player, always zero since MP only changes between turns
+        * breaches (list): A (frame, [x, y], SimulatedUnit) tuple for every breach, in order
+        * self_destructs (list): A (frame, [x, y], SimulatedUnit) tuple for every self destruct, in order
+        * mobile_units (list): Every mobile SimulatedUnit, in the order the engine processes them
+        * destroyed_structures (list): The structures that were destroyed, in the order they fell
+
+    """
+    def __init__(self, simulator):
+        self.frames = simulator.frame
+        self.game_over = simulator.game_over
+        self.health_delta = list(simulator.health_delta)
+        self.sp_delta = list(simulator.sp_delta)
+        self.mp_delta = [0.0, 0.0]
+        self.breaches = list(simulator.breaches)
+        self.self_destructs = list(simulator.self_destructs)
+        self.mobile_units = list(simulator.mobile_units)
+        self.destroyed_structures = list(simulator.destroyed_structures)
+
+    def damage_dealt(self, player_index=0):
+        """The total damage dealt by a player's mobile units"""
+        return sum(unit.damage_dealt for unit in self.mobile_units if unit.player_index == player_index)
+
+    def __repr__(self):
+        return "SimulationResult(frames={}, health_delta={}, sp_delta={}, breaches={}, destroyed_structures={})".format(
+            self.frames, self.health_delta, self.sp_delta, len(self.breaches), len(self.destroyed_structures))
+
+
+class Simulator:
+    """Plays out an action phase frame by frame, starting from a GameState
+
+    The structures on the GameState's map, including anything built with attempt_spawn or upgraded with
+    attempt_upgrade this turn, and the mobile units deployed on it take part. Extra units, like a guess at
+    what your opponent will send, can be added with add_unit before running.
+
+    Every frame follows the engine's order:
+        1. Mobile units whose turn it is move one tile along their path. A unit standing on its target edge breaches
+           instead, and a unit that has reached the end of a blocked path self destructs.
+        2. Supports shield friendly mobile units that come within range for the first time.
+        3. Structures, then mobile units, each in the order they were created, attack the best target in range.
+           Units brought to 0 health or that self destructed this frame still attack, but cannot be targeted.
+        4. Units at 0 health are removed. Paths are recomputed if a structure fell.
+    The action phase ends once no mobile units are left, or after the frame that takes a player's health to 0.
+
+    Attributes :
+        * game_state (:obj: GameState): The game state the simulation started from
+        * frame (int): The number of frames simulated so far
+        * game_over (bool): True once a player's health has reached 0, which ends the action phase
+        * structures (list): The structures on the board as SimulatedUnits, in the order the engine processes them
+        * mobile_units (list): The mobile SimulatedUnits, in the order the engine processes them
+        * health_delta (list): The change in health of player 0 and player 1 so far
+        * sp_delta (list): The SP each player has earned from breaches so far
+        * breaches (list): A (frame, [x, y], SimulatedUnit) tuple for every breach so far
+        * self_destructs (list): A (frame, [x, y], SimulatedUnit) tuple for every self destruct so far
+        * destroyed_structures (list): The structures destroyed so far
+
+    """
+    MAX_FRAMES = 1000
+
+    def __init__(self, game_state):
+        """Copies the units on a game state's map into a new simulation
+
+        Args:
+            game_state: The GameState to simulate. It is not modified.
+
+        """
+        self.game_state = game_state
+        game_map = game_state.game_map
+        self.__geometry = game_map.geometry
+        self.__config = game_state.config
+        self.__unit_information = self.__config["unitInformation"]
+        self.__stats = [(unit_stats(self.__unit_information, index, False), unit_stats(self.__unit_information, index, True)) for index in range(len(self.__unit_information))]
+        self.__type_index = dict((unit_info.get("shorthand"), index) for index, unit_info in enumerate(self.__unit_information))
+        self.__breach_reward = self.__config.get("resources", {}).get("coresForPlayerDamage", 1.0)
+        self.__edge_cells = self.__geometry.edge_cells
+        self.__edges = self.__geometry.edges
+
+        self.frame = 0
+        self.game_over = False
+        self.__start_health = (game_state.my_health, game_state.enemy_health)
+        self.health_delta = [0.0, 0.0]
+        self.sp_delta = [0.0, 0.0]
+        self.breaches = []
+        self.self_destructs = []
+        self.destroyed_structures = []
+        self.structures = []
+        self.mobile_units = []
+        self.__structure_at = [None] * len(self.__geometry.in_bounds)
+        self.__types = array('b', game_map.structure_types)
+        self.__fields = {}
+        self.__blocked = None
+
+        self.__copy_structures(game_map)
+        self.__copy_mobile_units(game_map)
+
+    def __copy_structures(self, game_map):
+        build_order = {}
+        upgraded_now = set()
+        upgrade_shorthand = self.__unit_information[UPGRADE_INDEX].get("shorthand")
+        for index, (unit_type, x, y) in enumerate(self.game_state._build_stack):
+            build_order[(x, y)] = index
+            if unit_type == upgrade_shorthand:
+                upgraded_now.add((x, y))
+        size = self.__geometry.arena_size
+        keyed = []
+        for cell in self.__geometry.cells:
+            type_index = game_map.structure_types[cell]
+            if type_index < 0:
+                continue
+            x, y = self.__geometry.xy[cell]
+            upgraded = bool(game_map.structure_upgraded[cell])
+            unit = SimulatedUnit(self.__unit_information[type_index].get("shorthand"), type_index, game_map.structure_owners[cell], True,
+                                 x, y, cell, game_map.structure_health[cell], self.__stats[type_index][1 if upgraded else 0], upgraded, game_map.structure_ids[cell])
+            if (x, y) in upgraded_now:
+                # The engine raises health by the upgrade's extra startHealth when the action phase starts
+                unit.health += self.__stats[type_index][1]["start_health"] - self.__stats[type_index][0]["start_health"]
+            if unit.unit_id >= 0 and (x, y) not in upgraded_now:
+                key = (0, unit.unit_id, 0)
+            else:
+                key = (1, build_order.get((x, y), size * size), cell)
+            keyed.append((key, unit))
+        keyed.sort(key=lambda pair: pair[0])
+        for _, unit in keyed:
+            self.__add_structure(unit)
+
+    def __copy_mobile_units(self, game_map):
+        pools = {}
+        for cell in self.__geometry.cells:
+            x, y = self.__geometry.xy[cell]
+            if game_map.has_mobile_units([x, y]):
+                pools[cell] = [unit for unit in game_map[x, y] if not unit.stationary]
+        ordered = []
+        for unit_type, x, y in self.game_state._deploy_stack:
+            pool = pools.get(self.__geometry.cell_id([x, y]), [])
+            for index, unit in enumerate(pool):
+                if unit.unit_type == unit_type and unit.player_index == 0:
+                    ordered.append(pool.pop(index))
+                    break
+        for player_index in (0, 1):
+            for cell in sorted(pools):
+                ordered.extend(unit for unit in pools[cell] if unit.player_index == player_index)
+        ordered.sort(key=lambda unit: unit.player_index)
+        for unit in ordered:
+            self.add_unit(unit.unit_type, [unit.x, unit.y], unit.player_index, health=unit.health)
+
+    def __add_structure(self, unit):
+        unit._order = len(self.structures)
+        self.structures.append(unit)
+        self.__structure_at[unit.cell] = unit
+
+    def add_unit(self, unit_type, location, player_index=0, num=1, health=None, unit_id=-1):
+        """Adds mobile units to the simulation without touching the GameState
+
+        Units are processed in the order they are added, after every unit already on the board.
+
+        Args:
+            unit_type: The type of the new units
+            location: The [x, y] location they are deployed on
+            player_index: The player controlling the new units, 0 for you 1 for the enemy
+            num: How many units to add
+            health: Their starting health, startHealth if None
+            unit_id: The engine's id for the first unit, when known. Following units get the next ids
+
+        Returns:
+            The list of new SimulatedUnits
+
+        """
+        type_index = self.__type_index[unit_type]
+        stats = self.__stats[type_index][0]
+        x, y = int(location[0]), int(location[1])
+        cell = self.__geometry.cell_id([x, y])
+        added = []
+        for number in range(num):
+            unit = SimulatedUnit(unit_type, type_index, player_index, False, x, y, cell, stats["start_health"] if health is None else health,
+                                 stats, unit_id=unit_id + number if unit_id >= 0 else -1)
+            unit._order = len(self.mobile_units)
+            unit._target_edge = self.game_state.get_target_edge([x, y])
+            unit._shielded_by = set()
+            self.mobile_units.append(unit)
+            added.append(unit)
+        return added
+
+    def __field(self, target_edge):
+        if self.__blocked is None:
+            self.__blocked = blocked_mask(self.__types)
+        key = (self.__blocked, target_edge)
+        field = self.__fields.get(key)
+        if field is None:
+            field = PathField(self.__geometry, self.__blocked, self.__edges[target_edge])
+            self.__fields[key] = field
+        return field
+
+    def finished(self):
+        """True once no mobile units are left on the board"""
+        return not any(unit.outcome is None for unit in self.mobile_units)
+
+    def run(self, max_frames=None):
+        """Simulates frames until no mobile units are left
+
+        Args:
+            max_frames: Stop after this many frames even if units remain, MAX_FRAMES if None
+
+        Returns:
+            A SimulationResult
+
+        """
+        limit = self.MAX_FRAMES if max_frames is None else max_frames
+        while self.frame < limit and self.step():
+            pass
+        return SimulationResult(self)
+
+    def step(self):
+        """Simulates a single frame
+
+        Returns:
+            True if mobile units are still on the board afterwards
+
+        """
+        mobile = [unit for unit in self.mobile_units if unit.outcome is None]
+        if not mobile or self.game_over:
+            return False
+        self.__move(mobile)
+        by_cell = ({}, {})
+        for unit in mobile:
+            if unit.outcome is None:
+                by_cell[unit.player_index].setdefault(unit.cell, []).append(unit)
+        self.__shield(by_cell)
+        self.__attack(mobile, by_cell)
+        self.__remove_dead(mobile)
+        self.frame += 1
+        # The game ends with the frame that takes a player's health to 0
+        self.game_over = any(self.__start_health[index] + self.health_delta[index] <= 0 for index in (0, 1))
+        return not self.game_over and any(unit.outcome is None for unit in mobile)
+
+    def __move(self, mobile):
+        xy = self.__geometry.xy
+        for unit in mobile:
+            if unit.outcome is not None:
+                continue
+            unit._progress += unit._stats["speed"]
+            if unit._progress < 1 - 1e-9:
+                continue
+            unit._progress -= 1
+            field = self.__field(unit._target_edge)
+            next_cell = field.next_step(unit.cell, unit._move_direction)
+            if next_cell == unit.cell:
+                if unit.cell in self.__edge_cells[unit._target_edge]:
+                    self.__breach(unit)
+                else:
+                    self.__self_destruct(unit, mobile)
+                continue
+            next_x, next_y = xy[next_cell]
+            unit._move_direction = ShortestPathFinder.VERTICAL if next_x == unit.x else ShortestPathFinder.HORIZONTAL
+            unit.x, unit.y, unit.cell = next_x, next_y, next_cell
+            unit.steps += 1
+
+    def __breach(self, unit):
+        damage = unit._stats["breach_damage"]
+        self.health_delta[1 - unit.player_index] -= damage
+        self.sp_delta[unit.player_index] += damage * self.__breach_reward
+        unit.outcome = BREACHED
+        unit.outcome_frame = self.frame
+        self.breaches.append((self.frame, [unit.x, unit.y], unit))
+
+    def __self_destruct(self, unit, mobile):
+        stats = unit._stats
+        unit.outcome = SELF_DESTRUCTED
+        unit.outcome_frame = self.frame
+        self.self_destructs.append((self.frame, [unit.x, unit.y], unit))
+        if unit.steps < stats["self_destruct_steps"]:
+            return
+        range_squared = stats["self_destruct_range_squared"]
+        enemy = 1 - unit.player_index
+        for other in mobile:
+            if other.outcome is None and other.player_index == enemy and (other.x - unit.x) ** 2 + (other.y - unit.y) ** 2 <= range_squared:
+                other.health -= stats["self_destruct_damage_i"]
+                unit.damage_dealt += stats["self_destruct_damage_i"]
+        for cell in self.__geometry.cells_within(unit.cell, math.sqrt(range_squared)):
+            structure = self.__structure_at[cell]
+            if structure is not None and structure.player_index == enemy:
+                structure.health -= stats["self_destruct_damage_f"]
+                unit.damage_dealt += stats["self_destruct_damage_f"]
+
+    def __shield(self, by_cell):
+        size = self.__geometry.arena_size
+        for support in self.structures:
+            stats = support._stats
+            range_squared = stats["shield_range_squared"]
+            if support.outcome is not None or range_squared < 0:
+                continue
+            rows_forward = support.y if support.player_index == 0 else size - 1 - support.y
+            amount = stats["shield_per_unit"] + stats["shield_bonus_per_y"] * rows_forward
+            if amount <= 0:
+                continue
+            for cell, units in by_cell[support.player_index].items():
+                x, y = self.__geometry.xy[cell]
+                if (x - support.x) ** 2 + (y - support.y) ** 2 > range_squared:
+                    continue
+                for unit in units:
+                    if support._order not in unit._shielded_by:
+                        unit._shielded_by.add(support._order)
+                        unit.health += amount
+
+    def __attack(self, mobile, by_cell):
+        for attacker in self.structures:
+            if attacker.outcome is None and (attacker._stats["damage_i"] > 0 or attacker._stats["damage_f"] > 0):
+                self.__attack_with(attacker, by_cell)
+        for attacker in mobile:
+            # Units that self destructed this frame get one last attack
+            if (attacker.outcome is None or (attacker.outcome == SELF_DESTRUCTED and attacker.outcome_frame == self.frame)) and (attacker._stats["damage_i"] > 0 or attacker._stats["damage_f"] > 0):
+                self.__attack_with(attacker, by_cell)
+
+    def __attack_with(self, attacker, by_cell):
+        target = self.get_target(attacker, by_cell)
+        if target is None:
+            return
+        damage = attacker._stats["damage_f"] if target.stationary else attacker._stats["damage_i"]
+        target.health -= damage
+        attacker.damage_dealt += damage
+
+    def get_target(self, attacker, by_cell=None):
+        """Picks the unit an attacker hits this frame, following the same priorities as GameState.get_target:
+        mobile units over structures, then the nearest, the lowest health, the furthest towards the attacker's
+        side, the closest to a side edge and finally the most recently created
+
+        Args:
+            attacker: A SimulatedUnit
+            by_cell: The enemy mobile units grouped by cell, built from mobile_units if None
+
+        Returns:
+            The SimulatedUnit it would attack, or None
+
+        """
+        if by_cell is None:
+            by_cell = ({}, {})
+            for unit in self.mobile_units:
+                if unit.outcome is None:
+                    by_cell[unit.player_index].setdefault(unit.cell, []).append(unit)
+        stats = attacker._stats
+        range_squared = stats["attack_range_squared"]
+        enemy = 1 - attacker.player_index
+        y_sign = 1 if attacker.player_index == 0 else -1
+        half = self.__geometry.half_arena - 0.5
+        xy = self.__geometry.xy
+        best = None
+        best_key = None
+        if stats["damage_i"] > 0:
+            for cell, units in by_cell[enemy].items():
+                x, y = xy[cell]
+                distance = (x - attacker.x) ** 2 + (y - attacker.y) ** 2
+                if distance > range_squared:
+                    continue
+                for unit in units:
+                    if unit.health <= 0 or unit.outcome is not None:
+                        continue
+                    key = (distance, unit.health, y_sign * y, -abs(half - x), -unit._order)
+                    if best_key is None or key < best_key:
+                        best, best_key = unit, key
+            if best is not None:
+                return best
+        if stats["damage_f"] > 0:
+            for cell in self.__geometry.cells_within(attacker.cell, stats["attack_range"]):
+                unit = self.__structure_at[cell]
+                if unit is None or unit.player_index != enemy or unit.health <= 0:
+                    continue
+                key = ((unit.x - attacker.x) ** 2 + (unit.y - attacker.y) ** 2, unit.health, y_sign * unit.y, -abs(half - unit.x), -unit._order)
+                if best_key is None or key < best_key:
+                    best, best_key = unit, key
+        return best
+
+    def __remove_dead(self, mobile):
+        for unit in mobile:
+            if unit.outcome is None and unit.health <= 0:
+                unit.outcome = DESTROYED
+                unit.outcome_frame = self.frame
+        for unit in self.structures:
+            if unit.outcome is None and unit.health <= 0:
+                unit.outcome = DESTROYED
+                unit.outcome_frame = self.frame
+                self.destroyed_structures.append(unit)
+                self.__structure_at[unit.cell] = None
+                self.__types[unit.cell] = -1
+                self.__blocked = None
+
+
+def simulate(game_state, max_frames=None):
+    """Simulates this turn's action phase from a game state, see Simulator
+
+    Args:
+        game_state: The GameState to simulate, with this turn's builds and deploys already made with attempt_spawn and attempt_upgrade
+        max_frames: Stop after this many frames even if units remain
+
+    Returns:
+        A SimulationResult
+
+    """
+    return Simulator(game_state).run(max_frames)
@@ -1,7 +1,19 @@
 import unittest
 import json
+import threading
+import os
+import tempfile
+import copy
 from .game_state import GameState
 from .unit import GameUnit
+from .simulator import Simulator, simulate, BREACHED, DESTROYED
+from . import batch_simulator
+from .planning import AnytimePlanner, Deadline
+from .algocore import PrecomputeWorker
+from . import protocol
+from .cache import AnalysisCache
+from .algocore import AlgoCore
+from .referee import play_game
 
 class BasicTests(unittest.TestCase):
 
@@ -240,6 +252,427 @@ class BasicTests(unittest.TestCase):
         self.assertEqual(1, len(game.game_map.get_locations_in_range([13,13], 0)), "We should be in 0 range of ourself")
         self.assertEqual(37, len(game.game_map.get_locations_in_range([13,13], 3.5)), "Wrong number of tiles in range")
 
+    def test_structure_arrays(self):
+        game = self.make_turn_0_map()
+        game_map = game.game_map
+        cell = game_map.cell_id([14, 13])
+
+        game_map.add_unit("DF", [14, 13], 1)
+        self.assertEqual(2, game_map.structure_types[cell], "Structure type index not stored")
+        self.assertEqual(1, game_map.structure_owners[cell], "Structure owner not stored")
+        self.assertEqual(90, game_map.structure_health[cell], "Structure health not stored")
+        self.assertEqual([[14, 13]], game_map.structure_locations(1, "DF"), "Structure locations are wrong")
+        self.assertEqual([], game_map.structure_locations(0), "Found a structure we do not own")
+
+        view = game_map[14, 13][0]
+        view.health = 10
+        view.pending_removal = True
+        self.assertEqual(10, game_map.structure_health[cell], "Health written to a view did not reach the map")
+        self.assertEqual(1, game_map.structure_pending_removal[cell], "Removal flag written to a view did not reach the map")
+        view.upgrade()
+        self.assertEqual(1, game_map.structure_upgraded[cell], "Upgrading a view did not reach the map")
+        self.assertEqual(3.5, game_map[14, 13][0].attackRange, "Upgraded stats were lost")
+
+        game_map.remove_unit([14, 13])
+        self.assertEqual(-1, game_map.structure_types[cell], "Structure was not removed")
+        self.assertEqual(10, view.health, "A removed structure should keep its last health")
+
+    def test_mobile_units_stack_beside_structures(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("SI", [13, 0])
+        game.game_map.add_unit("SI", [13, 0])
+        self.assertFalse(game.contains_stationary_unit([13, 0]), "Mobile units should not block")
+        self.assertEqual(2, len(game.game_map[13, 0]), "Mobile units are not stacking")
+        game.game_map.add_unit("FF", [13, 0])
+        self.assertEqual(["FF"], [unit.unit_type for unit in game.game_map[13, 0]], "A structure should replace everything on its tile")
+        self.assertTrue(game.contains_stationary_unit([13, 0]), "The wall should block")
+
+    def test_geometry_tables(self):
+        game = self.make_turn_0_map()
+        game_map = game.game_map
+        self.assertEqual(420, len(list(game_map)), "The diamond should have 420 tiles")
+        self.assertTrue(game_map.in_arena_bounds([0, 13]))
+        self.assertFalse(game_map.in_arena_bounds([0, 12]))
+        self.assertFalse(game_map.in_arena_bounds([28, 13]))
+        self.assertTrue(game_map.in_arena_bounds([12.5, 0.9]), "Fractional locations should not be rounded to a tile")
+        self.assertFalse(game_map.in_arena_bounds([14.9, 0.5]), "Fractional locations should not be rounded to a tile")
+        self.assertTrue(game_map.is_on_edge([13, 0], game_map.BOTTOM_LEFT))
+        self.assertFalse(game_map.is_on_edge([14, 0], game_map.BOTTOM_LEFT))
+        self.assertEqual(14, len(game_map.get_edge_locations(game_map.TOP_RIGHT)))
+        self.assertEqual(37, len(game_map.get_locations_in_range([13, 13], 3.5)), "Unexpected number of tiles in range")
+        self.assertEqual(game_map.get_locations_in_range([13, 13], 3.5), game_map.get_locations_in_range([13, 13], 3.5))
+        self.assertEqual([[13, 0], [13, 1], [14, 0], [14, 1]], game_map.get_locations_in_range([13.5, 0.5], 1), "A fractional center should not be moved to a tile")
+        self.assertIs(game_map.geometry, self.make_turn_0_map().game_map.geometry, "Geometry should be shared between maps")
+
+        geometry = game_map.geometry
+        self.assertIsNotNone(geometry.cells_in_range_table(3.5), "Tables should be built for the config's ranges")
+        self.assertIsNone(geometry.cells_in_range_table(1.25), "Other radii should not get a table")
+        self.assertEqual([[12, 13], [13, 12], [13, 13], [13, 14], [14, 13]], game_map.get_locations_in_range([13, 13], 1.25))
+        self.assertIsNone(geometry.cells_in_range_table(1.25))
+        cell = game_map.cell_id([13, 13])
+        first = geometry.cells_within(cell, 1.25)
+        self.assertIs(first, geometry.cells_within(cell, 1.25))
+        for step in range(geometry.RANGE_CACHE_SIZE):
+            geometry.cells_within(cell, 2 + step / 100.0)
+        self.assertIsNot(first, geometry.cells_within(cell, 1.25), "Only the most recently used radii should be kept")
+        self.assertEqual(first, geometry.cells_within(cell, 1.25))
+        self.assertIs(geometry, copy.deepcopy(game_map).geometry, "Copies of a map should share its geometry")
+
+    def test_pathing_follows_board_changes(self):
+        game = self.make_turn_0_map()
+        path = game.find_path_to_edge([13, 0])
+        self.assertEqual([13, 0], path[0])
+        self.assertIn(path[-1], game.game_map.get_edge_locations(game.game_map.TOP_RIGHT), "An open board should path to the edge")
+        self.assertEqual(path, game.find_path_to_edge([13, 0]), "Repeating a query should give the same path")
+
+        for x in range(12, 16):
+            game.game_map.add_unit("FF", [x, 4], 0)
+        game.game_map.add_unit("FF", [11, 3], 0)
+        game.game_map.add_unit("FF", [16, 3], 0)
+        pocket_path = game.find_path_to_edge([13, 0])
+        self.assertNotIn(pocket_path[-1], game.game_map.get_edge_locations(game.game_map.TOP_RIGHT), "Walls should trap the unit")
+        self.assertEqual([15, 3], pocket_path[-1], "The unit should self destruct as far towards its target as it can")
+
+        game.game_map.remove_unit([16, 3])
+        self.assertEqual(path, game.find_path_to_edge([13, 0]), "Removing a wall should reopen the old path")
+
+    def test_find_all_edge_paths(self):
+        game = self.make_turn_0_map()
+        for x in range(4, 24):
+            game.game_map.add_unit("FF", [x, 13], 1)
+        game.game_map.add_unit("FF", [5, 8], 0)
+        game.game_map.add_unit("DF", [20, 10], 1)
+        game.game_map.add_unit("FF", [10, 20], 1)
+
+        for player_index in (0, 1):
+            all_paths = game.find_all_edge_paths(player_index)
+            self.assertEqual(28, len(all_paths), "Every deploy location should have an entry")
+            self.assertEqual(sorted(all_paths), list(all_paths), "Deploy locations should be ordered by x")
+            for location, cells in all_paths.items():
+                expected = game.find_path_to_edge(list(location))
+                if expected is None:
+                    self.assertIsNone(cells, "Blocked location {} should not have a path".format(location))
+                    continue
+                self.assertEqual(expected, [[cell % 28, cell // 28] for cell in cells], "Path from {} does not match find_path_to_edge".format(location))
+        self.assertIsNone(game.find_all_edge_paths(0)[(5, 8)])
+
+    def test_threat_map_follows_changes(self):
+        from .threat_map import ThreatMap
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [12, 14], 1)
+        game.game_map.add_unit("FF", [14, 14], 1)
+        threat_map = game.get_threat_map()
+        self.assertIs(threat_map, game.get_threat_map(), "The threat map should only be built once")
+        self.assertEqual(1, len(game.get_attackers([13, 13], 0)))
+        self.assertGreater(threat_map.damage_i[1][game.game_map.cell_id([13, 13])], 0)
+        self.assertEqual(0, threat_map.damage_i[0][game.game_map.cell_id([13, 13])], "We have no turrets yet")
+
+        game.game_map.add_unit("DF", [13, 14], 1)
+        game.game_map.get_structure([12, 14]).upgrade()
+        game.game_map.remove_unit([14, 14])
+        game.game_map.add_unit("DF", [13, 11], 0)
+        game.game_map.add_unit("DF", [13, 11], 0)
+        fresh = ThreatMap(game.game_map)
+        for player_index in (0, 1):
+            self.assertEqual(fresh.damage_i[player_index], threat_map.damage_i[player_index], "Incremental updates drifted from a rebuilt map")
+            self.assertEqual(fresh.damage_f[player_index], threat_map.damage_f[player_index], "Incremental updates drifted from a rebuilt map")
+        self.assertEqual([[12, 14], [13, 14]], [[unit.x, unit.y] for unit in game.get_attackers([13, 13], 0)])
+        self.assertEqual(threat_map.damage_i[1][game.game_map.cell_id([13, 13])], threat_map.path_damage([[13, 13]], 0))
+
+        config = json.loads(json.dumps(game.config))
+        for unit_info in config["unitInformation"]:
+            if unit_info.get("unitCategory") == 1:
+                unit_info["attackRange"] = 0
+        game = GameState(config, self.make_turn_0_map().serialized_string)
+        game.game_map.add_unit("DF", [15, 14], 1)
+        self.assertEqual([[15, 14]], [[unit.x, unit.y] for unit in game.get_attackers([12.9, 12.9], 0)], "A turret in range of a point between tiles was missed")
+
+    def test_shield_map(self):
+        base = self.make_turn_0_map()
+        config = json.loads(json.dumps(base.config))
+        config["unitInformation"][1].update({"shieldRange": 3.0, "shieldPerUnit": 2.0, "shieldBonusPerY": 0.5})
+        config["unitInformation"][1]["upgrade"].update({"shieldRange": 5.5, "shieldPerUnit": 10.0})
+        game = GameState(config, base.serialized_string)
+        game.suppress_warnings(True)
+        game.game_map.add_unit("EF", [13, 4], 0)
+        game.game_map.add_unit("EF", [14, 8], 0)
+        game.game_map.add_unit("EF", [13, 23], 1)
+        shield_map = game.get_shield_map()
+
+        self.assertEqual(4.0, shield_map.shield_amount(game.game_map.cell_id([13, 4])), "shieldBonusPerY should count rows from our edge")
+        self.assertEqual(4.0, shield_map.shield_amount(game.game_map.cell_id([13, 23])), "shieldBonusPerY should count rows from the enemy edge")
+        path = [[13, 0], [13, 1], [13, 2], [13, 3], [13, 4], [13, 5], [13, 6], [13, 7]]
+        events = shield_map.shield_events(path, 0)
+        self.assertEqual([(1, game.game_map.cell_id([13, 4]), 4.0), (6, game.game_map.cell_id([14, 8]), 6.0)], events, "Each support should shield once, when first in range")
+        self.assertEqual(10.0, shield_map.path_shielding(path, 0))
+        self.assertEqual(0, shield_map.path_shielding(path, 1), "Enemy supports are out of range")
+
+        game.game_map.get_structure([13, 4]).upgrade()
+        self.assertEqual(12.0, shield_map.shield_amount(game.game_map.cell_id([13, 4])))
+        self.assertEqual(0, shield_map.shield_events(path, 0)[0][0], "The upgraded range should reach the start of the path")
+        game.game_map.remove_unit([14, 8])
+        self.assertEqual(12.0, shield_map.path_shielding([game.game_map.cell_id(location) for location in path], 0))
+
+    def test_simulator(self):
+        game = self.make_turn_0_map()
+        game.suppress_warnings(True)
+        game.attempt_spawn("PI", [13, 0], 2)
+        result = simulate(game)
+        self.assertEqual(29, result.frames, "Scouts move every frame and breach once they stand on the edge")
+        self.assertEqual([0.0, -2.0], result.health_delta)
+        self.assertEqual([2.0, 0.0], result.sp_delta)
+        self.assertEqual([[27, 14], [27, 14]], [location for _, location, _ in result.breaches])
+        self.assertFalse(result.game_over)
+        game.enemy_health = 2
+        self.assertTrue(simulate(game).game_over, "Taking the enemy to 0 health ends the game")
+
+        game = self.make_turn_0_map()
+        game.suppress_warnings(True)
+        game.game_map.add_unit("DF", [25, 15], 1)
+        game.attempt_spawn("PI", [13, 0])
+        simulator = Simulator(game)
+        simulator.add_unit("PI", [14, 27], 1)
+        result = simulator.run()
+        ours, theirs = result.mobile_units
+        self.assertEqual(DESTROYED, ours.outcome, "Three turret shots should destroy a scout")
+        self.assertEqual(10.0, ours.damage_dealt)
+        self.assertEqual(80.0, simulator.structures[0].health)
+        self.assertEqual(BREACHED, theirs.outcome)
+        self.assertEqual([-1.0, 0.0], result.health_delta)
+        self.assertEqual(90.0, game.game_map[25, 15][0].health, "Simulating should not touch the game state")
+        self.assertEqual(1, len(game.game_map[13, 0]))
+
+        config = json.loads(json.dumps(self.make_turn_0_map().config))
+        config["unitInformation"].append({"display": "Extra", "shorthand": "XX"})
+        game = GameState(config, self.make_turn_0_map().serialized_string)
+        game.suppress_warnings(True)
+        game.attempt_spawn("FF", [0, 13])
+        game.attempt_upgrade([0, 13])
+        self.assertEqual(150.0, Simulator(game).structures[0].health, "Upgrades are found by their index, not by being the last unit type")
+
+    @unittest.skipIf(batch_simulator.np is None, "numpy is not installed")
+    def test_batch_simulator(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [25, 15], 1)
+        game.game_map.add_unit("DF", [2, 15], 1)
+        scenarios = batch_simulator.spawn_scenarios("PI", [[13, 0], [14, 0], [3, 10]], 2)
+        scenarios.append([("PI", [13, 0], 0, 4), ("DF", [24, 13], 0, 1), ("EI", [14, 27], 1, 1)])
+        result = batch_simulator.BatchSimulator(game, scenarios).run()
+        self.assertEqual(4, len(result))
+        for index, scenario in enumerate(scenarios):
+            if index < 3:
+                simulator = Simulator(game)
+            else:
+                game.game_map.add_unit("DF", [24, 13], 0)
+                simulator = Simulator(game)
+                game.game_map.remove_unit([24, 13])
+            for unit_type, location, player_index, num in scenario:
+                if unit_type != "DF":
+                    simulator.add_unit(unit_type, location, player_index, num)
+            expected = simulator.run()
+            self.assertEqual(expected.frames, result.frames[index])
+            self.assertEqual(expected.health_delta, list(result.health_delta[index]))
+            self.assertEqual(expected.sp_delta, list(result.sp_delta[index]))
+            self.assertEqual([unit.outcome for unit in expected.mobile_units], list(result.mobile_outcomes[index][:len(expected.mobile_units)]))
+            self.assertAlmostEqual(expected.damage_dealt(0), result.damage_dealt[index][0])
+
+        game = self.make_turn_0_map()
+        scenario = [("PI", [9, 4], 0, 6), ("PI", [24, 17], 1, 1), ("EI", [20, 6], 0, 5)]
+        result = batch_simulator.BatchSimulator(game, [scenario]).run()
+        simulator = Simulator(game)
+        for unit_type, location, player_index, num in scenario:
+            simulator.add_unit(unit_type, location, player_index, num)
+        expected = simulator.run()
+        self.assertEqual(expected.frames, result.frames[0], "Units should fight with no structures on the board")
+        self.assertEqual(expected.health_delta, list(result.health_delta[0]))
+
+    def test_anytime_planner(self):
+        game = self.make_turn_0_map()
+        game.attempt_spawn("FF", [0, 13])
+        damage = lambda state: -simulate(state).health_delta[1]
+        planner = AnytimePlanner(game, damage, game.deadline(60000))
+        planner.add("one scout", lambda state: state.attempt_spawn("PI", [13, 0]))
+        planner.add("five scouts", lambda state: state.attempt_spawn("PI", [13, 0], 5), priority=1)
+        planner.add("broken", lambda state: 1 / 0, priority=2)
+        self.assertEqual("five scouts", planner.run())
+        self.assertEqual(4, planner.evaluated, "The original turn and all three candidates should be scored")
+        self.assertEqual(([("FF", 0, 13)], [("PI", 13, 0)] * 5), planner.best_stacks())
+        self.assertEqual(5.0, game.get_resource(game.MP), "Candidates should not touch the game state")
+        self.assertEqual([("FF", 0, 13)], game._build_stack)
+
+        planner = AnytimePlanner(game, damage, Deadline(0))
+        planner.add("one scout", lambda state: state.attempt_spawn("PI", [13, 0]))
+        self.assertIsNone(planner.run(), "Nothing beats the original turn once time has run out")
+        self.assertEqual(["one scout"], planner.pending())
+        self.assertEqual(([("FF", 0, 13)], []), planner.best_stacks())
+        self.assertGreater(self.make_turn_0_map().deadline().remaining_ms(), 4000)
+
+        baseline_fails = lambda state: 1 / len(state._deploy_stack)
+        planner = AnytimePlanner(game, baseline_fails, game.deadline(60000))
+        planner.add("one scout", lambda state: state.attempt_spawn("PI", [13, 0]))
+        self.assertEqual("one scout", planner.run(), "A candidate should win when the original turn could not be scored")
+        self.assertEqual(1.0, planner.best_score)
+
+    def test_precompute_worker(self):
+        started, release = threading.Event(), threading.Event()
+        seen = []
+        def work(frame):
+            started.set()
+            release.wait()
+            seen.append(frame)
+            return frame * 10
+        worker = PrecomputeWorker(work)
+        worker.submit(1)
+        started.wait(5)
+        for frame in range(2, 5):
+            worker.submit(frame)
+        release.set()
+        self.assertEqual(40, worker.collect(5000), "The newest frame should be worked on once the first finishes")
+        self.assertEqual([1, 4], seen, "Frames queued while busy should replace each other")
+        self.assertIsNone(worker.collect(), "A result should only be handed out once")
+        worker.submit(0)
+        self.assertEqual(0, worker.collect(5000))
+        worker.stop()
+
+        started, gave_up = threading.Event(), threading.Event()
+        def overrun(frame):
+            started.set()
+            while not worker.stale():
+                gave_up.wait(0.001)
+            gave_up.set()
+            return frame
+        worker = PrecomputeWorker(overrun)
+        worker.submit(1)
+        started.wait(5)
+        self.assertFalse(worker.stale())
+        self.assertIsNone(worker.collect(10), "Work that overruns the wait is not waited for")
+        self.assertTrue(gave_up.wait(5), "Work that overran should see it is stale and stop")
+        worker.stop()
+
+    def test_read_message(self):
+        turn_0 = self.make_turn_0_map().serialized_string
+        message = protocol.read_message(turn_0)
+        self.assertEqual(protocol.TURN, message.state_type)
+        self.assertEqual(turn_0, message, "A message should still be the line it came from")
+        self.assertIsNone(message._data, "Classifying a message should not decode it")
+        frame = protocol.read_message(turn_0.replace('"turnInfo":[0,', '"turnInfo":[1,'))
+        self.assertEqual(protocol.ACTION_FRAME, frame.state_type)
+        spaced = protocol.read_message(turn_0.replace('"turnInfo":[0,', '"turnInfo":[ 2,'))
+        self.assertEqual(protocol.GAME_OVER, spaced.state_type)
+        self.assertEqual(protocol.CONFIG, protocol.read_message('{"timingAndReplay":{"replaySave":1}}').state_type)
+        self.assertEqual(protocol.UNKNOWN, protocol.read_message("hello").state_type)
+
+        config = self.make_turn_0_map().config
+        game = GameState(config, message)
+        data = message.data
+        GameState(config, message)
+        self.assertIs(data, message.data, "A message should only be decoded once")
+        self.assertEqual(30.0, game.enemy_health)
+        self.assertEqual(0, GameState(config, data).turn_number)
+
+    def test_fork(self):
+        game = self.make_turn_0_map()
+        game.attempt_spawn("DF", [13, 11])
+        game.game_map.add_unit("DF", [13, 16], 1)
+        threat_map = game.get_threat_map()
+        fork = game.fork()
+        fork.attempt_spawn("DF", [14, 11])
+        fork.attempt_upgrade([13, 11])
+        fork.game_map[13, 16][0].health = 1
+        fork.game_map.remove_unit([13, 16])
+
+        self.assertEqual(1, len(game.game_map.structure_locations(0)), "Forks should not touch the parent's map")
+        self.assertEqual(90.0, game.game_map[13, 16][0].health)
+        self.assertFalse(game.game_map[13, 11][0].upgraded)
+        self.assertEqual([("DF", 13, 11)], game._build_stack)
+        self.assertEqual(23.0, game.get_resource(game.SP))
+        self.assertEqual(5.0, threat_map.damage_i[0][game.game_map.cell_id([13, 13])])
+
+        self.assertEqual([("DF", 13, 11), ("DF", 14, 11), ("UP", 13, 11)], fork._build_stack)
+        self.assertEqual(2, len(fork.game_map.structure_locations(0)))
+        self.assertEqual([], fork.game_map.structure_locations(1))
+        fresh = GameState.from_dict(game.config, json.loads(game.serialized_string))
+        for unit_type, x, y in fork._build_stack:
+            if unit_type == "UP":
+                fresh.attempt_upgrade([x, y])
+            else:
+                fresh.attempt_spawn(unit_type, [x, y])
+        self.assertEqual(list(fresh.get_threat_map().damage_i[0]), list(fork.get_threat_map().damage_i[0]), "A forked threat map should follow the fork")
+        self.assertEqual(fresh.get_resource(fresh.SP), fork.get_resource(fork.SP))
+
+    def test_deepcopy(self):
+        game = self.make_turn_0_map()
+        game.attempt_spawn("DF", [13, 11])
+        game.get_threat_map()
+        copied = copy.deepcopy(game)
+        copied.attempt_spawn("FF", [13, 12])
+        self.assertTrue(copied.game_map.has_structure([13, 12]))
+        self.assertFalse(game.game_map.has_structure([13, 12]), "A deep copy should not share the board")
+        self.assertEqual([("DF", 13, 11)], game._build_stack)
+        self.assertIs(game.cache, copied.cache, "The analysis cache is shared, not copied")
+        self.assertIs(game.game_map.geometry, copied.game_map.geometry)
+
+    def test_unit_stats_are_shared(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13, 11], 0)
+        game.game_map.add_unit("DF", [14, 11], 0)
+        first, second = game.game_map[13, 11][0], game.game_map[14, 11][0]
+        self.assertIs(first._stats, second._stats, "Units of one type should share a stat record")
+        self.assertFalse(hasattr(first, "__dict__"))
+        self.assertEqual(2.5, first.attackRange)
+        self.assertEqual([2, 0], first.cost)
+        game.attempt_upgrade([13, 11])
+        self.assertTrue(first.upgraded)
+        self.assertIsNot(first._stats, second._stats)
+        self.assertEqual(first._stats.config, game.config)
+        scout = GameUnit("PI", game.config, 0, None, 13, 0)
+        self.assertEqual(15.0, scout.health)
+        self.assertEqual(1, scout.speed)
+        self.assertFalse(scout.stationary)
+
+    def test_structure_hash(self):
+        game = self.make_turn_0_map()
+        empty = game.game_map.structure_hash
+        game.game_map.add_unit("DF", [13, 11], 0)
+        game.game_map.add_unit("FF", [14, 16], 1)
+        other = self.make_turn_0_map()
+        other.game_map.add_unit("FF", [14, 16], 1)
+        other.game_map.add_unit("DF", [13, 11], 0)
+        self.assertEqual(game.game_map.structure_hash, other.game_map.structure_hash, "Placement order should not matter")
+        before = game.game_map.structure_hash
+        game.game_map[13, 11][0].health = 1
+        self.assertEqual(before, game.game_map.structure_hash, "Health is not part of the hash")
+        game.attempt_upgrade([13, 11])
+        self.assertNotEqual(before, game.game_map.structure_hash)
+        fork = game.fork()
+        fork.game_map.remove_unit([13, 11])
+        fork.game_map.remove_unit([14, 16])
+        self.assertEqual(empty, fork.game_map.structure_hash)
+        self.assertNotEqual(empty, game.game_map.structure_hash)
+
+    def test_analysis_cache(self):
+        cache = AnalysisCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(1, cache.get("a"))
+        cache.put("c", 3)
+        self.assertNotIn("b", cache, "The least recently used entry should be dropped")
+        self.assertEqual(3, cache.memoize("c", lambda: 4))
+        self.assertEqual(5, cache.memoize("d", lambda: 5))
+        self.assertEqual([2, 1], [cache.hits, cache.misses])
+
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("FF", [14, 15], 0)
+        path = game.find_path_to_edge([13, 0])
+        hits = game.cache.hits
+        fork = game.fork()
+        self.assertEqual(path, fork.find_path_to_edge([13, 0]))
+        self.assertEqual(hits + 1, game.cache.hits, "A fork with the same structures should reuse the path")
+        fork.game_map.add_unit("FF", [16, 3], 0)
+        self.assertNotEqual(path, fork.find_path_to_edge([13, 0]))
+        path[1][0] = -5
+        self.assertEqual([13, 1], game.find_path_to_edge([13, 0])[1], "Cached paths should not be changed by callers")
+
     def _test_get_attackers(self):
         game = self.make_turn_0_map()
         
@@ -256,6 +689,120 @@ class BasicTests(unittest.TestCase):
         game.game_map.add_unit("DF", [14,14], 1)
         self.assertEqual(3, len(game.get_attackers([13,13], 0)), "We should be in danger from 3 places")
 
+    def test_referee(self):
+        config = self.make_turn_0_map().config
+        class Rusher(AlgoCore):
+            def on_turn(self, turn_state):
+                game = GameState(self.config, turn_state)
+                game.attempt_spawn("PI", [13, 0], 1000)
+                game.submit_turn()
+        class Idle(AlgoCore):
+            def on_turn(self, turn_state):
+                GameState(self.config, turn_state).submit_turn()
+        received = []
+        class Recorder(Idle):
+            def on_turn(self, turn_state):
+                received.append(turn_state)
+                Idle.on_turn(self, turn_state)
+
+        result = play_game(config, Rusher, Idle, seed=1)
+        self.assertEqual(1, result.winner, "Scouts walking into an empty board should win")
+        self.assertEqual(0, result.health[1])
+        self.assertEqual(40, result.health[0])
+        self.assertEqual([False, False], result.crashed)
+
+        class Broken(Idle):
+            def on_turn(self, turn_state):
+                raise ValueError("broken")
+        result = play_game(config, Broken, Idle)
+        self.assertEqual(2, result.winner, "An algo that raises should lose")
+        self.assertEqual([True, False], result.crashed)
+        self.assertIn("ValueError", result.errors[0])
+
+        play_game(config, Recorder, Idle, max_turns=1)
+        self.assertIsInstance(received[0], protocol.Message, "Turns should be passed the same way as action frames")
+        self.assertEqual(protocol.TURN, received[0].state_type)
+        self.assertEqual(received[0].data, json.loads(received[0]))
+
+    def test_event_map(self):
+        from .event_map import EventMap, BREACHES, DAMAGE, UNITS_LOST
+        def frame(turn, breaches=(), damage=(), deaths=()):
+            events = {"breach": list(breaches), "damage": list(damage), "death": list(deaths)}
+            return json.dumps({"turnInfo": [1, turn, 0, 0], "events": events})
+
+        event_map = EventMap(decay=0.5)
+        event_map.add_frame(frame(1, breaches=[[[0, 13], 1.0, 3, "7", 2], [[0, 13], 1.0, 3, "8", 2]], deaths=[[[0, 13], 3, "7", 2, False]]))
+        event_map.add_frame(frame(1, breaches=[[[27, 13], 1.0, 3, "9", 2], [[5, 22], 1.0, 3, "10", 1]]))
+        event_map.add_frame(frame(3, damage=[[[13, 11], 4.0, 2, "3", 1]], deaths=[[[13, 11], 2, "3", 1, False], [[12, 11], 0, "4", 1, True]]))
+        self.assertEqual([[0, 13], [27, 13]], event_map.locations(BREACHES, 0), "Each location once, most breached first")
+        self.assertEqual([[5, 22]], event_map.locations(BREACHES, 1))
+        self.assertEqual(0.5, event_map.weight(BREACHES, 0, [0, 13]), "Two breaches two turns ago should have decayed by 0.5 ** 2")
+        self.assertEqual([[0, 13]], event_map.locations(BREACHES, 0, min_weight=0.5))
+        self.assertEqual(3.0, event_map.turn_totals[BREACHES][0][1], "Per turn totals should not decay")
+        self.assertEqual(4.0, event_map.weight(DAMAGE, 0, [13, 11]))
+        self.assertEqual([[13, 11]], event_map.locations(UNITS_LOST, 0), "Removed units and units that scored are not lost")
+        self.assertEqual(0, event_map.total(UNITS_LOST, 1))
+
+        config = self.make_turn_0_map().config
+        class Rusher(AlgoCore):
+            def on_turn(self, turn_state):
+                game = GameState(self.config, turn_state)
+                game.attempt_spawn("PI", [13, 0], 1000)
+                game.submit_turn()
+        class Idle(AlgoCore):
+            def on_turn(self, turn_state):
+                GameState(self.config, turn_state).submit_turn()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "game.replay")
+            play_game(config, Rusher, Idle, replay_path=path, seed=1)
+            history = EventMap()
+            history.add_replay(path, player=2)
+            self.assertGreaterEqual(history.total(BREACHES, 0), 30, "Player 2 was scored on until it had no health left")
+            self.assertEqual(0, history.total(BREACHES, 1))
+            self.assertTrue(all(location[1] < 14 for location in history.locations(BREACHES, 0)), "Player 2's edges are at the bottom when it is player index 0")
+            self.assertIsNone(history.turn, "The next game's frames should start a new timeline")
+
+    def test_build_plan(self):
+        from .build_plan import BuildPlan, BUILT, IDLE, NEVER, at_turn
+        game = self.make_turn_0_map()
+        plan = BuildPlan()
+        plan.build("DF", [[3, 12], [24, 12]])
+        plan.spawn("FF", [[3, 13], [24, 13]], repair=0.5)
+        result = plan.execute(game)
+        self.assertTrue(result.completed)
+        self.assertEqual([[3, 12], [24, 12], [3, 13], [24, 13]], result.spawned)
+        self.assertEqual([[3, 12], [24, 12]], result.upgraded)
+        self.assertEqual(11.0, game.get_resource(game.SP), "Two upgraded turrets and two walls cost 14 SP")
+        self.assertEqual([], plan.execute(game).spawned, "Nothing is left to do once the plan is complete")
+
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("FF", [3, 13])
+        game.game_map[3, 13][0].health = 10
+        plan.execute(game)
+        self.assertEqual([("DF", 3, 12), ("UP", 3, 12), ("DF", 24, 12), ("UP", 24, 12), ("RM", 3, 13), ("FF", 24, 13)], game._build_stack,
+            "The damaged wall should be removed rather than counted as built")
+
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("EF", [24, 12])
+        result = plan.execute(game)
+        self.assertFalse(result.completed)
+        self.assertEqual(0, result.stopped_at, "A support where a turret belongs leaves the first stage incomplete")
+        self.assertEqual([[3, 12]], result.spawned)
+
+        game = self.make_turn_0_map()
+        game.attempt_spawn("FF", [[0, 13], [1, 13]])
+        staged = BuildPlan(stop=BUILT).spawn("FF", [[0, 13], [1, 13]]).upgrade([[0, 13]]).spawn("FF", [[2, 13]])
+        self.assertEqual(1, staged.execute(game).stopped_at, "Nothing to spawn in the first stage, so the upgrade runs and stops the plan")
+        self.assertEqual([[0, 13]], staged.execute(self.make_turn_0_map()).spawned[:1])
+        idle = BuildPlan(stop=NEVER).remove([[0, 13]], when=at_turn(1)).upgrade([[5, 13]], stop=IDLE).spawn("FF", [[5, 13]])
+        result = idle.execute(self.make_turn_0_map())
+        self.assertEqual(([], 1), (result.spawned, result.stopped_at), "The remove stage is skipped on turn 0 and the idle upgrade stops the plan")
+
+        self.assertEqual(["1. build DF at [3, 12] [24, 12], stop if incomplete", "2. spawn FF at [3, 13] [24, 13], repair below 0.5, stop if incomplete"], plan.describe())
+        self.assertEqual("1. remove at [0, 13], when turn == 1, never stop", idle.describe()[0])
+        self.assertEqual([], plan.diff(plan))
+        self.assertIn("-2. spawn FF at [3, 13] [24, 13], repair below 0.5, stop if incomplete", plan.diff(BuildPlan().build("DF", [[3, 12], [24, 12]])))
+
     def test_print_unit(self):
         game = self.make_turn_0_map()
 
@@ -0,0 +1,167 @@
+from array import array
+
+
+class ThreatMap:
+    """Tracks how much damage each player's structures can deal to every tile of a GameMap
+
+    The map is filled once from the structures on the board, then kept in sync through
+    GameMap.add_structure_listener, so spawning, upgrading or removing a structure only
+    touches the tiles inside that structure's range. Upgraded ranges and damage are honored.
+
+    A structure threatens a tile when the distance between their centers is at most its
+    attackRange, the same rule GameState.get_attackers uses. Structures that deal no damage
+    are ignored.
+
+    Attributes :
+        * game_map (:obj: GameMap): The map being tracked
+        * damage_i (list): Two array('d') indexed by cell id, one per attacking player index. damage_i[p][cell] is the total attackDamageWalker player p's structures deal to mobile units on that tile each frame
+        * damage_f (list): The same as damage_i for attackDamageTower, the damage dealt to structures
+
+    """
+    def __init__(self, game_map):
+        """Builds the threat arrays from the structures currently on a map and starts listening for changes
+
+        Args:
+            game_map: The GameMap to track
+
+        """
+        self.game_map = game_map
+        self.__geometry = game_map.geometry
+        cells = len(self.__geometry.in_bounds)
+        self.damage_i = [array('d', [0.0]) * cells, array('d', [0.0]) * cells]
+        self.damage_f = [array('d', [0.0]) * cells, array('d', [0.0]) * cells]
+        self.__attackers = [[None] * cells, [None] * cells]
+        self.__applied = [None] * cells
+        self.__stats = []
+        for unit_info in game_map.config["unitInformation"]:
+            upgrade_info = unit_info.get("upgrade", {})
+            base = (unit_info.get("attackRange", 0), unit_info.get("attackDamageWalker", 0), unit_info.get("attackDamageTower", 0))
+            upgraded = (upgrade_info.get("attackRange", base[0]), upgrade_info.get("attackDamageWalker", base[1]), upgrade_info.get("attackDamageTower", base[2]))
+            self.__stats.append((base, upgraded))
+
+        types = game_map.structure_types
+        for cell in self.__geometry.cells:
+            if types[cell] >= 0:
+                self.__apply(cell)
+        game_map.add_structure_listener(self.structure_changed)
+
+    def structure_changed(self, cell):
+        """Recomputes the contribution of the structure on a cell. Called by the GameMap
+
+        Args:
+            cell: The cell id of the structure that was placed, removed or upgraded
+
+        """
+        self.__withdraw(cell)
+        self.__apply(cell)
+
+    def fork(self, game_map):
+        """Copies this ThreatMap onto a fork of the map it tracks, without rebuilding it from the board
+        The per tile tuples of structure cells are never changed in place, so the fork shares them.
+
+        Args:
+            game_map: A GameMap forked from this one's game_map, with no changes made to it since
+
+        Returns:
+            A ThreatMap following game_map
+
+        """
+        fork = ThreatMap.__new__(ThreatMap)
+        fork.__dict__.update(self.__dict__)
+        fork.game_map = game_map
+        fork.damage_i = [totals[:] for totals in self.damage_i]
+        fork.damage_f = [totals[:] for totals in self.damage_f]
+        fork.__attackers = [list(attackers) for attackers in self.__attackers]
+        fork.__applied = list(self.__applied)
+        game_map.add_structure_listener(fork.structure_changed)
+        return fork
+
+    def detach(self):
+        """Stops following changes to the GameMap"""
+        self.game_map.remove_structure_listener(self.structure_changed)
+
+    def __apply(self, cell):
+        game_map = self.game_map
+        type_index = game_map.structure_types[cell]
+        if type_index < 0:
+            return
+        attack_range, damage_i, damage_f = self.__stats[type_index][1 if game_map.structure_upgraded[cell] else 0]
+        if damage_i + damage_f <= 0:
+            return
+        owner = game_map.structure_owners[cell]
+        if owner not in (0, 1):
+            return
+        covered = self.__geometry.cells_within(cell, attack_range)
+        totals_i = self.damage_i[owner]
+        totals_f = self.damage_f[owner]
+        attackers = self.__attackers[owner]
+        for target in covered:
+            totals_i[target] += damage_i
+            totals_f[target] += damage_f
+            attackers[target] = (cell,) if attackers[target] is None else attackers[target] + (cell,)
+        self.__applied[cell] = (owner, damage_i, damage_f, covered)
+
+    def __withdraw(self, cell):
+        applied = self.__applied[cell]
+        if applied is None:
+            return
+        owner, damage_i, damage_f, covered = applied
+        totals_i = self.damage_i[owner]
+        totals_f = self.damage_f[owner]
+        attackers = self.__attackers[owner]
+        for target in covered:
+            totals_i[target] -= damage_i
+            totals_f[target] -= damage_f
+            attackers[target] = tuple(other for other in attackers[target] if other != cell) or None
+        self.__applied[cell] = None
+
+    def attacker_cells(self, location, player_index):
+        """Gets the cells of the structures threatening a tile
+
+        Args:
+            location: An in bounds [x, y] location
+            player_index: The player defending the tile, 0 for you 1 for the enemy
+
+        Returns:
+            The cell ids of the enemy structures in range, in the order GameState.get_attackers reports them
+
+        """
+        cells = self.__attackers[1 - player_index][self.__geometry.cell_id(location)]
+        if not cells:
+            return []
+        xy = self.__geometry.xy
+        return sorted(cells, key=xy.__getitem__)
+
+    def get_attackers(self, location, player_index):
+        """Gets the structures threatening a tile
+
+        Args:
+            location: An in bounds [x, y] location
+            player_index: The player defending the tile, 0 for you 1 for the enemy
+
+        Returns:
+            A list of GameUnits that would attack a unit controlled by player_index at location
+
+        """
+        xy = self.__geometry.xy
+        return [self.game_map.get_structure(xy[cell]) for cell in self.attacker_cells(location, player_index)]
+
+    def path_damage(self, path, player_index, damage_type="i"):
+        """Adds up the damage a unit would be exposed to on each tile of a path
+
+        Args:
+            path: A list of [x, y] locations, or cell ids such as the arrays from GameState.find_all_edge_paths
+            player_index: The player controlling the unit, 0 for you 1 for the enemy
+            damage_type: "i" for the damage dealt to mobile units, "f" for the damage dealt to structures
+
+        Returns:
+            The sum over the path of the enemy damage per frame on each tile
+
+        """
+        totals = (self.damage_i if damage_type == "i" else self.damage_f)[1 - player_index]
+        if not path:
+            return 0
+        if not isinstance(path[0], (list, tuple)):
+            return sum(totals[cell] for cell in path)
+        size = self.__geometry.arena_size
+        return sum(totals[int(y) * size + int(x)] for x, y in path)
@@ -1,3 +1,7 @@
+from collections import namedtuple
+from operator import attrgetter
+
+
 def is_stationary(unit_type, structure_types):
     """
         Args:
@@ -9,9 +13,64 @@ def is_stationary(unit_type, structure_types):
     return unit_type in structure_types
 
 
+_STATS_CACHE = {}
+_STATS_CACHE_SIZE = 8
+
+UnitStats = namedtuple("UnitStats", ["unit_type", "config", "upgraded", "stationary", "speed", "damage_f", "damage_i",
+                                     "attackRange", "shieldRange", "max_health", "shieldPerUnit", "cost"])
+UnitStats.__doc__ = """The fixed stats of a unit type, before or after upgrading. One record is shared by every GameUnit of that type"""
+
+
+def get_unit_stats(config, unit_type, upgraded=False):
+    """Gets the shared stat record for a unit type, building the records for a config the first time it is seen
+
+    Args:
+        config (JSON): Contains information about the game
+        unit_type: The shorthand of a unit type
+        upgraded: If True, the stats after upgrading
+
+    Returns:
+        A UnitStats
+
+    """
+    entry = _STATS_CACHE.get(id(config))
+    if entry is None or entry[0] is not config:
+        if len(_STATS_CACHE) >= _STATS_CACHE_SIZE:
+            _STATS_CACHE.clear()
+        entry = (config, _build_unit_stats(config))
+        _STATS_CACHE[id(config)] = entry
+    return entry[1][unit_type, upgraded]
+
+
+def _build_unit_stats(config):
+    records = {}
+    for type_config in config["unitInformation"]:
+        unit_type = type_config.get("shorthand")
+        base = UnitStats(unit_type, config, False, type_config.get("unitCategory") == 0, type_config.get("speed", 0),
+                         type_config.get("attackDamageTower", 0), type_config.get("attackDamageWalker", 0),
+                         type_config.get("attackRange", 0), type_config.get("shieldRange", 0), type_config.get("startHealth", 0),
+                         type_config.get("shieldPerUnit", 0), (type_config.get("cost1", 0), type_config.get("cost2", 0)))
+        upgrade_config = type_config.get("upgrade", {})
+        upgraded = base._replace(upgraded=True,
+                                 speed=upgrade_config.get("speed", base.speed),
+                                 damage_f=upgrade_config.get("attackDamageTower", base.damage_f),
+                                 damage_i=upgrade_config.get("attackDamageWalker", base.damage_i),
+                                 attackRange=upgrade_config.get("attackRange", base.attackRange),
+                                 shieldRange=upgrade_config.get("shieldRange", base.shieldRange),
+                                 max_health=upgrade_config.get("startHealth", base.max_health),
+                                 shieldPerUnit=upgrade_config.get("shieldPerUnit", base.shieldPerUnit),
+                                 cost=(upgrade_config.get("cost1", 0) + base.cost[0], upgrade_config.get("cost2", 0) + base.cost[1]))
+        records[unit_type, False] = base
+        records[unit_type, True] = upgraded
+    return records
+
+
 class GameUnit:
     """Holds information about a Unit. 
 
+    The stats of a unit's type are read from a UnitStats record shared by every unit of that type,
+    so a GameUnit only stores its record, owner, position, health and flags.
+
     Attributes :
         * unit_type (string): This unit's type
         * config (JSON): Contains information about the game
@@ -32,48 +91,28 @@ class GameUnit:
         * upgraded (boolean): If this unit is upgraded
 
     """
+    __slots__ = ("_stats", "player_index", "x", "y", "health", "pending_removal", "upgraded")
+
     def __init__(self, unit_type, config, player_index=None, health=None, x=-1, y=-1):
         """ Initialize unit variables using args passed
 
         """
-        self.unit_type = unit_type
-        self.config = config
+        self._stats = get_unit_stats(config, unit_type)
         self.player_index = player_index
         self.pending_removal = False
         self.upgraded = False
         self.x = x
         self.y = y
-        self.__serialize_type()
-        self.health = self.max_health if not health else health
-
-    def __serialize_type(self):
-        from .game_state import STRUCTURE_TYPES, UNIT_TYPE_TO_INDEX, SUPPORT
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]]
-        self.stationary = type_config["unitCategory"] == 0
-        self.speed = type_config.get("speed", 0)
-        self.damage_f = type_config.get("attackDamageTower", 0)
-        self.damage_i = type_config.get("attackDamageWalker", 0)
-        self.attackRange = type_config.get("attackRange", 0)
-        self.shieldRange = type_config.get("shieldRange", 0)
-        self.max_health = type_config.get("startHealth", 0)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", 0)
-        self.cost = [type_config.get("cost1", 0), type_config.get("cost2", 0)]
+        self.health = self._stats.max_health if not health else health
 
+    @property
+    def cost(self):
+        return list(self._stats.cost)
 
     def upgrade(self):
-        from .game_state import UNIT_TYPE_TO_INDEX
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]].get("upgrade", {})
-        self.speed = type_config.get("speed", self.speed)
-        self.damage_f = type_config.get("attackDamageTower", self.damage_f)
-        self.damage_i = type_config.get("attackDamageWalker", self.damage_i)
-        self.attackRange = type_config.get("attackRange", self.attackRange)
-        self.shieldRange = type_config.get("shieldRange", self.shieldRange)
-        self.max_health = type_config.get("startHealth", self.max_health)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", self.shieldPerUnit)
-        self.cost = [type_config.get("cost1", 0) + self.cost[0], type_config.get("cost2", 0) + self.cost[1]]
+        self._stats = get_unit_stats(self._stats.config, self._stats.unit_type, True)
         self.upgraded = True
 
-
     def __toString(self):
         owner = "Friendly" if self.player_index == 0 else "Enemy"
         removal = ", pending removal" if self.pending_removal else ""
@@ -85,3 +124,7 @@ class GameUnit:
     def __repr__(self):
         return self.__toString()
 
+
+for _field in ("unit_type", "config", "stationary", "speed", "damage_f", "damage_i", "attackRange", "shieldRange", "max_health", "shieldPerUnit"):
+    setattr(GameUnit, _field, property(attrgetter("_stats." + _field)))
+del _field
@@ -3,6 +3,8 @@ import sys
 
 BANNER_TEXT = "---------------- Starting Your Algo --------------------"
 
+_command_receiver = None
+
 
 def get_command():
     """Gets input from stdin
@@ -21,11 +23,31 @@ def get_command():
         exit()
     return ret
 
+def set_command_receiver(receiver):
+    """Sends commands to a function instead of standard output.
+    Used by referee.Referee to play algos in the same process as the game
+
+    Args:
+        receiver: A function called with every command sent, or None to go back to standard output
+
+    """
+    global _command_receiver
+    _command_receiver = receiver
+
+def command_receiver():
+    """The function set with set_command_receiver, or None when commands go to standard output
+
+    """
+    return _command_receiver
+
 def send_command(cmd):
     """Sends your turn to standard output.
     Should usually only be called by 'GameState.submit_turn()'
 
     """
+    if _command_receiver is not None:
+        _command_receiver(cmd)
+        return
     sys.stdout.write(cmd.strip() + "\n")
     sys.stdout.flush()
 
@@ -8,6 +8,8 @@ import json
 
 from constants import *
 from actions import *
+from gamelib.event_map import BREACHES
+from gamelib.build_plan import BUILT
 
 """ This strategy does nothing and is just to debug """
 class EmptyStrategy(gamelib.AlgoCore):
@@ -64,8 +66,8 @@ class DefaultStrategy(gamelib.AlgoCore):
             "INTERCEPTOR": config["unitInformation"][5]["shorthand"],
         }
 
-        # List of locations scored on
-        self.scored_on_locations = []
+        # Where we got scored on, and how often
+        self.event_map = gamelib.EventMap()
 
     def on_turn(self, turn_state):
         game_state = gamelib.GameState(self.config, turn_state)
@@ -88,7 +90,7 @@ class DefaultStrategy(gamelib.AlgoCore):
         # First, place basic defenses
         build_defences(game_state, self.units)
         # Now build reactive defenses based on where the enemy scored
-        build_reactive_defense(game_state, self.units, self.scored_on_locations)
+        build_reactive_defense(game_state, self.units, self.event_map.locations(BREACHES, 0))
 
         # If the turn is less than 5, stall with interceptors and wait to see enemy's base
         if game_state.turn_number < 5:
@@ -114,19 +116,8 @@ class DefaultStrategy(gamelib.AlgoCore):
                 game_state.attempt_spawn(self.units["SUPPORT"], support_locations)
 
     def on_action_frame(self, turn_string):
-        # Let's record at what position we get scored on
-        state = json.loads(turn_string)
-        events = state["events"]
-        breaches = events["breach"]
-        for breach in breaches:
-            location = breach[0]
-            unit_owner_self = True if breach[4] == 1 else False
-            # When parsing the frame data directly, 
-            # 1 is integer for yourself, 2 is opponent (StarterKit code uses 0, 1 as player_index instead)
-            if not unit_owner_self:
-                gamelib.debug_write("Got scored on at: {}".format(location))
-                self.scored_on_locations.append(location)
-                gamelib.debug_write("All locations: {}".format(self.scored_on_locations))
+        # Let's record at what position we get scored on (and the damage and units we lose)
+        self.event_map.add_frame(turn_string)
 
 
 """ Strategy using V shaped defense and agents sent accross the edge """
@@ -155,14 +146,19 @@ class V1Strategy(gamelib.AlgoCore):
         self.prev_enemy_health = 0
         self.consecutive_blocked = 0 # Number of consecutive attacks blocked
 
+        # Defense in stages (as long as nothing spawned in earlier stages, keep attempting higher stage spawns)
+        self.defense_plan = gamelib.BuildPlan(stop=BUILT)
+        self.defense_plan.spawn(self.units["TURRET"], [[3, 12], [6, 9], [9, 6], [12, 3], [15, 3], [18, 6], [21, 9], [24, 12]])
+        self.defense_plan.spawn(self.units["SUPPORT"], [[13, 2], [14, 2], [13, 3], [14, 3]])
+        self.defense_plan.upgrade([[3, 12], [24, 12]])
+        self.defense_plan.upgrade([[13, 2], [14, 2]])
+        self.defense_plan.compile(config)
+
 
     def on_turn(self, turn_state):
         game_state = gamelib.GameState(self.config, turn_state)
         gamelib.debug_write('Performing turn {} of your custom algo strategy'.format(game_state.turn_number))
         game_state.suppress_warnings(True) # Comment or remove this line to enable warnings.
-        
-        num_stationary_spawned = 0
-        support_upgrade_ready = False
 
         # Update stats
         my_health_change = 0
@@ -178,34 +174,8 @@ class V1Strategy(gamelib.AlgoCore):
         else:
             self.consecutive_blocked = 0
 
-        # Update defense in stages (as long as nothing spawned in earlier stages, keep attempting highr stage spawns)
-
-        # Stage 1
-        if num_stationary_spawned == 0:
-            turret_locations_1 = [[3, 12], [6, 9], [9, 6], [12, 3], [15, 3], [18, 6], [21, 9], [24, 12]]
-            num_stationary_spawned += game_state.attempt_spawn(self.units["TURRET"], turret_locations_1)
-
-        # Stage 2
-        if num_stationary_spawned == 0:
-            support_locations_1 = [[13, 2], [14, 2], [13, 3], [14, 3]]
-            num_stationary_spawned += game_state.attempt_spawn(self.units["SUPPORT"], support_locations_1)
-
-        # Stage 3
-        if num_stationary_spawned == 0:
-            turret_upgrade_locations_1 = [[3, 12], [24, 12]]
-            num_stationary_spawned += game_state.attempt_upgrade(turret_upgrade_locations_1)
-
-        # Stage 4
-        if num_stationary_spawned == 0:
-            support_upgrade_ready = True
-            support_upgrade_locations_1 = [[13, 2], [14, 2]]
-            num_stationary_spawned += game_state.attempt_upgrade(support_upgrade_locations_1)
-        
-        # Stage 5
-        # Fill in the v wall gaps
-
-        # Stage 6
-        # Extra reinforcements
+        # Update defense
+        self.defense_plan.execute(game_state)
 
         # Update offense
 
@@ -373,26 +343,6 @@ class Y1Strategy(gamelib.AlgoCore):
         # Side to launch attacks from (left = -1, right = 1)
         self.attack_side = -1
 
-    def run_deploy_stage(self, game_state, unit_type, locations):
-        game_state.attempt_spawn(unit_type, locations)
-        return all(units_deployed_locations(game_state, unit_type, locations))
-    
-    def run_upgrade_stage(self, game_state, unit_type, locations):
-        game_state.attempt_upgrade(locations)
-        return all(units_upgraded_locations(game_state, unit_type, locations))
-    
-    def run_deploy_upgraded_stage(self, game_state, unit_type, locations):
-        for location in locations:
-            completed = self.run_deploy_stage(game_state, unit_type, [location])
-            completed = self.run_upgrade_stage(game_state, unit_type, [location])
-            if not completed: return False
-        return all(units_deployed_locations(game_state, unit_type, locations)) and all(units_upgraded_locations(game_state, unit_type, locations))
-
-    def on_turn(self, turn_state):
-        game_state = gamelib.GameState(self.config, turn_state)
-        gamelib.debug_write('Performing turn {} of your custom algo strategy'.format(game_state.turn_number))
-        game_state.suppress_warnings(True) # Comment or remove this line to enable warnings.
-        gamelib.debug_write("...")
         # Key locations
         edge_turret_locations_1 = [[2, 13], [25, 13], [3, 13],  [24, 13], [6, 13], [21, 13]]
         edge_turret_locations_2 = [[3, 12], [25, 12], [4, 13], [23, 13]]
@@ -408,41 +358,26 @@ class Y1Strategy(gamelib.AlgoCore):
         support_line_locations_1 = [[4, 12], [5, 11], [6, 10], [7, 9], [8, 8], [9, 7], [10, 6], [11, 5], [12, 4], [13, 3], [14, 2], [15, 1]]
         support_line_locations_1.reverse()
 
-        # Update defense in stages (as long as nothing spawned in earlier stages, keep attempting highr stage spawns)
+        # Update defense in stages (each stage waits until the ones before it are complete)
         # TODO - break up stages so deploy and upgrade happen togethor, big launch could be a one hit done - avert detection, need to think about smart fire timing strategy
-        completed_stage = True
-
-        # Supports in back
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_deploy_stage(game_state, self.units["SUPPORT"], back_support_locations)
-
-        # Side turret defense + upgrade
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_deploy_upgraded_stage(game_state, self.units["TURRET"], edge_turret_locations_1)
-        
-        # Wall L1
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_deploy_upgraded_stage(game_state, self.units["TURRET"], wall_locations_1)
-
-        # Support line (block right)
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_deploy_stage(game_state, self.units["SUPPORT"], support_line_locations_1)
+        self.defense_plan = gamelib.BuildPlan()
+        self.defense_plan.spawn(self.units["SUPPORT"], back_support_locations, name="Supports in back")
+        self.defense_plan.build(self.units["TURRET"], edge_turret_locations_1, name="Side turret defense + upgrade")
+        self.defense_plan.build(self.units["TURRET"], wall_locations_1, name="Wall L1")
+        self.defense_plan.spawn(self.units["SUPPORT"], support_line_locations_1, name="Support line (block right)")
+        self.defense_plan.build(self.units["TURRET"], wall_locations_2, name="Wall L2")
+        self.defense_plan.upgrade(back_support_locations, name="Upgrade supports in back")
+        self.defense_plan.build(self.units["WALL"], wall_locations_3, name="Wall L3")
+        self.defense_plan.upgrade(support_line_locations_1, name="Upgrade support line")
+        self.defense_plan.compile(config)
 
-        # Wall L1
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_deploy_upgraded_stage(game_state, self.units["TURRET"], wall_locations_2)
-
-        # Upgrade support line
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_upgrade_stage(game_state, self.units["SUPPORT"], back_support_locations)
-        
-        # Wall L3
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_deploy_upgraded_stage(game_state, self.units["WALL"], wall_locations_3)
+    def on_turn(self, turn_state):
+        game_state = gamelib.GameState(self.config, turn_state)
+        gamelib.debug_write('Performing turn {} of your custom algo strategy'.format(game_state.turn_number))
+        game_state.suppress_warnings(True) # Comment or remove this line to enable warnings.
+        gamelib.debug_write("...")
 
-        # Upgrade support line
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_upgrade_stage(game_state, self.units["SUPPORT"], support_line_locations_1)
+        self.defense_plan.execute(game_state)
 
         """
         # Support in back
@@ -657,36 +592,6 @@ class WallStrategy(gamelib.AlgoCore):
         self.weak_locations = []
         self.adapted_defense_locations = []
 
-    def run_deploy_stage(self, game_state, unit_type, locations):
-        game_state.attempt_spawn(unit_type, locations)
-        return all(units_deployed_locations(game_state, unit_type, locations))
-    
-    def run_upgrade_stage(self, game_state, unit_type, locations):
-        game_state.attempt_upgrade(locations)
-        return all(units_upgraded_locations(game_state, unit_type, locations))
-    
-    def remove_damaged_units(self, game_state, unit_type, locations):
-        need_repair = units_repair_locations(game_state, unit_type, locations, critical_health=0.5)
-        repair_locations = [l for (l, r) in zip(locations, need_repair) if r]
-        self.weak_locations += repair_locations
-
-        if len(repair_locations) > 0: game_state.attempt_remove(repair_locations)
-    
-    def run_deploy_upgraded_stage(self, game_state, unit_type, locations, repair=True):
-        if repair:
-            self.remove_damaged_units(game_state, unit_type, locations)
-
-        for location in locations:
-            completed = self.run_deploy_stage(game_state, unit_type, [location])
-            completed = self.run_upgrade_stage(game_state, unit_type, [location])
-            if not completed: return False
-        return all(units_deployed_locations(game_state, unit_type, locations)) and all(units_upgraded_locations(game_state, unit_type, locations))
-
-    def on_turn(self, turn_state):
-        game_state = gamelib.GameState(self.config, turn_state)
-        gamelib.debug_write('Performing turn {} of your custom algo strategy'.format(game_state.turn_number))
-        game_state.suppress_warnings(True) # Comment or remove this line to enable warnings.
-
         # Key locations
         core_turret_locations_1 = [[3, 12], [24, 12]]
         core_turret_locations_2 = [[8, 12], [19, 12]]
@@ -704,38 +609,33 @@ class WallStrategy(gamelib.AlgoCore):
         primary_wall_locations_5 = [[12, 13], [15, 13]]
         primary_wall_locations_6 = [[13, 12], [14, 12]]
 
-        # Update defense in stages (as long as nothing spawned in earlier stages, keep attempting highr stage spawns)
-        completed_stage = True
-
-        # Core turret defense + upgrade
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_deploy_upgraded_stage(game_state, self.units["TURRET"], core_turret_locations_1, repair=False)
-
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_deploy_upgraded_stage(game_state, self.units["TURRET"], core_turret_locations_2, repair=False)
-
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_deploy_upgraded_stage(game_state, self.units["TURRET"], core_turret_locations_3, repair=False)
-
-        # Primary wall + upgrade
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_deploy_upgraded_stage(game_state, self.units["WALL"], primary_wall_locations_1)
+        # Update defense in stages (each stage waits until the ones before it are complete)
+        # Core turret defense + upgrade, then primary wall + upgrade, repairing damaged walls
+        self.primary_plan = gamelib.BuildPlan()
+        for locations in [core_turret_locations_1, core_turret_locations_2, core_turret_locations_3]:
+            self.primary_plan.build(self.units["TURRET"], locations)
+        for locations in [primary_wall_locations_1, primary_wall_locations_2, primary_wall_locations_3,
+                            primary_wall_locations_4, primary_wall_locations_5, primary_wall_locations_6]:
+            self.primary_plan.build(self.units["WALL"], locations, repair=0.5)
+        self.primary_plan.compile(config)
+
+        # Adapted turrets + upgrade, rebuilt whenever a location is added
+        self.adapted_plan = None
+
+        # Edge turrets + upgrade
+        self.edge_plan = gamelib.BuildPlan()
+        self.edge_plan.build(self.units["TURRET"], edge_turret_locations_1, repair=0.5)
+        self.edge_plan.build(self.units["TURRET"], edge_turret_locations_2, repair=0.5)
+        self.edge_plan.compile(config)
 
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_deploy_upgraded_stage(game_state, self.units["WALL"], primary_wall_locations_2)
+    def on_turn(self, turn_state):
+        game_state = gamelib.GameState(self.config, turn_state)
+        gamelib.debug_write('Performing turn {} of your custom algo strategy'.format(game_state.turn_number))
+        game_state.suppress_warnings(True) # Comment or remove this line to enable warnings.
 
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_deploy_upgraded_stage(game_state, self.units["WALL"], primary_wall_locations_3)
-        
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_deploy_upgraded_stage(game_state, self.units["WALL"], primary_wall_locations_4)
-        
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_deploy_upgraded_stage(game_state, self.units["WALL"], primary_wall_locations_5)
-        
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_deploy_upgraded_stage(game_state, self.units["WALL"], primary_wall_locations_6)
-        
+        result = self.primary_plan.execute(game_state)
+        self.weak_locations += result.removed
+        completed_stage = result.completed
         if completed_stage:
             self.primary_wall_built = True
 
@@ -745,18 +645,14 @@ class WallStrategy(gamelib.AlgoCore):
             max_critical_defense_location = [int(statistics.median(weak_x)), 11]
             self.weak_locations = []
             self.adapted_defense_locations.append(max_critical_defense_location)
-            
-        # Adapted turrets + upgrade
-        if len(self.adapted_defense_locations) > 0 and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_deploy_upgraded_stage(game_state, self.units["TURRET"], self.adapted_defense_locations, repair=False)
-
-        # Edge turret + upgrade
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_deploy_upgraded_stage(game_state, self.units["TURRET"], edge_turret_locations_1)
-
-        # Edge turret + upgrade
-        if completed_stage and game_state.get_resource(SP) > 0:
-            completed_stage = self.run_deploy_upgraded_stage(game_state, self.units["TURRET"], edge_turret_locations_2)
+            self.adapted_plan = gamelib.BuildPlan().build(self.units["TURRET"], self.adapted_defense_locations)
+
+        if self.adapted_plan is not None and game_state.get_resource(SP) > 0:
+            completed_stage = self.adapted_plan.execute(game_state).completed
+
+        if completed_stage:
+            result = self.edge_plan.execute(game_state)
+            self.weak_locations += result.removed
 
 
         if game_state.my_health < 10:
@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+
+'''
+------------------------------------------------------------------------------------------------
+Short Description:
+Renders replays to videos, gifs or strips of thumbnails without opening a window, many at once.
+Made for looking through a batch of games, like the losses of an arena run.
+------------------------------------------------------------------------------------------------
+
+README:
+
+This program assumes this file is in the scripts/contributions directory, next to watch_replay.py
+
+Frames are drawn the same way watch_replay.py draws them, but on matplotlib's Agg backend, so no
+window is needed and it runs fine on a server. Each replay (or each turn range of a replay) is one job,
+and jobs are spread across a pool of processes.
+
+Rendering is the slow part, so it is kept to what changes between frames:
+	- units are only created, moved or removed when the frame's changes (worked out once per replay) say so
+	- the board, reference dots, names and labels are drawn once and kept as a background image
+	- each frame copies the background and draws only the units, count labels, stats and the health plot on it
+
+Which replays:
+>py scripts/contributions/export_replays.py -f game1.replay game2.replay
+
+>py scripts/contributions/export_replays.py -n 5
+
+exports the 5 newest replays in the replays directory, and -a exports all of them.
+
+>py scripts/contributions/export_replays.py --losses my-algo -n 10 -l 5
+
+exports the last 5 turns of my-algo's 10 worst losses in the results file of run_arena.py
+(arena_results.jsonl by default, --results picks another). The worst losses are those where the
+opponent scored the most points more than my-algo.
+
+----------------------------------------------------------------------------------------
+-t: Only export these turns, as FIRST-LAST, FIRST- (to the end) or a single turn. Every range is
+    exported separately, for example -t 0-10 40-50 makes two files per replay
+
+-l: Only export the last this many turns
+
+-o: What to make, one or more of:
+	mp4    a video, needs ffmpeg in your PATH
+	gif    an animated gif, needs the python module Pillow
+	strip  a png with one thumbnail per turn, showing the board at the end of the turn
+    gif by default
+
+-d: The directory to write to, replays/exports in the starter kit directory by default.
+    Files are named after the replay, with the turns they show if -t or -l was used
+
+-j: How many replays to render at once, one process each. The number of CPUs by default
+
+-e: Only draw every this many frames, which makes shorter videos and smaller gifs
+
+--fps: Frames per second of videos and gifs, 10 by default
+
+--dpi: The resolution, 40 by default (the full window is 16 by 8 inches, so 640x320 pixels)
+
+--columns: The number of thumbnails per row in a strip, 6 by default
+'''
+
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import argparse
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+matplotlib.use('Agg')			# must be picked before watch_replay imports pyplot
+
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.image as mpimg
+
+import watch_replay
+from watch_replay import Graph, Replay, Playback, PatchWrapper
+
+watch_replay.BLIT = True		# no slider, nothing here is interactive
+
+KIT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, os.pardir))
+REPLAY_DIR = os.path.join(KIT_DIR, 'replays')
+FORMATS = ('mp4', 'gif', 'strip')
+EXTENSIONS = {'mp4': 'mp4', 'gif': 'gif', 'strip': 'png'}
+
+
+# A watch_replay Graph without the window: it draws whichever frames it is asked for into an image.
+# The figure, board and info panel are set up by Graph's own methods
+class Renderer(Graph):
+	def __init__(self, replay, dpi=40):
+		if len(replay.frames) < 1:
+			raise RuntimeError('no data')
+
+		self.replay = replay
+		self.real_time = False
+		self.playback = Playback(replay)
+		self.shown = None
+
+		plt.style.use('dark_background')
+		self.fig, ax = plt.subplots(nrows=1, ncols=2, figsize=(16,8), dpi=dpi)
+		self.board_ax, self.info_ax = ax
+		self.plot_ax = self.fig.add_subplot(324)
+
+		self.general_init()
+
+		self.head = (0,-1)
+		self.end_of_game = False
+		self.patches = PatchWrapper()
+		self.setup_board()
+
+		self.background = None
+		self.plot_artists = self.plot.lines + [self.plot_ax.xaxis]		# the frame numbers under the plot move with the lines
+		for artist in self.plot_artists:
+			artist.set_animated(True)
+
+	# brings the figure to a (turn, frame) and returns it as an RGB array
+	def render(self, key):
+		if self.info.winner_shown:
+			self.info.stats = None				# so going back from the last frame takes the winner's name away again
+		self.head = key
+		self.show_frame()
+		self.plot.update(self.frame_turn_to_val(key[0], key[1]))
+		self.check_end_of_game()
+
+		# animated artists are left out of canvas.draw(), so the background is everything that never changes
+		artists = self.patches.values() + self.patches.lbls + self.info.lbls
+		for artist in artists:
+			artist.set_animated(True)
+
+		canvas = self.fig.canvas
+		if self.background is None:
+			canvas.draw()
+			self.background = canvas.copy_from_bbox(self.fig.bbox)
+		else:
+			canvas.restore_region(self.background)
+
+		for artist in artists + self.plot_artists:
+			self.fig.draw_artist(artist)
+		return np.array(canvas.buffer_rgba())[:, :, :3]
+
+	def close(self):
+		plt.close(self.fig)
+
+
+# the (turn, frame) keys of the given turns, in order
+def keys_in_turns(reader, first, last):
+	return [key for key in reader.keys() if first <= key[0] <= last]
+
+# one key per turn, the last frame of the turn, which shows the board after the action phase
+def turn_end_keys(reader, first, last):
+	return [key for key in reader.last_frame_of_turns() if first <= key[0] <= last]
+
+
+def write_mp4(frames, path, fps):
+	process = None
+	for frame in frames:
+		if process is None:
+			height, width = frame.shape[:2]
+			command = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', '{}x{}'.format(width, height),
+				'-r', str(fps), '-i', '-', '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-vcodec', 'libx264', '-pix_fmt', 'yuv420p', path]
+			process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+		process.stdin.write(frame.tobytes())
+	if process is None:
+		return
+	_, err = process.communicate()
+	if process.returncode != 0:
+		raise RuntimeError('ffmpeg failed: {}'.format(err.decode(errors='replace').strip()))
+
+def write_gif(frames, path, fps):
+	from PIL import Image
+	images = (Image.fromarray(frame) for frame in frames)
+	first = next(images, None)
+	if first is not None:
+		first.save(path, save_all=True, append_images=images, duration=int(1000 / fps), loop=0)
+
+def write_strip(frames, path, columns):
+	frames = list(frames)
+	if len(frames) == 0:
+		return
+	columns = min(columns, len(frames))
+	blank = np.zeros_like(frames[0])
+	frames += [blank] * (-len(frames) % columns)
+	rows = [np.concatenate(frames[i:i+columns], axis=1) for i in range(0, len(frames), columns)]
+	mpimg.imsave(path, np.concatenate(rows, axis=0))
+
+
+# renders one replay (or turn range of one) to every asked for format, run in a worker process
+def export(job):
+	start = time.time()
+	try:
+		result = render_job(job)
+	except Exception as e:
+		result = {'replay': job['replay'], 'files': [], 'turns': (job['first'], job['last']), 'error': '{}: {}'.format(type(e).__name__, e)}
+	result['seconds'] = time.time() - start
+	return result
+
+def render_job(job):
+	replay = Replay(job['replay'])
+	turns = replay.reader.turns()
+	first = max(job['first'], turns[0]) if job['first'] is not None else turns[0]
+	last = min(job['last'], turns[-1]) if job['last'] is not None else turns[-1]
+	if job['tail'] is not None:
+		first = max(first, last - job['tail'] + 1)
+
+	written = []
+	renderer = Renderer(replay, job['dpi'])
+	try:
+		for output in job['formats']:
+			path = output_path(job, output, first, last)
+			if output == 'strip':
+				keys = turn_end_keys(replay.reader, first, last)
+				write_strip((renderer.render(key) for key in keys), path, job['columns'])
+			else:
+				keys = keys_in_turns(replay.reader, first, last)[::job['every']]
+				frames = (renderer.render(key) for key in keys)
+				if output == 'mp4':
+					write_mp4(frames, path, job['fps'])
+				else:
+					write_gif(frames, path, job['fps'])
+			written.append(path)
+	finally:
+		renderer.close()
+	return {'replay': job['replay'], 'files': written, 'turns': (first, last)}
+
+def output_path(job, output, first, last):
+	name = os.path.splitext(os.path.basename(job['replay']))[0]
+	if job['first'] is not None or job['last'] is not None or job['tail'] is not None:
+		name += '_turns-{}-{}'.format(first, last)
+	return os.path.join(job['dir'], '{}.{}'.format(name, EXTENSIONS[output]))
+
+
+# parses -t values: FIRST-LAST, FIRST- or TURN
+def parse_range(text):
+	first, dash, last = text.partition('-')
+	first = int(first) if first else None
+	if not dash:
+		return first, first
+	return first, int(last) if last else None
+
+def latest_replays(num=1, a=False):
+	files = sorted(glob.glob(os.path.join(REPLAY_DIR, '*.replay')), key=os.path.getctime, reverse=True)
+	return files if a else files[:num]
+
+# the replays of an algo's losses in a run_arena.py results file, the ones lost by the most points first
+def worst_losses(results, algo, num=None):
+	losses = []
+	with open(results) as f:
+		for line in f:
+			try:
+				record = json.loads(line)
+			except ValueError:
+				continue
+			if record.get('status') != 'ok' or algo not in (record['algo1'], record['algo2']) or record.get('winner') in (algo, None):
+				continue
+			if not record.get('replay') or not os.path.exists(record['replay']):
+				continue
+			points = [p or 0 for p in record.get('points') or [0, 0]]
+			own = 0 if record['algo1'] == algo else 1
+			losses.append((points[1 - own] - points[own], record['replay']))
+	losses.sort(key=lambda loss: -loss[0])
+	return [replay for _, replay in losses][:num]
+
+def find_replays(args):
+	if args['losses']:
+		return worst_losses(args['results'], args['losses'], args['num'])
+	if len(args['file']) > 0:
+		return [f if os.path.exists(f) else os.path.join(REPLAY_DIR, f) for f in args['file']]
+	return latest_replays(args['num'] or 1, args['all'])
+
+
+def schedule(args, replays):
+	ranges = [parse_range(text) for text in args['turns']] or [(None, None)]
+	jobs = []
+	for replay in replays:
+		for first, last in ranges:
+			jobs.append({'replay': replay, 'first': first, 'last': last, 'tail': args['last'], 'formats': args['output'],
+				'dir': args['dir'], 'dpi': args['dpi'], 'fps': args['fps'], 'every': max(args['every'], 1), 'columns': args['columns']})
+	return jobs
+
+def check_formats(formats):
+	usable = []
+	for output in formats:
+		if output == 'mp4' and shutil.which('ffmpeg') is None:
+			print ('ffmpeg not installed or in PATH, skipping mp4')
+			continue
+		if output == 'gif':
+			try:
+				import PIL
+			except ImportError:
+				print ('Pillow not installed, skipping gif (pip install Pillow)')
+				continue
+		usable.append(output)
+	return usable
+
+
+# handles all the arguments
+def parse_args():
+	ap = argparse.ArgumentParser(add_help=False, formatter_class=argparse.RawTextHelpFormatter)
+	ap.add_argument('-h', '--help', action='help', help='show this help message and exit\n\n')
+	ap.add_argument(
+		'-f', '--file',
+		nargs='*',
+		default=[],
+		help='the replay files to export\n\n')
+	ap.add_argument(
+		'-n', '--num',
+		type=int,
+		default=None,
+		help='export the newest this many replays, or this many losses with --losses\n\n')
+	ap.add_argument(
+		'-a', '--all',
+		action='store_true',
+		help='export every replay in the replays directory\n\n')
+	ap.add_argument(
+		'--losses',
+		default=None,
+		help="export the worst losses of this algo in a run_arena.py results file\n\n")
+	ap.add_argument(
+		'--results',
+		default=os.path.join(KIT_DIR, 'arena_results.jsonl'),
+		help='the run_arena.py results file used by --losses\n\n')
+	ap.add_argument(
+		'-t', '--turns',
+		nargs='*',
+		default=[],
+		help='only export these turns: FIRST-LAST, FIRST- or TURN, each range separately\n\n')
+	ap.add_argument(
+		'-l', '--last',
+		type=int,
+		default=None,
+		help='only export the last this many turns\n\n')
+	ap.add_argument(
+		'-o', '--output',
+		nargs='+',
+		default=['gif'],
+		choices=FORMATS,
+		help='what to make: mp4, gif and/or strip\n\n')
+	ap.add_argument(
+		'-d', '--dir',
+		default=os.path.join(REPLAY_DIR, 'exports'),
+		help='the directory to write to\n\n')
+	ap.add_argument(
+		'-j', '--jobs',
+		type=int,
+		default=None,
+		help='how many replays to render at once, the number of CPUs by default\n\n')
+	ap.add_argument(
+		'-e', '--every',
+		type=int,
+		default=1,
+		help='only draw every this many frames\n\n')
+	ap.add_argument(
+		'--fps',
+		type=int,
+		default=10,
+		help='frames per second of videos and gifs\n\n')
+	ap.add_argument(
+		'--dpi',
+		type=int,
+		default=40,
+		help='the resolution, the window is 16x8 inches\n\n')
+	ap.add_argument(
+		'--columns',
+		type=int,
+		default=6,
+		help='thumbnails per row in a strip\n\n')
+	return vars(ap.parse_args())
+
+
+if __name__ == '__main__':
+	args = parse_args()
+	args['output'] = check_formats(args['output'])
+	replays = find_replays(args)
+	if len(replays) == 0 or len(args['output']) == 0:
+		print ('Nothing to export')
+		sys.exit()
+
+	os.makedirs(args['dir'], exist_ok=True)
+	jobs = schedule(args, replays)
+	workers = min(args['jobs'] or os.cpu_count() or 1, len(jobs))
+	print ('Exporting {} replays on {} processes'.format(len(replays), workers))
+
+	start = time.time()
+	pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+	futures = [pool.submit(export, job) for job in jobs] if pool else None
+	for result in (future.result() for future in as_completed(futures)) if pool else map(export, jobs):
+		if 'error' in result:
+			print ('Error exporting {}: {}'.format(result['replay'], result['error']))
+			continue
+		print ('{} (turns {}-{}) in {:.1f}s:'.format(result['replay'], result['turns'][0], result['turns'][1], result['seconds']))
+		for path in result['files']:
+			print ('\t{}'.format(path))
+	if pool:
+		pool.shutdown()
+	print ('Done in {:.1f}s'.format(time.time() - start))
@@ -53,6 +53,10 @@ starter-algo-ZIPME:
 
 By default, this will run the replay file that was created the most recently.
 
+The first time a replay is looked at, its per turn numbers are saved next to it in [REPLAY_FILE].replay.npz
+(see replay_cache.py, this needs numpy), and later runs read that instead of the replay. A cache file is
+rebuilt whenever its replay changes.
+
 ----------------------------------------------------------------------------------------
 -f: Run specific replay files
 
@@ -70,6 +74,12 @@ You can specify how many replays back you would like to run (by date) using the
 
 would run the last 3 games you ran
 
+----------------------------------------------------------------------------------------
+-j: The number of processes to read replays with
+
+Replays are read in parallel, one process per CPU by default. To use 4 processes:
+>py scripts/contributions/get_results.py -a -j 4
+
 ----------------------------------------------------------------------------------------
 -avg: Print average data fro a single replay (not very useful right now)
 
@@ -171,14 +181,19 @@ plt_installed = False
 try:
 	import os
 	import sys
-	import json
 	import glob
 	import math
 	import argparse
+	from concurrent.futures import ProcessPoolExecutor
 except ImportError as e:
 	sys.stderr.write("WARNING: Module not found, full error:\n\n")
 	sys.stderr.write(e)
 
+from replay_reader import ReplayReader
+import replay_cache
+
+FILTER, ENCRYPTOR, DESTRUCTOR, PING, EMP, SCRAMBLER = range(6)
+
 try:
 	import matplotlib.pyplot as plt
 	plt_installed = True
@@ -226,6 +241,11 @@ def parse_args():
 		nargs="*",
 		default=[],
 		help="specify a replay file (or multiple) you'd like to analyze\n\n")
+	ap.add_argument(
+		"-j", "--jobs",
+		type=int,
+		default=None,
+		help="how many processes to read replays with, one per CPU by default\n\n")
 	ap.add_argument(
 		"-g", "--graph",
 		nargs="*",
@@ -332,7 +352,8 @@ class Algo:
 		self.name = name
 		self.wins = 0
 		self.cores_on_board = {}
-		self.replays = {} 	# this effectively holds all raw json information
+		self.replays = {} 	# per replay, the endStats and, if they are kept, every stat's value at the end of each turn
+		self.totals = {}	# per stat, its sum and number of turns over every replay, for the averages
 
 	# NOTE: eq will return true when comparing to strings of the same name - this is intentional to be able to use: str in listOfAlgos syntax.
 	def __eq__(self, other):
@@ -347,44 +368,23 @@ class Algo:
 		return self.__string()
 
 	def get_average(self, arg, replay):
-		avg = 0.0
-		div = 0.0
-
-		for replay in self.replays:
-			div += len(self.replays[replay])
-			for turn in self.replays[replay]:
-				if turn == 'endStats': continue
-				avg += float(self.replays[replay][turn][arg])
+		total, count = self.totals[arg]
 
 		try:
-			return avg / div
+			return total / count
 		except ZeroDivisionError:
 			sys.stderr.write("Error: Dividing by zero")
 			return -1
 
-	def add_data(self, replay, turn, arg, data, cumulative=False):
-		if replay in self.replays:
-			if turn in self.replays[replay]:
-				pass
-			else:
-				self.replays[replay][turn] = {}
-		else:
-			self.replays[replay] = {}
-			self.replays[replay][turn] = {}
-
-		if cumulative:
-			try:
-				self.replays[replay][turn][arg] = self.replays[replay][turn-1][arg] + data
-			except KeyError:
-				self.replays[replay][turn][arg] = data
-		else:
-			self.replays[replay][turn][arg] = data
-
-
-	def recored_final_data(self, replay, other):
-		self_hp = list(self.replays[replay].items())[-1][1]['health']
-		other_hp = list(other.replays[replay].items())[-1][1]['health']
+	# data holds a list for each stat, with its value at the end of every turn of the replay
+	# the lists are only needed for plotting single replays, so they can be left out to save memory
+	def add_turns(self, replay, data, keep_turns=True):
+		for arg in data:
+			total, count = self.totals.get(arg, (0.0, 0))
+			self.totals[arg] = (total + sum(data[arg]), count + len(data[arg]))
+		self.replays[replay] = dict(data) if keep_turns else {}
 
+	def recored_final_data(self, self_hp, other_hp):
 		if self_hp > other_hp:
 			self.wins += 1
 
@@ -433,23 +433,71 @@ class Algo:
 				Graph.advance()
 			else:
 				disp = True
-				data = [self.replays[replay][turn][lbl] for turn in self.replays[replay] if turn != 'endStats']
+				data = self.replays[replay][lbl]
 				Graph.add_to_plot(data, '{}\'s {}'.format(self, lbl), xlabel, y_label)
 		Graph.reset_pos()
 
 		return disp
 
 
+# the unit counts are per unit type, in the order of the units lists
+def get_cores_on_board(counts):
+	return counts[FILTER] + counts[ENCRYPTOR] * 4 + counts[DESTRUCTOR] * 3
+
+def get_bits_spent(counts):
+	return counts[PING] + counts[EMP] * 3 + counts[SCRAMBLER]
+
+def get_cores_spent(counts):
+	return get_cores_on_board(counts)
+
+# the value of every stat at the end of each turn, for one player
+def get_turn_data(columns, p_index):
+	stats = columns.list('turn_stats')
+	on_board = columns.list('on_board')
+	spawned = columns.list('spawned')
+
+	data = {
+		'health':			[turn[p_index][replay_cache.HEALTH] for turn in stats],
+		'cores':			[turn[p_index][replay_cache.SP] for turn in stats],
+		'bits':				[turn[p_index][replay_cache.MP] for turn in stats],
+		'cores_on_board':	[get_cores_on_board(turn[p_index]) for turn in on_board],
+		'cores_spent':		[],
+		'bits_spent':		[]
+	}
+
+	cores_spent = 0
+	bits_spent = 0
+	for turn in spawned:
+		cores_spent += get_cores_spent(turn[p_index])
+		bits_spent += get_bits_spent(turn[p_index])
+		data['cores_spent'].append(cores_spent)
+		data['bits_spent'].append(bits_spent)
+
+	return data
+
+# everything get_results keeps from a replay. This runs in the worker processes, so only these
+# few lists are sent back and the replay's frames never leave the worker
+def summarize_replay(f_name):
+	try:
+		columns = replay_cache.load(f_name)
+		return {
+			'end_stats':	columns.end_stats,
+			'turns':		[get_turn_data(columns, 0), get_turn_data(columns, 1)]
+		}
+	except Exception as e:
+		return {'error': '{}: {}'.format(type(e).__name__, e)}
+
+
 # Stores data from a single replay and creates the Algo classes
 class Replay:
-	def __init__(self, f_name, algos):
+	def __init__(self, f_name, algos, summary=None, keep_turns=True):
 		self.fname = f_name;
-		self.ref = None
-		self.turns = {}
-		self.valid_turns = []
+		self.end_stats = None
+		self.reader = None
 
-		self.load_data()				# handles loading all the data from file into python variables
-		self.unpack_data(algos)		# stores relevant data after it has been loaded
+		if summary is None:
+			summary = summarize_replay(f_name)		# loads the replay's columns, from its cache file when it is up to date
+		self.unpack_data(algos, summary, keep_turns)		# adds the replay's numbers to its algos
 
 	def __eq__(self, other):
 		return self.fname == other.fname
@@ -460,85 +508,27 @@ class Replay:
 	def __repr__(self):
 		return self.__string()
 
-	def load_data(self):
-		with open(self.fname) as f:
-			for line in f:
-				line = line.replace("\n", "")
-				line = line.replace("\t", "")
-
-				if (line != ''):
-					data = json.loads(line)
-
-					try:
-						data['debug']
-						self.ref = data
-					except:
-						turn_num = data['turnInfo'][1]
-						frame_num = data['turnInfo'][2]
-						self.turns[(turn_num, frame_num)] = data
-						if (turn_num, frame_num) not in self.valid_turns:
-							self.valid_turns.append((turn_num, frame_num))
-
-	def get_cores_on_board(self, filters, encryptors, destructors):
-		return len(filters) + len(encryptors) * 4 + len(destructors) * 3
-
-	def get_bits_spent(self, algo, spawn):
-		p_index = 1 if algo == self.algo1 else 2
-		pings = [x for x in spawn if x[3] == p_index and x[1] == 3]
-		emps = [x for x in spawn if x[3] == p_index and x[1] == 4]
-		scramblers = [x for x in spawn if x[3] == p_index and x[1] == 5]
-		return len(pings) + len(emps) * 3 + len(scramblers)
-
-	def get_cores_spent(self, algo, spawn):
-		p_index = 1 if algo == self.algo1 else 2
-		filters = [x for x in spawn if x[3] == p_index and x[1] == 0]
-		encryptors = [x for x in spawn if x[3] == p_index and x[1] == 1]
-		destructors = [x for x in spawn if x[3] == p_index and x[1] == 2]
-		return len(filters) + len(encryptors) * 4 + len(destructors) * 3
-
-	def add_data_to_algo(self, algo, t, f, stats, units, spawn):
-		algo.add_data(self.fname, t, 'health', stats[0])
-		algo.add_data(self.fname, t, 'cores', stats[1])
-		algo.add_data(self.fname, t, 'bits', stats[2])
-
-		filters, encryptors, destructors, pings, emps, scramblers, removes = units
-
-		algo.add_data(self.fname, t, 'cores_on_board', self.get_cores_on_board(filters, encryptors, destructors))
-
-		if f == 0:
-			algo.add_data(self.fname, t, 'cores_spent', self.get_cores_spent(algo, spawn), True)
-			algo.add_data(self.fname, t, 'bits_spent', self.get_bits_spent(algo, spawn), True)
-
-	def unpack_data(self, algos):
+	def unpack_data(self, algos, summary, keep_turns=True):
 		try:
+			if 'error' in summary:
+				raise RuntimeError(summary['error'])
+			self.end_stats = summary['end_stats']
 			self.algo1, self.algo2 = self.create_algos(algos)
+			p1_data, p2_data = summary['turns']
 
-			for t, f in self.get_valid_turns():
-				turn = self.get_turn(t, f)
-
-				turn_info = turn['turnInfo']
-				events = turn['events']
-				spawn = events['spawn']
-
-				p1_stats = turn['p1Stats']
-				p1_units = turn['p1Units']
-
-				p2_stats = turn['p2Stats']
-				p2_units = turn['p2Units']
+			self.algo1.add_turns(self.fname, p1_data, keep_turns)
+			self.algo2.add_turns(self.fname, p2_data, keep_turns)
 
-				self.add_data_to_algo(self.algo1, t, f, p1_stats, p1_units, spawn)
-				self.add_data_to_algo(self.algo2, t, f, p2_stats, p2_units, spawn)
-
-			self.algo1.recored_final_data(self.fname, self.algo2)
-			self.algo2.recored_final_data(self.fname, self.algo1)
-			self.algo1.add_end_stats(self.fname, self.turns[self.valid_turns[-1]]['endStats']['player1'])
-			self.algo2.add_end_stats(self.fname, self.turns[self.valid_turns[-1]]['endStats']['player2'])
+			self.algo1.recored_final_data(p1_data['health'][-1], p2_data['health'][-1])
+			self.algo2.recored_final_data(p2_data['health'][-1], p1_data['health'][-1])
+			self.algo1.add_end_stats(self.fname, self.end_stats['player1'])
+			self.algo2.add_end_stats(self.fname, self.end_stats['player2'])
 		except Exception as e:
 			sys.stderr.write(str(e))
 
 	# only creates a new algo class if that algo does not already exist. Otherwise data is added to the existing one
 	def create_algos(self, algos):
-		end_stats = self.turns[self.valid_turns[-1]]['endStats']
+		end_stats = self.end_stats
 		p1_algo = end_stats['player1']['name']
 		p2_algo = end_stats['player2']['name']
 
@@ -559,18 +549,26 @@ class Replay:
 	def get_algos(self):
 		return [self.algo1, self.algo2]
 
+	# the raw frames are only read if they are asked for
+	def get_reader(self):
+		if self.reader is None:
+			self.reader = ReplayReader(self.fname)
+		return self.reader
+
 	def get_valid_turns(self):
-		return self.valid_turns
+		return self.get_reader().keys()
 	def get_turns(self):
-		return self.turns
+		return self.get_reader()
 	def get_turn(self, turn, frame=-1):
-		return self.turns[(turn, frame)]
+		return self.get_reader().frame(turn, frame)
 
 # handles opening multiple games (replays)
 class FileHandler:
-	def __init__(self):
+	def __init__(self, jobs=1, keep_turns=True):
 		self.replays = []
 		self.algos = []
+		self.jobs = jobs				# how many processes read replays at once
+		self.keep_turns = keep_turns	# whether algos keep every turn's stats, which is only needed for plots of single replays
 
 	def get_algo_win_summary(self):
 		fill_len = len(max(self.algos, key=lambda e:len(e.name)).name) + 9
@@ -593,8 +591,8 @@ class FileHandler:
 		return self.replays[i]
 
 	def __latest_replays(self, num=1, a=False):
-		replay_dir = os.path.dirname(os.path.realpath(__file__)).replace('scripts\\contributions', '')+'replays\\'
-		files = glob.glob('{}*.replay'.format(replay_dir))
+		replay_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, os.pardir, 'replays')
+		files = glob.glob(os.path.join(replay_dir, '*.replay'))
 		files = sorted(files, key=os.path.getctime, reverse=True)
 		if a:
 			return files
@@ -602,14 +600,25 @@ class FileHandler:
 
 	def load_files(self, num=1, a=False, f_names=[]):
 		if len(f_names) > 0:
-			for f_name in f_names:
-				if f_name.find('replays') == -1:
-					self.replays.append(Replay('replays/'+f_name, self.algos))
-				else:
-					self.replays.append(Replay(f_name, self.algos))
+			f_names = [f_name if f_name.find('replays') != -1 else 'replays/'+f_name for f_name in f_names]
 		else:
-			for f_name in self.__latest_replays(num, a):
-				self.replays.append(Replay(f_name, self.algos))
+			f_names = self.__latest_replays(num, a)
+
+		# summaries are merged into the algos as they arrive, in the order of f_names
+		for f_name, summary in zip(f_names, self.__summaries(f_names)):
+			self.replays.append(Replay(f_name, self.algos, summary, self.keep_turns))
+
+	# reads the replays in a pool of processes, unless there is only one of either
+	def __summaries(self, f_names):
+		if self.jobs <= 1 or len(f_names) <= 1:
+			for f_name in f_names:
+				yield summarize_replay(f_name)
+			return
+
+		workers = min(self.jobs, len(f_names))
+		with ProcessPoolExecutor(max_workers=workers) as pool:
+			for summary in pool.map(summarize_replay, f_names, chunksize=max(1, len(f_names) // (workers * 4))):
+				yield summary
 
 	def add_plot(self, lbl):
 		if lbl == 'wins':
@@ -710,7 +719,7 @@ def get_graph_options(options):
 def main(args):
 	verbose_options, summary_options = get_graph_options(args['graph'])
 
-	fh = FileHandler()
+	fh = FileHandler(int(args.get('jobs') or os.cpu_count() or 1), len(verbose_options) > 0)
 	fh.load_files(int(args['num']), args['all'], args['file']) #loads the files - all JSON reading is here
 
 	# check to see if matplotlib is installed
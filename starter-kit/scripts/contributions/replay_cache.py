@@ -0,0 +1,237 @@
+'''
+------------------------------------------------------------------------------------------------
+Short Description:
+Turns replay files into columns of numbers that are quick to load and aggregate. Used by get_results.py.
+------------------------------------------------------------------------------------------------
+
+README:
+
+Summaries over many replays mostly need a few numbers per turn, but getting them out of a replay means
+decoding every frame's JSON. This module does that once per replay and saves the result next to it as
+[REPLAY_FILE].replay.npz, a compressed NumPy archive of typed arrays:
+
+Per turn, one row for every turn in the replay, in order:
+	- turn: the turn number
+	- turn_stats: [player][health, SP, MP] at the end of the turn
+	- spawned: [player][unit type] how many units of each type the player spawned that turn,
+	  removals (6) and upgrades (7) included
+	- on_board: [player][unit type] how many units of each type the player had at the end of the turn
+
+Per frame, one row for every frame, in the order of ReplayReader:
+	- frame_turn, frame_index: the frame's turn and frame numbers
+	- frame_stats: [player][health, SP, MP]
+	- unit_start: where the frame's units start in the unit table, with one extra entry for the end
+
+The unit table, one row per unit in every frame:
+	- unit_player (0 or 1), unit_type, unit_x, unit_y, unit_hp, unit_id
+
+The event table, one row per event in every frame, with event_start pointing into it like unit_start:
+	- event_kind: the position of the event's name in EVENT_KINDS (breach, damage, death, ...)
+	- event_player: 0 or 1, the owner of the unit the event is about (the attacker, shielder or mover)
+	- event_x, event_y: the event's first location, where the unit is or, for moves, attacks and shields, where it acts from
+	- event_type: the unit type, event_id: the unit's id
+	- event_amount: the damage of breaches, damage, attacks and self destructs, the amount of shields, 0 otherwise
+
+And end_stats, the endStats JSON as a string. Only finished games are saved.
+
+A cache file is used as long as the replay's size and modification time are those it was built from,
+and rebuilt otherwise. Without numpy nothing is saved, and the columns are plain lists built from
+the replay every time.
+'''
+
+import os
+import json
+
+from replay_reader import ReplayReader
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+CACHE_SUFFIX = '.npz'
+CACHE_VERSION = 2
+
+# positions in turn_stats and frame_stats
+HEALTH, SP, MP = range(3)
+
+# the events of a frame, in the order of event_kind, and where each keeps its (amount, unit type, id, player)
+EVENT_KINDS = ('breach', 'damage', 'death', 'spawn', 'move', 'attack', 'shield', 'selfDestruct', 'melee')
+EVENT_FIELDS = {'breach': (1, 2, 3, 4), 'damage': (1, 2, 3, 4), 'death': (None, 1, 2, 3), 'spawn': (None, 1, 2, 3),
+	'move': (None, 3, 4, 5), 'attack': (2, 3, 4, 6), 'shield': (2, 3, 4, 6), 'selfDestruct': (2, 3, 4, 5), 'melee': (2, 3, 4, 6)}
+
+TURN_COLUMNS = {'turn': 'int32', 'turn_stats': 'float32', 'spawned': 'int16', 'on_board': 'int16'}
+FRAME_COLUMNS = {'frame_turn': 'int32', 'frame_index': 'int32', 'frame_stats': 'float32', 'unit_start': 'int32',
+	'unit_player': 'int8', 'unit_type': 'int8', 'unit_x': 'int8', 'unit_y': 'int8', 'unit_hp': 'float32', 'unit_id': 'int32',
+	'event_start': 'int32', 'event_kind': 'int8', 'event_player': 'int8', 'event_x': 'int8', 'event_y': 'int8', 'event_type': 'int8',
+	'event_amount': 'float32', 'event_id': 'int32'}
+
+
+class ReplayColumns:
+	'''The columns of one replay, see the README above for what they hold
+
+	Columns are NumPy arrays, or nested lists when numpy is not installed. Loaded from a cache file,
+	the per turn columns are read straight away and the per frame ones the first time they are used.
+
+	Attributes :
+		* path (str): The replay file the columns were built from
+		* end_stats (dict): The replay's endStats, None if the game has not finished
+	'''
+	def __init__(self, path, columns, end_stats, cache_path=None):
+		self.path = path
+		self.end_stats = end_stats
+		self.__columns = columns
+		self.__cache_path = cache_path
+
+	def __repr__(self):
+		return 'ReplayColumns({!r}, {} turns)'.format(self.path, len(self['turn']))
+
+	def __getitem__(self, name):
+		if name not in self.__columns:
+			if self.__cache_path is None or name not in FRAME_COLUMNS:
+				raise KeyError(name)
+			with np.load(self.__cache_path) as archive:
+				self.__columns[name] = archive[name]
+		return self.__columns[name]
+
+	def list(self, name):
+		'''A column as nested python lists, which is faster to loop over than an array'''
+		column = self[name]
+		return column.tolist() if hasattr(column, 'tolist') else column
+
+	def units(self, position):
+		'''The unit table rows of the frame at a position in the per frame columns, as a slice'''
+		start = self['unit_start']
+		return slice(int(start[position]), int(start[position + 1]))
+
+	def events(self, position):
+		'''The event table rows of the frame at a position in the per frame columns, as a slice'''
+		start = self['event_start']
+		return slice(int(start[position]), int(start[position + 1]))
+
+
+def cache_path(path):
+	'''Where the cache file of a replay goes'''
+	return path + CACHE_SUFFIX
+
+
+def load(path, use_cache_file=True):
+	'''Gets the columns of a replay, from its cache file if it is up to date and otherwise by building them
+
+	Args:
+		path: The replay file
+		use_cache_file: Whether to read and write the cache file
+
+	Returns:
+		A ReplayColumns
+	'''
+	stat = os.stat(path)
+	use_cache_file = use_cache_file and np is not None
+	if use_cache_file:
+		columns = _load_cache(path, stat)
+		if columns is not None:
+			return columns
+
+	columns, end_stats = build_columns(ReplayReader(path, use_index_file=use_cache_file))
+	if np is not None:
+		columns = dict((name, np.asarray(columns[name], dtype=dtype)) for name, dtype in list(TURN_COLUMNS.items()) + list(FRAME_COLUMNS.items()))
+		if use_cache_file and end_stats is not None:
+			_save_cache(path, stat, columns, end_stats)
+	return ReplayColumns(path, columns, end_stats)
+
+
+def build_columns(reader):
+	'''Decodes every frame of a replay once, in order, into columns of python lists
+
+	Args:
+		reader: A ReplayReader of the replay
+
+	Returns:
+		A dict of column name to list, and the replay's endStats or None
+	'''
+	columns = dict((name, []) for name in list(TURN_COLUMNS) + list(FRAME_COLUMNS))
+	columns['unit_start'].append(0)
+	columns['event_start'].append(0)
+	rows = {}
+	type_count = None
+
+	for (turn, frame), data in reader.iter_frames():
+		stats = [data['p1Stats'][:3], data['p2Stats'][:3]]
+		units = (data['p1Units'], data['p2Units'])
+		if type_count is None:
+			type_count = max(len(units[0]), 8)
+
+		columns['frame_turn'].append(turn)
+		columns['frame_index'].append(frame)
+		columns['frame_stats'].append(stats)
+		for player_index in (0, 1):
+			for type_index, typed_units in enumerate(units[player_index]):
+				for x, y, hp, unit_id in typed_units:
+					columns['unit_player'].append(player_index)
+					columns['unit_type'].append(type_index)
+					columns['unit_x'].append(x)
+					columns['unit_y'].append(y)
+					columns['unit_hp'].append(hp)
+					columns['unit_id'].append(int(unit_id))
+		columns['unit_start'].append(len(columns['unit_player']))
+		add_events(columns, data['events'])
+		columns['event_start'].append(len(columns['event_kind']))
+
+		# the last frame of a turn decides its stats, so each frame overwrites the turn's row
+		row = rows.get(turn)
+		if row is None:
+			row = rows[turn] = len(columns['turn'])
+			columns['turn'].append(turn)
+			columns['spawned'].append([[0] * type_count, [0] * type_count])
+			columns['turn_stats'].append(None)
+			columns['on_board'].append(None)
+		columns['turn_stats'][row] = stats
+		on_board = [[len(typed_units) for typed_units in units[player_index]][:type_count] for player_index in (0, 1)]
+		columns['on_board'][row] = [counts + [0] * (type_count - len(counts)) for counts in on_board]
+		if frame == 0:
+			for event in data['events']['spawn']:
+				columns['spawned'][row][event[3] - 1][event[1]] += 1
+
+	end_stats = reader.end_stats
+	return columns, end_stats
+
+
+def add_events(columns, events):
+	'''Appends a frame's events to the event table in columns'''
+	for kind_index, kind in enumerate(EVENT_KINDS):
+		amount_index, type_index, id_index, player_index = EVENT_FIELDS[kind]
+		for event in events.get(kind, ()):
+			if len(event) <= player_index:
+				continue				# not a layout this reader knows
+			x, y = event[0]
+			columns['event_kind'].append(kind_index)
+			columns['event_player'].append(event[player_index] - 1)
+			columns['event_x'].append(x)
+			columns['event_y'].append(y)
+			columns['event_type'].append(event[type_index])
+			columns['event_amount'].append(event[amount_index] if amount_index is not None else 0)
+			columns['event_id'].append(int(event[id_index]))
+
+
+def _load_cache(path, stat):
+	try:
+		with np.load(cache_path(path)) as archive:
+			version, size, mtime = archive['meta'].tolist()
+			if version != CACHE_VERSION or size != stat.st_size or mtime != stat.st_mtime_ns:
+				return None
+			columns = dict((name, archive[name]) for name in TURN_COLUMNS)
+			end_stats = json.loads(str(archive['end_stats']))
+	except (OSError, ValueError, KeyError):
+		return None
+	return ReplayColumns(path, columns, end_stats, cache_path(path))
+
+
+def _save_cache(path, stat, columns, end_stats):
+	partial = '{}.{}{}'.format(path, os.getpid(), CACHE_SUFFIX)
+	try:
+		with open(partial, 'wb') as f:
+			np.savez_compressed(f, meta=np.array([CACHE_VERSION, stat.st_size, stat.st_mtime_ns], dtype='int64'),
+				end_stats=np.array(json.dumps(end_stats)), **columns)
+		os.replace(partial, cache_path(path))		# so nobody reads a half written cache
+	except OSError:
+		pass				# a read-only replays directory just means building the columns again next time
@@ -0,0 +1,483 @@
+#!/usr/bin/env python
+
+'''
+------------------------------------------------------------------------------------------------
+Short Description:
+Finds the frames or turns of many replays that match a set of conditions, without decoding
+the frames that cannot match.
+------------------------------------------------------------------------------------------------
+
+README:
+
+This program assumes this file is in the scripts/contributions directory, next to replay_cache.py
+
+Conditions are written with a few building blocks and compared like numbers:
+	turn, frame							the frame's turnInfo
+	health(p), sp(p), mp(p)				player p's (1 or 2) stats on the frame
+	units(player, type, x, y, hp)		the units on the board that match, see below
+	events(kind, player, type, x, y, amount)	the frame's events of a kind (breach, damage, death, spawn,
+										move, attack, shield, selfDestruct, melee) that match
+
+units(...) and events(...) are turned into numbers with .count() or .total(), the sum of their hp or amount.
+Their arguments can be a value, a (low, high) range with both ends included (None for no end), or a
+list of values. Conditions are combined with & (and), | (or) and ~ (not), each in brackets.
+
+For example, the turns in which player 2's units breached more than 5 times at x < 5:
+>py scripts/contributions/replay_query.py -a -t -w "events('breach', player=2, x=(None, 4)).count() > 5"
+
+The frames where player 1 had 3 or more destructors on its left side and less than 10 health:
+>py scripts/contributions/replay_query.py -n 10 -w "(units(1, DESTRUCTOR, x=(0, 13)).count() >= 3) & (health(1) < 10)"
+
+These conditions are worked out from the columns of replay_cache.py (which are built and saved the first
+time a replay is queried), so a frame is never decoded just to be checked. Anything the columns cannot
+answer goes in -p, a python expression on the decoded frame (data), its turn and its frame. It is only
+evaluated on the frames that pass -w:
+>py scripts/contributions/replay_query.py -a -w "events('death').count() > 0" -p "any(e[4] for e in data['events']['death'])"
+
+Each match is printed as: replay turn frame. With -t, conditions are checked per turn: event numbers are
+added up over the turn's frames, everything else is taken from the turn's last frame, -p has to hold
+on any one frame of the turn, and matches are printed as: replay turn
+
+The same can be done from python, with matches streamed as they are found:
+	from replay_query import Query, events
+	for hit in Query(paths).where(events('breach', player=2).count() > 5):
+		print(hit.replay, hit.turn, hit.frame)
+
+----------------------------------------------------------------------------------------
+-f: The replay files to search, -n the newest this many replays, -a every replay
+
+-w: The condition on the columns, which is python using the building blocks above
+
+-p: A condition on the decoded frame
+
+-t: Match turns instead of frames
+
+-g: A condition on the game's endStats (stats), checked before anything else, for example
+    "stats['winner'] == 2"
+
+--limit: Stop after this many matches
+'''
+
+import os
+import sys
+import glob
+import time
+import argparse
+from collections import namedtuple
+
+try:
+	import numpy as np
+except ImportError:
+	sys.stderr.write('replay_query.py needs numpy (pip install numpy)\n')
+	sys.exit()
+
+import replay_cache
+from replay_cache import EVENT_KINDS, HEALTH, SP, MP
+from replay_reader import ReplayReader
+
+REPLAY_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, os.pardir, 'replays'))
+
+FILTER, ENCRYPTOR, DESTRUCTOR, PING, EMP, SCRAMBLER, REMOVE, UPGRADE = range(8)
+
+Hit = namedtuple('Hit', ['replay', 'turn', 'frame'])
+
+
+class Context:
+	'''What conditions are evaluated against: one replay's columns, per frame or per turn
+
+	Attributes :
+		* columns (ReplayColumns): The replay's columns
+		* by_turn (bool): Whether values are per turn rather than per frame
+		* frames (int): The number of frames in the replay
+		* turn_starts (ndarray): Where each turn starts in the per frame columns
+		* turn_ends (ndarray): The position of each turn's last frame
+	'''
+	def __init__(self, columns, by_turn=False):
+		self.columns = columns
+		self.by_turn = by_turn
+		frame_turn = columns['frame_turn']
+		self.frames = len(frame_turn)
+		self.turn_starts = np.flatnonzero(np.r_[True, frame_turn[1:] != frame_turn[:-1]]) if self.frames else np.zeros(0, dtype=int)
+		self.turn_ends = np.r_[self.turn_starts[1:] - 1, self.frames - 1].astype(int) if self.frames else self.turn_starts
+		self.__row_frames = {}
+
+	def row_frames(self, table):
+		'''The frame position of every row of the unit or event table'''
+		if table not in self.__row_frames:
+			start = self.columns[table + '_start']
+			self.__row_frames[table] = np.repeat(np.arange(self.frames), np.diff(start))
+		return self.__row_frames[table]
+
+	def aggregate(self, values, how):
+		'''Turns per frame values into per turn ones if matching by turn, summing them or taking the last frame's'''
+		if not self.by_turn:
+			return values
+		if how == 'sum':
+			return np.add.reduceat(values, self.turn_starts) if self.frames else values
+		return values[self.turn_ends]
+
+
+# Conditions are true or false for every frame (or turn) of a replay
+
+class Condition:
+	def __and__(self, other):
+		return Combined(np.logical_and, self, other)
+
+	def __or__(self, other):
+		return Combined(np.logical_or, self, other)
+
+	def __invert__(self):
+		return Negated(self)
+
+	def mask(self, context):
+		'''A boolean array with one value per frame, or per turn'''
+		raise NotImplementedError
+
+
+class Combined(Condition):
+	def __init__(self, op, left, right):
+		self.op = op
+		self.left = left
+		self.right = right
+
+	def mask(self, context):
+		return self.op(self.left.mask(context), self.right.mask(context))
+
+
+class Negated(Condition):
+	def __init__(self, condition):
+		self.condition = condition
+
+	def mask(self, context):
+		return ~self.condition.mask(context)
+
+
+class Compared(Condition):
+	def __init__(self, op, field, other):
+		self.op = op
+		self.field = field
+		self.other = other
+
+	def mask(self, context):
+		other = self.other.values(context) if isinstance(self.other, Field) else self.other
+		return self.op(self.field.values(context), other)
+
+
+# Fields are a number for every frame (or turn), compared to make conditions
+
+class Field:
+	def __lt__(self, other):
+		return Compared(np.less, self, other)
+
+	def __le__(self, other):
+		return Compared(np.less_equal, self, other)
+
+	def __gt__(self, other):
+		return Compared(np.greater, self, other)
+
+	def __ge__(self, other):
+		return Compared(np.greater_equal, self, other)
+
+	def __eq__(self, other):
+		return Compared(np.equal, self, other)
+
+	def __ne__(self, other):
+		return Compared(np.not_equal, self, other)
+
+	def __add__(self, other):
+		return Derived(np.add, self, other)
+
+	def __sub__(self, other):
+		return Derived(np.subtract, self, other)
+
+	__hash__ = object.__hash__
+
+	def values(self, context):
+		'''An array with one value per frame, or per turn'''
+		raise NotImplementedError
+
+
+class Derived(Field):
+	def __init__(self, op, left, right):
+		self.op = op
+		self.left = left
+		self.right = right
+
+	def values(self, context):
+		right = self.right.values(context) if isinstance(self.right, Field) else self.right
+		return self.op(self.left.values(context), right)
+
+
+class Column(Field):
+	'''A per frame column, or one player's stat in frame_stats'''
+	def __init__(self, name, player=None, stat=None):
+		self.name = name
+		self.player = player
+		self.stat = stat
+
+	def values(self, context):
+		values = context.columns[self.name]
+		if self.player is not None:
+			values = values[:, self.player - 1, self.stat]
+		return context.aggregate(values, 'last')
+
+
+class Selection:
+	'''The rows of the unit or event table that match some columns, in every frame'''
+	def __init__(self, table, how, **specs):
+		self.table = table
+		self.how = how
+		self.specs = specs
+
+	def rows(self, context):
+		selected = None
+		for name, spec in self.specs.items():
+			if spec is None:
+				continue
+			matched = matches(context.columns['{}_{}'.format(self.table, name)], spec)
+			selected = matched if selected is None else selected & matched
+		return selected
+
+	def count(self):
+		'''How many rows match on each frame'''
+		return Counted(self, None)
+
+	def total(self):
+		'''The sum of the matching rows' hp (units) or amount (events) on each frame'''
+		return Counted(self, 'hp' if self.table == 'unit' else 'amount')
+
+
+class Counted(Field):
+	def __init__(self, selection, weight):
+		self.selection = selection
+		self.weight = weight
+
+	def values(self, context):
+		table = self.selection.table
+		frames = context.row_frames(table)
+		rows = self.selection.rows(context)
+		if rows is not None:
+			frames = frames[rows]
+		weights = None
+		if self.weight is not None:
+			weights = context.columns['{}_{}'.format(table, self.weight)]
+			weights = weights[rows] if rows is not None else weights
+		values = np.bincount(frames, weights=weights, minlength=context.frames)
+		return context.aggregate(values, self.selection.how)
+
+
+# whether each value of a column matches a value, a (low, high) range or a list of values
+def matches(column, spec):
+	if isinstance(spec, tuple):
+		low, high = spec
+		selected = np.ones(len(column), dtype=bool)
+		if low is not None:
+			selected &= column >= low
+		if high is not None:
+			selected &= column <= high
+		return selected
+	if isinstance(spec, (list, set, frozenset)):
+		return np.isin(column, list(spec))
+	return column == spec
+
+
+# the building blocks of conditions
+
+turn = Column('frame_turn')
+frame = Column('frame_index')
+
+def health(player):
+	return Column('frame_stats', player, HEALTH)
+
+def sp(player):
+	return Column('frame_stats', player, SP)
+
+def mp(player):
+	return Column('frame_stats', player, MP)
+
+def units(player=None, type=None, x=None, y=None, hp=None):
+	'''The units on the board, player is 1 or 2'''
+	return Selection('unit', 'last', player=players(player), type=type, x=x, y=y, hp=hp)
+
+def events(kind=None, player=None, type=None, x=None, y=None, amount=None):
+	'''A frame's events of one kind (or a list of kinds), player is 1 or 2'''
+	kinds = kind if isinstance(kind, (list, tuple, set)) else [kind] if kind is not None else None
+	kinds = [EVENT_KINDS.index(k) for k in kinds] if kinds is not None else None
+	return Selection('event', 'sum', kind=kinds, player=players(player), type=type, x=x, y=y, amount=amount)
+
+# players are 1 and 2 in queries, as in the replays, and 0 and 1 in the columns
+def players(player):
+	if player is None:
+		return None
+	if isinstance(player, (list, set)):
+		return [p - 1 for p in player]
+	return player - 1
+
+
+class Query:
+	'''Finds the frames (or turns) of replays that match every condition given
+
+	Conditions on the columns (see Condition) are checked for all frames of a replay at once. Python
+	conditions given to where_data are then called with ((turn, frame), data) for the frames that
+	are left, so only those are decoded, and conditions given to where_game are called with the endStats
+	before anything else is loaded.
+
+	Attributes :
+		* replays (list): The replay files to search
+		* by_turn (bool): Whether to match whole turns, see the README
+		* decoded (int): How many frames were decoded so far
+	'''
+	def __init__(self, replays, by_turn=False, use_cache_file=True):
+		self.replays = list(replays)
+		self.by_turn = by_turn
+		self.use_cache_file = use_cache_file
+		self.decoded = 0
+		self.__conditions = []
+		self.__data_predicates = []
+		self.__game_predicates = []
+
+	def where(self, condition):
+		'''Adds a Condition on the columns'''
+		self.__conditions.append(condition)
+		return self
+
+	def where_data(self, predicate):
+		'''Adds a python condition on ((turn, frame), data) of decoded frames'''
+		self.__data_predicates.append(predicate)
+		return self
+
+	def where_game(self, predicate):
+		'''Adds a python condition on a replay's endStats, which is None for unfinished games'''
+		self.__game_predicates.append(predicate)
+		return self
+
+	def __iter__(self):
+		for path in self.replays:
+			for hit in self.search(path):
+				yield hit
+
+	def search(self, path):
+		'''Yields the Hits of one replay'''
+		columns = replay_cache.load(path, self.use_cache_file)
+		if not all(predicate(columns.end_stats) for predicate in self.__game_predicates):
+			return
+		context = Context(columns, self.by_turn)
+		if context.frames == 0:
+			return
+
+		selected = np.ones(len(context.turn_starts) if self.by_turn else context.frames, dtype=bool)
+		for condition in self.__conditions:
+			selected &= condition.mask(context)
+			if not selected.any():
+				return
+
+		frame_turn, frame_index = columns['frame_turn'], columns['frame_index']
+		positions = np.flatnonzero(selected)
+		if len(self.__data_predicates) == 0:
+			for position in positions:
+				if self.by_turn:
+					yield Hit(path, int(frame_turn[context.turn_starts[position]]), None)
+				else:
+					yield Hit(path, int(frame_turn[position]), int(frame_index[position]))
+			return
+
+		if self.by_turn:
+			positions = np.concatenate([np.arange(context.turn_starts[position], context.turn_ends[position] + 1) for position in positions])
+		keys = [(int(frame_turn[position]), int(frame_index[position])) for position in positions]
+		reader = ReplayReader(path, use_index_file=self.use_cache_file, cache_size=0)
+		matched_turn = None
+		for key, data in reader.iter_frames(keys):
+			self.decoded += 1
+			if self.by_turn and key[0] == matched_turn:
+				continue
+			if all(predicate(key, data) for predicate in self.__data_predicates):
+				if self.by_turn:
+					matched_turn = key[0]
+					yield Hit(path, key[0], None)
+				else:
+					yield Hit(path, key[0], key[1])
+
+
+# the names -w, -p and -g can use
+def namespace():
+	names = dict((name, value) for name, value in globals().items() if name.isupper() and isinstance(value, int))
+	names.update({'turn': turn, 'frame': frame, 'health': health, 'sp': sp, 'mp': mp, 'units': units, 'events': events})
+	return names
+
+def latest_replays(num=1, a=False):
+	files = sorted(glob.glob(os.path.join(REPLAY_DIR, '*.replay')), key=os.path.getctime, reverse=True)
+	return files if a else files[:num]
+
+
+def parse_args():
+	ap = argparse.ArgumentParser(add_help=False, formatter_class=argparse.RawTextHelpFormatter)
+	ap.add_argument('-h', '--help', action='help', help='show this help message and exit\n\n')
+	ap.add_argument(
+		'-f', '--file',
+		nargs='*',
+		default=[],
+		help='the replay files to search\n\n')
+	ap.add_argument(
+		'-n', '--num',
+		type=int,
+		default=1,
+		help='search the newest this many replays\n\n')
+	ap.add_argument(
+		'-a', '--all',
+		action='store_true',
+		help='search every replay in the replays directory\n\n')
+	ap.add_argument(
+		'-w', '--where',
+		default=None,
+		help='the condition on the columns\n\n')
+	ap.add_argument(
+		'-p', '--python',
+		default=None,
+		help='a condition on the decoded frame (data, turn, frame)\n\n')
+	ap.add_argument(
+		'-g', '--game',
+		default=None,
+		help="a condition on the game's endStats (stats)\n\n")
+	ap.add_argument(
+		'-t', '--by_turn',
+		action='store_true',
+		help='match turns instead of frames\n\n')
+	ap.add_argument(
+		'--limit',
+		type=int,
+		default=None,
+		help='stop after this many matches\n\n')
+	return vars(ap.parse_args())
+
+
+if __name__ == '__main__':
+	args = parse_args()
+	if len(args['file']) > 0:
+		replays = [f if os.path.exists(f) else os.path.join(REPLAY_DIR, f) for f in args['file']]
+	else:
+		replays = latest_replays(args['num'], args['all'])
+
+	names = namespace()
+	query = Query(replays, by_turn=args['by_turn'])
+	if args['where']:
+		query.where(eval(args['where'], names))
+	if args['python']:
+		code = compile(args['python'], '-p', 'eval')
+		query.where_data(lambda key, data: eval(code, names, {'data': data, 'turn': key[0], 'frame': key[1]}))
+	if args['game']:
+		code = compile(args['game'], '-g', 'eval')
+		query.where_game(lambda stats: stats is not None and eval(code, names, {'stats': stats}))
+
+	start = time.time()
+	hits = 0
+	found_in = set()
+	for hit in query:
+		if args['by_turn']:
+			print (os.path.basename(hit.replay), hit.turn)
+		else:
+			print (os.path.basename(hit.replay), hit.turn, hit.frame)
+		hits += 1
+		found_in.add(hit.replay)
+		if args['limit'] is not None and hits >= args['limit']:
+			break
+	print ('{} matches in {} of {} replays, {} frames decoded, {:.2f}s'.format(hits, len(found_in), len(replays), query.decoded, time.time() - start))
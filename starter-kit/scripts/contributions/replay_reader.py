@@ -0,0 +1,257 @@
+'''
+------------------------------------------------------------------------------------------------
+Short Description:
+Reads replay files one frame at a time. Shared by get_results.py and watch_replay.py.
+------------------------------------------------------------------------------------------------
+
+README:
+
+A replay is one line of JSON per frame, and a long match is several megabytes of it. Rather than
+decoding every line up front, ReplayReader makes one pass over the raw bytes and records where each
+frame's line starts and ends, along with its turn, frame and both players' health, which it picks out
+without decoding the line. A frame is only decoded with json.loads when it is asked for.
+
+The index is saved next to the replay as [REPLAY_FILE].replay.index, so opening the same replay again
+skips even that pass. It is used as long as the replay's size and modification time match what was
+recorded, and rebuilt otherwise. Replays that are still being written (no endStats yet) are indexed
+but the index is not saved, and refresh() indexes whatever the engine has added since, reading only the
+new bytes.
+
+Example:
+	reader = ReplayReader('replays/my-game.replay')
+	for (turn, frame), data in reader.turn_starts():
+		print(turn, data['p1Stats'])
+	end_stats = reader.end_stats
+'''
+
+import os
+import re
+import json
+from collections import OrderedDict
+
+INDEX_SUFFIX = '.index'
+INDEX_VERSION = 1
+
+_TURN_INFO = re.compile(rb'"turnInfo"\s*:\s*\[\s*(-?\d+)\s*,\s*(-?\d+)\s*,\s*(-?\d+)')
+_HEALTH = (re.compile(rb'"p1Stats"\s*:\s*\[\s*([-\d.eE+]+)'), re.compile(rb'"p2Stats"\s*:\s*\[\s*([-\d.eE+]+)'))
+_END_STATS = b'"endStats"'
+
+# positions in an index entry
+TURN, FRAME, OFFSET, LENGTH, P1_HEALTH, P2_HEALTH = range(6)
+
+
+class ReplayReader:
+	'''Indexes a replay by (turn, frame) and decodes frames on demand
+
+	Frames are keyed by (turn, frame) pairs as in turnInfo, where frame -1 is the frame sent at the
+	start of a turn and 0 and up are the action phase's frames. The reader acts like a read-only
+	dict of those keys, in the order they appear in the file. The final frame, which carries endStats,
+	has the same turnInfo as the last action frame and takes its place.
+
+	Attributes :
+		* path (str): The replay file
+		* entries (list): One [turn, frame, offset, length, p1 health, p2 health] list per frame, in file order
+		* cache_size (int): How many decoded frames to keep around for repeated lookups
+	'''
+	def __init__(self, path, use_index_file=True, cache_size=64):
+		self.path = path
+		self.cache_size = cache_size
+		self.entries = []
+		self.__positions = {}
+		self.__config_span = None
+		self.__finished = False
+		self.__config = None
+		self.__decoded = OrderedDict()
+		self.__scanned = 0
+
+		stat = os.stat(path)
+		if use_index_file and self.__load_index(stat):
+			self.__positions = dict(((entry[TURN], entry[FRAME]), position) for position, entry in enumerate(self.entries))
+			self.__scanned = stat.st_size
+		else:
+			self.__scan()
+			if use_index_file and self.__finished:
+				self.__save_index(stat)
+
+	def __repr__(self):
+		return 'ReplayReader({!r}, {} frames)'.format(self.path, len(self.entries))
+
+	def __len__(self):
+		return len(self.entries)
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __contains__(self, key):
+		return key in self.__positions
+
+	def __getitem__(self, key):
+		return self.frame(*key)
+
+	def keys(self):
+		'''The (turn, frame) pairs in the replay, in file order'''
+		return [(entry[TURN], entry[FRAME]) for entry in self.entries]
+
+	@property
+	def finished(self):
+		'''Whether the replay holds its final frame, the one with endStats'''
+		return self.__finished
+
+	@property
+	def last_key(self):
+		'''The (turn, frame) of the last frame, None for an empty replay'''
+		return (self.entries[-1][TURN], self.entries[-1][FRAME]) if self.entries else None
+
+	@property
+	def config(self):
+		'''The game config at the top of the replay, None if there is none'''
+		if self.__config is None and self.__config_span is not None:
+			with open(self.path, 'rb') as f:
+				self.__config = self.__decode(f, *self.__config_span)
+		return self.__config
+
+	@property
+	def end_stats(self):
+		'''The endStats of the final frame, None if the game has not finished'''
+		if not self.__finished:
+			return None
+		return self.frame(*self.last_key)['endStats']
+
+	def refresh(self):
+		'''Indexes whatever has been added to the replay since it was last read, for replays still being written
+
+		Only the bytes after the last complete line are read.
+
+		Returns:
+			The keys of the frames that were added, in order
+		'''
+		count = len(self.entries)
+		if not self.__finished:
+			self.__scan()
+		return [(entry[TURN], entry[FRAME]) for entry in self.entries[count:]]
+
+	def frame(self, turn, frame=-1):
+		'''Decodes one frame
+
+		Raises KeyError if the replay has no such frame.
+		'''
+		key = (turn, frame)
+		data = self.__decoded.get(key)
+		if data is None:
+			entry = self.entries[self.__positions[key]]
+			with open(self.path, 'rb') as f:
+				data = self.__decode(f, entry[OFFSET], entry[LENGTH])
+			self.__remember(key, data)
+		return data
+
+	def iter_frames(self, keys=None):
+		'''Yields ((turn, frame), data) for the given keys, or every frame, reading the file once in order
+
+		Only the frames asked for are read and decoded, and none of them are kept, so this is the way to
+		stream over a long replay.
+		'''
+		if keys is None:
+			entries = self.entries
+		else:
+			entries = sorted((self.entries[self.__positions[key]] for key in keys if key in self.__positions), key=lambda entry: entry[OFFSET])
+		with open(self.path, 'rb') as f:
+			for entry in entries:
+				key = (entry[TURN], entry[FRAME])
+				data = self.__decoded.get(key)
+				yield key, (data if data is not None else self.__decode(f, entry[OFFSET], entry[LENGTH]))
+
+	def turn_starts(self):
+		'''Yields ((turn, -1), data) for the frame at the start of each turn, in order'''
+		return self.iter_frames([(entry[TURN], entry[FRAME]) for entry in self.entries if entry[FRAME] == -1])
+
+	def turns(self):
+		'''The turn numbers in the replay, in order'''
+		return list(self.frames_in_turn())
+
+	def frames_in_turn(self):
+		'''An ordered dict of turn number to how many frames that turn has, the turn's start frame included'''
+		counts = OrderedDict()
+		for entry in self.entries:
+			counts[entry[TURN]] = counts.get(entry[TURN], 0) + 1
+		return counts
+
+	def last_frame_of_turns(self):
+		'''The key of the last frame of every turn, in order'''
+		last = OrderedDict()
+		for entry in self.entries:
+			last[entry[TURN]] = (entry[TURN], entry[FRAME])
+		return list(last.values())
+
+	def healths(self):
+		'''Both players' health on every frame, as two lists, read from the index without decoding anything'''
+		return [entry[P1_HEALTH] for entry in self.entries], [entry[P2_HEALTH] for entry in self.entries]
+
+	def __remember(self, key, data):
+		if self.cache_size <= 0:
+			return
+		self.__decoded[key] = data
+		if len(self.__decoded) > self.cache_size:
+			self.__decoded.popitem(last=False)
+
+	@staticmethod
+	def __decode(f, offset, length):
+		f.seek(offset)
+		return json.loads(f.read(length))
+
+	def __scan(self):
+		positions = self.__positions
+		offset = self.__scanned
+		with open(self.path, 'rb') as f:
+			f.seek(offset)
+			for line in f:
+				start = offset
+				if not line.endswith(b'\n'):
+					break				# the engine is still writing this line, it is read again next time
+				offset += len(line)
+				self.__scanned = offset
+				if not line.strip():
+					continue
+
+				turn_info = _TURN_INFO.search(line)
+				if turn_info is None:
+					if self.__config_span is None:
+						self.__config_span = (start, len(line))
+					continue
+
+				key = (int(turn_info.group(2)), int(turn_info.group(3)))
+				entry = [key[0], key[1], start, len(line)] + [float(pattern.search(line).group(1)) for pattern in _HEALTH]
+				if key in positions:
+					self.entries[positions[key]] = entry		# the final frame repeats the last action frame's turnInfo
+					self.__decoded.pop(key, None)
+				else:
+					positions[key] = len(self.entries)
+					self.entries.append(entry)
+				if _END_STATS in line:
+					self.__finished = True
+
+	def __index_path(self):
+		return self.path + INDEX_SUFFIX
+
+	def __load_index(self, stat):
+		try:
+			with open(self.__index_path()) as f:
+				index = json.load(f)
+		except (OSError, ValueError):
+			return False
+		if index.get('version') != INDEX_VERSION or index.get('size') != stat.st_size or index.get('mtime') != stat.st_mtime_ns:
+			return False
+		self.entries = index['entries']
+		self.__config_span = tuple(index['config']) if index['config'] else None
+		self.__finished = index['finished']
+		return True
+
+	def __save_index(self, stat):
+		index = {'version': INDEX_VERSION, 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+			'config': self.__config_span, 'finished': self.__finished, 'entries': self.entries}
+		partial = '{}.{}'.format(self.__index_path(), os.getpid())
+		try:
+			with open(partial, 'w') as f:
+				json.dump(index, f, separators=(',', ':'))
+			os.replace(partial, self.__index_path())		# so nobody reads a half written index
+		except OSError:
+			pass				# a read-only replays directory just means indexing again next time
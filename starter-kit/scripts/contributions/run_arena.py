@@ -60,12 +60,26 @@ This would run every single game like before, but 6 games at a time.
 
 DO NOT RUN WITH A LARGE BATCH SIZE (like >15, depending on your computer) or else it will take forever and crash.
 
+----------------------------------------------------------------------------------------
+-r: Play every pairing more than once
+>py scripts/contributions/run_arena.py -s algo1 algo2 -r 10
 
-At the end I also run the get_results.py script that outputs some data. I recommend having
-matplotlib installed for graphs, etc.
+-x: Also play every pairing with the sides swapped, so each algo spends as many games as player 1 as player 2
+>py scripts/contributions/run_arena.py -s algo1 algo2 -r 5 -x
 
-You can do much more with the get_results.py script that is not shown here and I plan
-on expanding its capabilities.
+----------------------------------------------------------------------------------------
+Results and resuming:
+
+Every finished match is appended to a results file as one line of JSON, with the algos, the winner,
+the number of turns, whether either algo crashed, the replay file and the engine's output log.
+The default results file is arena_results.jsonl in the starter kit directory, -o picks another one.
+
+Each match has an id made of the two algos and its repetition number, so running the same command
+again skips every match already in the results file and only plays the ones that are missing or failed.
+This means a run that was interrupted can just be started again. Use --fresh to ignore earlier results.
+
+Matches run on a pool of -b worker threads, each waiting on one engine process, and the engine's
+output for each match is saved next to the results file in arena_logs/.
 
 If you have questions just ask me on the forums - @Isaac
 '''
@@ -73,74 +87,146 @@ If you have questions just ask me on the forums - @Isaac
 import sys
 try:
 	import os
+	import json
+	import glob
 	import subprocess
 	import argparse
 	import itertools
 	import time
-	import copy
-	import multiprocessing as mp
+	import threading
+	from concurrent.futures import ThreadPoolExecutor, as_completed
 except ImportError as e:
 	print("WARNING: Module not found, full error:\n")
 	print(str(e))
 	sys.exit()
 
-
-# Runs a single game
-def run_single_game(process_command, algo1, algo2, max_name_len):
-	p = subprocess.Popen(
-		process_command,
-		shell=True,
-		stdout=subprocess.PIPE,
-		stderr=subprocess.PIPE
-		)
-	output, error = p.communicate()
-	# daemon necessary so game shuts down if this script is shut down by user
-	p.daemon = 1
-	p.wait()
-	print("{: <30}{: <{fill}}   vs   {}".format('Finished running match:', algo1, algo2, fill=str(max_name_len)))
-
-	# print (''.join(['{}\n'.format(x) for x in str(output).split('\\r\\n')])[1:])
-	if str(error) != "b''":
-		print ('Error with match - {} {}:\n\tError:\n{}'.format(algo1, algo2, error))
-
-def run_match(arg1='', arg2='', max_name_len=0):
-	# Get location of this run file
-	file_dir = os.path.dirname(os.path.realpath(__file__)).replace('\\contributions', '')
-	parent_dir = os.path.join(file_dir, os.pardir)
-	parent_dir = os.path.abspath(parent_dir)
-
-	# Get if running in windows OS
-	is_windows = sys.platform.startswith('win')
-
-	# Set default path for algos if script is run with no params
-	default_algo = parent_dir + "\\algos\\starter-algo-ZIPME\\run.ps1" if is_windows else parent_dir + "/algos/starter-algo-ZIPME/run.sh" 
-	algo1 = default_algo
-	algo2 = default_algo
-
-	# If script run with params, use those algo locations when running the game
-	if arg1 != '':
-		algo1 = arg1
-	if arg2 != '':
-		algo2 = arg2
-
-	# If folder path is given instead of run file path, add the run file to the path based on OS
-	# trailing_char deals with if there is a trailing \ or / or not after the directory name
-	if is_windows:
-		if "run.ps1" not in algo1:
-			trailing_char = "" if algo1.endswith("\\") else "\\"
-			algo1 = algo1 + trailing_char + "run.ps1"
-		if "run.ps1" not in algo2:
-			trailing_char = "" if algo2.endswith("\\") else "\\"
-			algo2 = algo2 + trailing_char + "run.ps1"
-	else:
-		if "run.sh" not in algo1:
-			trailing_char = "" if algo1.endswith('/') else "/"
-			algo1 = algo1 + trailing_char + "run.sh"
-		if "run.sh" not in algo2:
-			trailing_char = "" if algo2.endswith('/') else "/"
-			algo2 = algo2 + trailing_char + "run.sh"
-
-	run_single_game("cd {} && java -jar engine.jar work {} {}".format(parent_dir, algo1, algo2), algo1.split('\\')[-2].replace('algos/',''),  algo2.split('\\')[-2].replace('algos/',''), max_name_len)
+KIT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, os.pardir))
+ALGOS_DIR = os.path.join(KIT_DIR, 'algos')
+REPLAY_DIR = os.path.join(KIT_DIR, 'replays')
+IS_WINDOWS = sys.platform.startswith('win')
+
+
+# One game between two algos. Its id is stable between runs so finished matches can be skipped
+class Match:
+	def __init__(self, algo1, algo2, repetition=0):
+		self.algo1 = algo1
+		self.algo2 = algo2
+		self.repetition = repetition
+		self.id = '{}|{}|{}'.format(algo1, algo2, repetition)
+
+	def __repr__(self):
+		return self.id
+
+
+# Appends finished matches to a json lines file and remembers which match ids are done
+class ResultStore:
+	def __init__(self, path, fresh=False):
+		self.path = path
+		self.done = {}
+		self.__lock = threading.Lock()
+		if fresh and os.path.exists(path):
+			os.remove(path)
+		if os.path.exists(path):
+			with open(path) as f:
+				for line in f:
+					try:
+						record = json.loads(line)
+					except ValueError:
+						continue	# a line cut short by an interrupted run
+					if record.get('status') == 'ok':
+						self.done[record['id']] = record
+
+	def add(self, record):
+		with self.__lock:
+			with open(self.path, 'a') as f:
+				f.write(json.dumps(record) + '\n')
+				f.flush()
+				os.fsync(f.fileno())
+			if record['status'] == 'ok':
+				self.done[record['id']] = record
+
+
+# Works out which new replay file a finished match wrote. Matches can finish in any order, so
+# each one claims the oldest unclaimed replay between the two algos that appeared after it started.
+# Oldest first matters when repetitions of the same pairing run at once: matches claim in the order
+# they finish, and the replay that stopped changing first belongs to the match that finished first.
+# Newer replays may still be being written by repetitions that are running, and are left for them
+class ReplayClaims:
+	def __init__(self):
+		self.__claimed = set()
+		self.__lock = threading.Lock()
+
+	def claim(self, match, started):
+		with self.__lock:
+			candidates = []
+			for path in glob.glob(os.path.join(REPLAY_DIR, '*.replay')):
+				if path in self.__claimed or os.path.getmtime(path) < started:
+					continue
+				names = replay_names(path)
+				if names == (algo_name(match.algo1), algo_name(match.algo2)):
+					candidates.append(path)
+			if not candidates:
+				return None
+			path = min(candidates, key=os.path.getmtime)
+			self.__claimed.add(path)
+			return path
+
+
+def algo_name(algo):
+	return os.path.basename(os.path.normpath(algo))
+
+def run_file(algo):
+	algo = os.path.join(ALGOS_DIR, algo) if not os.path.isabs(algo) else algo
+	run_name = 'run.ps1' if IS_WINDOWS else 'run.sh'
+	return algo if algo.endswith(run_name) else os.path.join(algo, run_name)
+
+# reads only the last line of a replay, which holds the endStats
+def end_stats(path):
+	with open(path, 'rb') as f:
+		f.seek(0, os.SEEK_END)
+		size = f.tell()
+		block = min(size, 65536)
+		f.seek(size - block)
+		lines = [line for line in f.read().splitlines() if line.strip()]
+	for line in reversed(lines):
+		try:
+			data = json.loads(line)
+		except ValueError:
+			continue
+		if 'endStats' in data:
+			return data['endStats']
+	return None
+
+def replay_names(path):
+	stats = end_stats(path)
+	if stats is None:
+		return None
+	return (stats['player1'].get('name'), stats['player2'].get('name'))
+
+# Runs a single game and returns the record stored for it
+def run_single_game(match, claims, log_dir):
+	log_path = os.path.join(log_dir, '{}.log'.format(match.id.replace('|', '__')))
+	command = ['java', '-jar', 'engine.jar', 'work', run_file(match.algo1), run_file(match.algo2)]
+	started = time.time() - 1
+	with open(log_path, 'w') as log:
+		returncode = subprocess.call(command, cwd=KIT_DIR, stdout=log, stderr=subprocess.STDOUT)
+
+	record = {'id': match.id, 'algo1': match.algo1, 'algo2': match.algo2, 'repetition': match.repetition,
+		'returncode': returncode, 'log': log_path, 'replay': None, 'status': 'failed'}
+	replay = claims.claim(match, started)
+	stats = end_stats(replay) if replay else None
+	if stats is not None:
+		winner = stats.get('winner')
+		record.update({
+			'status': 'ok',
+			'replay': replay,
+			'winner': match.algo1 if winner == 1 else match.algo2 if winner == 2 else None,
+			'turns': stats.get('turns'),
+			'crashed': [stats['player1'].get('crashed', False), stats['player2'].get('crashed', False)],
+			'timeout': [stats['player1'].get('timeout_death', False), stats['player2'].get('timeout_death', False)],
+			'points': [stats['player1'].get('points_scored'), stats['player2'].get('points_scored')],
+		})
+	return record
 
 # handles all the arguments
 def parse_args():
@@ -164,14 +250,29 @@ def parse_args():
 		type=int,
 		default=5,
 		help="number of games to run at a single time (on seperate threads)\n\n")
+	ap.add_argument(
+		"-r", "--repeat",
+		type=int,
+		default=1,
+		help="number of times to play each pairing\n\n")
+	ap.add_argument(
+		"-x", "--swap",
+		action='store_true',
+		help="also play each pairing with the sides swapped\n\n")
+	ap.add_argument(
+		"-o", "--out",
+		default=os.path.join(KIT_DIR, 'arena_results.jsonl'),
+		help="file the results are appended to, and read from to skip finished matches\n\n")
+	ap.add_argument(
+		"--fresh",
+		action='store_true',
+		help="forget the results of earlier runs and play every match\n\n")
 	return vars(ap.parse_args())
 
 # called by the -a arg, runs every algo in directory
 def run_all():
-	algos_dir = os.path.dirname(os.path.realpath(__file__)).replace('scripts\\contributions', '')+'algos\\'
-	algos = os.listdir(algos_dir)
-	matches = itertools.combinations(algos, 2)
-	return matches
+	algos = sorted(x for x in os.listdir(ALGOS_DIR) if os.path.isdir(os.path.join(ALGOS_DIR, x)))
+	return itertools.combinations(algos, 2)
 
 # called by the -s arg, runs the specified algos
 def run_specific(algos):
@@ -181,77 +282,88 @@ def run_specific(algos):
 # called by the -f arg, runs the algos in the passed file
 def run_from_file(filePath):
 	try:
-		algos = [x.strip() for x in tuple(open(filePath, 'r'))]
+		algos = [x.strip() for x in tuple(open(filePath, 'r')) if x.strip()]
 		matches = itertools.combinations(algos, 2)
 		return matches
 	except FileNotFoundError:
 		print ('File {} was not found'.format(filePath))
 		sys.exit()
 
-# returns the number of processess that are active
-def get_num_running(processes):
-	c = 0
-	for i, proc in processes.items():
-		if proc.is_alive():
-			c += 1
-	return c
-
-# starts a subprocess for each match up to batch_size and then starts them as they finish
-def run_matches(matches, batch_size):
-	tmp = copy.deepcopy(matches)
-	max_name_len = len(max(tmp, key=lambda e:len(e[0]))[0])
-
-	algos = []
-	processes = {}
-	i = 0
-	for match in matches:
-		algos.append((match[0],match[1]))
-		algo1 = 'algos/{}'.format(match[0])
-		algo2 = 'algos/{}'.format(match[1])
-		processes[i] = mp.Process(target=run_match, args=(algo1, algo2, max_name_len))
-		i += 1
-
-	for i in range(len(processes)):
-		print ('{: <30}{: <{fill}}   vs   {}'.format('Starting match:', algos[i][0], algos[i][1], fill=str(max_name_len)))
-		processes[i].start()
-		i += 1
-		while get_num_running(processes) >= batch_size:
-			time.sleep(.1)
-
-	while get_num_running(processes) > 0:
-			time.sleep(.1)
+# expands pairings into the full list of matches, with repetitions and swapped sides
+def schedule(pairings, repeat=1, swap=False):
+	matches = []
+	for algo1, algo2 in pairings:
+		for repetition in range(repeat):
+			matches.append(Match(algo1, algo2, repetition))
+			if swap:
+				matches.append(Match(algo2, algo1, repetition))
+	return matches
+
+# runs every match not already in the results on a pool of batch_size workers
+def run_matches(matches, batch_size, store):
+	todo = [match for match in matches if match.id not in store.done]
+	if not todo:
+		print ('All {} matches already have results in {}'.format(len(matches), store.path))
+		return []
+	max_name_len = max(len(match.algo1) for match in todo)
+	print ('Running {} of {} matches ({} already done)'.format(len(todo), len(matches), len(matches) - len(todo)))
+
+	log_dir = os.path.join(os.path.dirname(os.path.abspath(store.path)), 'arena_logs')
+	os.makedirs(log_dir, exist_ok=True)
+	claims = ReplayClaims()
+	records = []
+	with ThreadPoolExecutor(max_workers=max(1, batch_size)) as pool:
+		futures = {pool.submit(run_single_game, match, claims, log_dir): match for match in todo}
+		for i, future in enumerate(as_completed(futures)):
+			match = futures[future]
+			try:
+				record = future.result()
+			except Exception as e:
+				record = {'id': match.id, 'algo1': match.algo1, 'algo2': match.algo2, 'repetition': match.repetition,
+					'status': 'failed', 'error': str(e)}
+			store.add(record)
+			records.append(record)
+			if record['status'] == 'ok':
+				outcome = 'winner {} in {} turns{}'.format(record['winner'], record['turns'], ', crashed' if any(record['crashed']) else '')
+			else:
+				outcome = 'FAILED, see {}'.format(record.get('log', record.get('error')))
+			print ('[{}/{}] {: <{fill}}   vs   {}: {}'.format(i + 1, len(todo), match.algo1, match.algo2, outcome, fill=str(max_name_len)))
 
 	print ()
 	print ('Finished all matches!')
 	print ()
+	return records
 
 if __name__ == '__main__':
 	args = parse_args() # get command line arguments
 
 	if args['all']:
 		print ('Running all algos')
-		matches = run_all()
+		pairings = run_all()
 	elif len(args['specific']) > 0:
-		matches = run_specific(args['specific'])
+		pairings = run_specific(args['specific'])
 	elif args['file'] != '':
-		matches = run_from_file(args['file'])
+		pairings = run_from_file(args['file'])
 	else:
 		print ('No arguments - no action taken')
 		sys.exit()
 
-	tmp = copy.deepcopy(matches)
-	run_matches(matches, args['batch'])		# run all matches
+	matches = schedule(pairings, args['repeat'], args['swap'])
+	store = ResultStore(args['out'], args['fresh'])
+	records = run_matches(matches, args['batch'], store)		# run all matches
 
 	# if get_results is avalible, run a summary of the matches played
-	try:
-		args = {	'all':		False, 				\
-					'verbose':	False, 				\
-					'averages':	[], 				\
-					'file':		[],					\
-					'graph':	['wins'],	\
-					'num':		len(list(tmp))		\
-				}
-		from get_results import main
-		main(args)
-	except Exception as e:
-		print (e)
+	replays = [record['replay'] for record in records if record.get('replay')]
+	if replays:
+		try:
+			args = {	'all':		False, 				\
+						'verbose':	False, 				\
+						'averages':	[], 				\
+						'file':		replays,			\
+						'graph':	['wins'],	\
+						'num':		len(replays)		\
+					}
+			from get_results import main
+			main(args)
+		except Exception as e:
+			print (e)
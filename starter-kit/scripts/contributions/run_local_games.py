@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+'''
+------------------------------------------------------------------------------------------------
+Short Description:
+Plays games between two python algos inside python, using gamelib's referee instead of the engine.
+Made for tuning strategies, where thousands of games are needed and starting java and two algo
+processes per game is what takes the time.
+------------------------------------------------------------------------------------------------
+
+README:
+
+This program assumes this file is in the scripts/contributions directory and gamelib is in python-algo/gamelib
+
+Algos are given as AlgoCore subclasses. A plain class name is looked up in python-algo/strategies.py,
+and module:Class picks a class from any module in python-algo. For example:
+>py scripts/contributions/run_local_games.py WallStrategy V1Strategy -n 200
+
+>py scripts/contributions/run_local_games.py WallStrategy algo_strategy_Joseph:AlgoStrategy -n 50 -b 4 -x
+
+The games follow the engine's rules but are played out by gamelib.Simulator, see gamelib/referee.py
+for what differs. Use run_match.py or run_arena.py to check a result against the real engine.
+
+----------------------------------------------------------------------------------------
+-n: The number of games to play, 10 by default
+
+-b: How many games to play at once, each in its own process. 1 by default
+
+-x: Swap sides every other game, so both algos play as often as player 1 as player 2
+
+-s: Seed for the first game, each game after it uses the next seed. Games with the same seed play out the same
+
+-r: Write a replay of every game into this directory, in the same format as the engine's replays,
+    so get_results.py and watch_replay.py can read them
+
+-a: Give the algos the action phase's frames through on_action_frame, which is slower
+
+-c: The game config, game-configs.json in the starter kit directory by default
+
+-v: Show what the algos print
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+from concurrent.futures import ProcessPoolExecutor
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+KIT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, os.pardir, os.pardir))
+ALGO_DIR = os.path.join(KIT_DIR, 'python-algo')
+sys.path.insert(0, ALGO_DIR)
+
+from gamelib.referee import play_game
+
+
+def load_algo(spec):
+	'''Finds the class an algo argument names, module:Class or a class in strategies.py'''
+	module_name, _, class_name = spec.rpartition(':')
+	module = importlib.import_module(module_name or 'strategies')
+	return getattr(module, class_name)
+
+
+def play(job):
+	'''Plays one game, run in a worker process'''
+	index, config_path, specs, seed, replay_dir, action_frames, quiet = job
+	with open(config_path) as f:
+		config = json.load(f)
+	replay_path = None
+	if replay_dir:
+		replay_path = os.path.join(replay_dir, 'local-{}-{}-vs-{}.replay'.format(index, *[spec.rpartition(':')[2] for spec in specs]))
+	start = time.time()
+	result = play_game(config, load_algo(specs[0]), load_algo(specs[1]), replay_path=replay_path, action_frames=action_frames,
+		quiet=quiet, seed=seed, names=specs)
+	errors = [error.strip().splitlines()[-1] if error else None for error in result.errors]
+	return {'game': index, 'algo1': specs[0], 'algo2': specs[1], 'seed': seed, 'winner': specs[result.winner - 1],
+		'turns': result.turns, 'health': result.health, 'crashed': result.crashed, 'errors': errors,
+		'replay': replay_path, 'seconds': time.time() - start}
+
+
+def schedule(args):
+	jobs = []
+	for index in range(args['num']):
+		specs = (args['algo1'], args['algo2'])
+		if args['swap'] and index % 2 == 1:
+			specs = specs[::-1]
+		seed = None if args['seed'] is None else args['seed'] + index
+		jobs.append((index, args['config'], specs, seed, args['replays'], args['action_frames'], not args['verbose']))
+	return jobs
+
+
+def summarize(records, seconds):
+	algos = sorted(set(record['algo1'] for record in records) | set(record['algo2'] for record in records))
+	print()
+	print('Played {} games in {:.1f}s ({:.0f} games per hour)'.format(len(records), seconds, len(records) / max(seconds, 1e-9) * 3600))
+	for algo in algos:
+		wins = sum(1 for record in records if record['winner'] == algo)
+		crashes = sum(1 for record in records for spec, crashed in zip((record['algo1'], record['algo2']), record['crashed']) if spec == algo and crashed)
+		print('|      {: >32} : {} wins ({:.1%}){}'.format(algo, wins, wins / len(records), ', {} crashes'.format(crashes) if crashes else ''))
+	print('|      {: >32} : {:.1f}'.format('average turns', sum(record['turns'] for record in records) / len(records)))
+
+
+def parse_args():
+	ap = argparse.ArgumentParser(add_help=False, formatter_class=argparse.RawTextHelpFormatter)
+	ap.add_argument('-h', '--help', action='help', help='show this help message and exit\n\n')
+	ap.add_argument('algo1', help='player 1, a class in strategies.py or module:Class\n\n')
+	ap.add_argument('algo2', help='player 2, like algo1\n\n')
+	ap.add_argument(
+		"-n", "--num",
+		type=int,
+		default=10,
+		help="the number of games to play\n\n")
+	ap.add_argument(
+		"-b", "--batch",
+		type=int,
+		default=1,
+		help="how many games to play at once\n\n")
+	ap.add_argument(
+		"-x", "--swap",
+		action='store_true',
+		help="swap sides every other game\n\n")
+	ap.add_argument(
+		"-s", "--seed",
+		type=int,
+		default=None,
+		help="seed of the first game\n\n")
+	ap.add_argument(
+		"-r", "--replays",
+		default=None,
+		help="directory to write replays to\n\n")
+	ap.add_argument(
+		"-a", "--action_frames",
+		action='store_true',
+		help="pass action frames to on_action_frame\n\n")
+	ap.add_argument(
+		"-c", "--config",
+		default=os.path.join(KIT_DIR, 'game-configs.json'),
+		help="the game config to play with\n\n")
+	ap.add_argument(
+		"-v", "--verbose",
+		action='store_true',
+		help="show the algos' output\n\n")
+	return vars(ap.parse_args())
+
+
+if __name__ == '__main__':
+	args = parse_args()
+	if args['replays']:
+		os.makedirs(args['replays'], exist_ok=True)
+	jobs = schedule(args)
+	start = time.time()
+	records = []
+	pool = ProcessPoolExecutor(max_workers=args['batch']) if args['batch'] > 1 else None
+	for record in (pool.map(play, jobs) if pool else map(play, jobs)):
+		records.append(record)
+		print('game {: >4}: {} vs {}, {} won in {} turns'.format(record['game'], record['algo1'], record['algo2'], record['winner'], record['turns']))
+	if pool:
+		pool.shutdown()
+	for record in records:
+		for spec, error in zip((record['algo1'], record['algo2']), record['errors']):
+			if error:
+				print('{} crashed in game {}: {}'.format(spec, record['game'], error))
+	summarize(records, time.time() - start)
@@ -0,0 +1,412 @@
+#!/usr/bin/env python
+
+'''
+------------------------------------------------------------------------------------------------
+Short Description:
+Replays recorded matches through gamelib's action phase predictors and reports how closely they
+follow the real engine, and how fast they run.
+------------------------------------------------------------------------------------------------
+
+README:
+
+This program assumes this file is in the scripts/contributions directory and gamelib is in python-algo/gamelib
+
+Every replay records each frame of every action phase. For each turn this script rebuilds the
+GameState the engine started the action phase from (the turn's deploy frame plus the units spawned
+on its first action frame), runs each predictor on it and diffs the prediction against the recording.
+
+Run it from the root of the starter kit with:
+>py scripts/contributions/validate_simulator.py
+
+By default every replay in the replays directory is checked with every predictor.
+
+----------------------------------------------------------------------------------------
+Predictors (-p):
+	- sim: gamelib.Simulator, compared frame by frame (unit positions, health, breaches)
+	- batch: gamelib.BatchSimulator running each turn as a single scenario, compared on how the
+	  turn ended (frames, health lost, breaches, which units breached, self destructed or died). Needs numpy
+	- path: GameState.find_path_to_edge for every unit deployed, compared with the tiles it walked
+	  until the first structure on the board was destroyed
+
+For example:
+>py scripts/contributions/validate_simulator.py -p sim path
+
+----------------------------------------------------------------------------------------
+-f: Check specific replay files
+>py scripts/contributions/validate_simulator.py -f [REPLAY_FILE].replay [REPLAY_FILE].replay
+
+-n: Check the n most recent replays
+>py scripts/contributions/validate_simulator.py -n 3
+
+-v: Print every mismatch instead of just the first few
+
+----------------------------------------------------------------------------------------
+
+Alongside the per frame checks, the totals over a whole match are compared with the replay's endStats:
+the points each player scored and the number of action frames played. Matches that ended in a crash or
+timeout are left out of that check, since the points awarded for it never happen on the board.
+
+The script exits with status 1 if any predictor disagreed with a replay, so it can guard changes to
+pathing or targeting.
+'''
+
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+KIT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, os.pardir, os.pardir))
+sys.path.insert(0, os.path.join(KIT_DIR, 'python-algo'))
+
+import gamelib
+from gamelib.simulator import Simulator
+from gamelib import batch_simulator
+
+MOBILE_TYPES = (3, 4, 5)
+REMOVE_TYPE = 6
+UPGRADE_TYPE = 7
+SHOWN_MISMATCHES = 5
+
+
+class TurnCase:
+	'''One action phase of a replay: the state the engine started it from and what it recorded'''
+	def __init__(self, config, turn, deploy_line, action_frames):
+		self.config = config
+		self.turn = turn
+		self.deploy_line = deploy_line
+		self.action_frames = action_frames
+		self.deploy = json.loads(deploy_line)
+		# Set on the last turn of a match a crash or timeout ended, whose health change no predictor can see
+		self.ended_by_crash = False
+
+	def build_state(self):
+		'''Returns the GameState the action phase started from and the mobile units spawned on it,
+		as (unit_type, [x, y], player_index, unit_id) tuples in spawn order'''
+		unit_information = self.config['unitInformation']
+		game_state = gamelib.GameState(self.config, self.deploy_line)
+		game_state.suppress_warnings(True)
+		game_map = game_state.game_map
+		mobiles = []
+		for (x, y), type_index, unit_id, player in self.action_frames[0]['events']['spawn']:
+			player_index = 0 if player == 1 else 1
+			if type_index in MOBILE_TYPES:
+				mobiles.append((unit_information[type_index]['shorthand'], [x, y], player_index, int(unit_id)))
+			elif type_index == UPGRADE_TYPE:
+				# The engine re-issues the structure's id and raises its health by the upgrade's extra startHealth
+				cell = game_map.cell_id([x, y])
+				base = unit_information[game_map.structure_types[cell]]
+				game_map._upgrade_structure(cell)
+				game_map.structure_ids[cell] = int(unit_id)
+				game_map.structure_health[cell] += base.get('upgrade', {}).get('startHealth', base['startHealth']) - base['startHealth']
+			elif type_index != REMOVE_TYPE:
+				game_map._place_unit(type_index, x, y, player_index, None, int(unit_id))
+		return game_state, mobiles
+
+	def recorded_health_delta(self):
+		last = self.action_frames[-1]
+		return [last['p1Stats'][0] - self.deploy['p1Stats'][0], last['p2Stats'][0] - self.deploy['p2Stats'][0]]
+
+	def recorded_outcomes(self):
+		'''Maps the id of every mobile unit that left the board to how it left'''
+		outcomes = {}
+		for frame in self.action_frames:
+			events = frame['events']
+			for event in events['breach']:
+				outcomes[int(event[3])] = 'breached'
+			for event in events['selfDestruct']:
+				outcomes[int(event[4])] = 'self_destructed'
+			for event in events['death']:
+				if event[1] in MOBILE_TYPES:
+					outcomes.setdefault(int(event[2]), 'destroyed')
+		return outcomes
+
+
+class Tally:
+	'''Counts matches, mismatches and timing for one predictor'''
+	def __init__(self, name):
+		self.name = name
+		self.checked = 0
+		self.matched = 0
+		self.frames = 0
+		self.frames_matched = 0
+		self.seconds = 0.0
+		self.mismatches = []
+
+	def add(self, matched, description=None):
+		self.checked += 1
+		if matched:
+			self.matched += 1
+		else:
+			self.mismatches.append(description)
+
+	def report(self, verbose, unit='turns'):
+		lines = ['{}:'.format(self.name)]
+		if self.checked == 0:
+			lines.append('|      nothing to check')
+			return '\n'.join(lines) + '\n'
+		lines.append('|      {: >24} : {}/{} ({:.1%})'.format(unit + ' exact', self.matched, self.checked, self.matched / self.checked))
+		if self.frames:
+			lines.append('|      {: >24} : {}/{} ({:.1%})'.format('frames exact', self.frames_matched, self.frames, self.frames_matched / self.frames))
+		if self.seconds > 0 and self.frames:
+			lines.append('|      {: >24} : {:.0f}'.format('frames per second', self.frames / self.seconds))
+		elif self.seconds > 0:
+			lines.append('|      {: >24} : {:.0f}'.format(unit + ' per second', self.checked / self.seconds))
+		shown = self.mismatches if verbose else self.mismatches[:SHOWN_MISMATCHES]
+		for description in shown:
+			lines.append('|      mismatch: {}'.format(description))
+		if len(shown) < len(self.mismatches):
+			lines.append('|      ... {} more, use -v to see them all'.format(len(self.mismatches) - len(shown)))
+		return '\n'.join(lines) + '\n'
+
+
+def load_replay(path):
+	with open(path) as replay:
+		lines = [line for line in replay if line.strip()]
+	config = json.loads(lines[0])
+	return config, lines[1:], [json.loads(line) for line in lines[1:]]
+
+
+def turn_cases(config, lines, frames):
+	cases = []
+	for index, frame in enumerate(frames):
+		if frame['turnInfo'][0] != 0:
+			continue
+		turn = frame['turnInfo'][1]
+		action_frames = []
+		for later in frames[index + 1:]:
+			if later['turnInfo'][1] != turn:
+				break
+			if later['turnInfo'][0] == 1:
+				action_frames.append(later)
+		if action_frames:
+			cases.append(TurnCase(config, turn, lines[index], action_frames))
+	return cases
+
+
+def recorded_snapshot(frame):
+	mobiles = {}
+	structures = {}
+	for player, key in ((0, 'p1Units'), (1, 'p2Units')):
+		for type_index, units in enumerate(frame[key][:REMOVE_TYPE]):
+			for unit in units:
+				if type_index in MOBILE_TYPES:
+					mobiles[int(unit[3])] = (unit[0], unit[1], round(unit[2], 2))
+				else:
+					structures[int(unit[3])] = round(unit[2], 2)
+	breaches = sorted(int(event[3]) for event in frame['events']['breach'])
+	return mobiles, structures, breaches
+
+
+def simulated_snapshot(simulator, frame_index):
+	mobiles = dict((unit.unit_id, (unit.x, unit.y, round(unit.health, 2))) for unit in simulator.mobile_units if unit.outcome is None)
+	structures = dict((unit.unit_id, round(unit.health, 2)) for unit in simulator.structures if unit.outcome is None)
+	breaches = sorted(unit.unit_id for frame, _, unit in simulator.breaches if frame == frame_index)
+	return mobiles, structures, breaches
+
+
+def describe_difference(name, turn, frame_index, predicted, recorded):
+	labels = ('mobile units', 'structures', 'breaches')
+	for label, mine, theirs in zip(labels, predicted, recorded):
+		if mine == theirs:
+			continue
+		if isinstance(mine, dict):
+			ids = sorted(key for key in set(mine) | set(theirs) if mine.get(key) != theirs.get(key))[:4]
+			detail = ', '.join('{}: {} vs {}'.format(key, mine.get(key), theirs.get(key)) for key in ids)
+		else:
+			detail = '{} vs {}'.format(mine, theirs)
+		return '{} turn {} frame {}: {} predicted vs recorded, {}'.format(name, turn, frame_index, label, detail)
+	return '{} turn {} frame {}'.format(name, turn, frame_index)
+
+
+def check_simulator(name, cases, tally, totals):
+	for case in cases:
+		game_state, mobiles = case.build_state()
+		start = time.time()
+		simulator = Simulator(game_state)
+		for unit_type, location, player_index, unit_id in mobiles:
+			simulator.add_unit(unit_type, location, player_index, unit_id=unit_id)
+		tally.seconds += time.time() - start
+
+		difference = None
+		for frame_index, frame in enumerate(case.action_frames):
+			if not mobiles:
+				break
+			start = time.time()
+			simulator.step()
+			tally.seconds += time.time() - start
+			tally.frames += 1
+			predicted = simulated_snapshot(simulator, frame_index)
+			recorded = recorded_snapshot(frame)
+			if predicted == recorded:
+				tally.frames_matched += 1
+			elif difference is None:
+				difference = describe_difference(name, case.turn, frame_index, predicted, recorded)
+		if difference is None and not case.ended_by_crash and simulator.health_delta != case.recorded_health_delta():
+			difference = '{} turn {}: health change {} predicted vs {} recorded'.format(name, case.turn, simulator.health_delta, case.recorded_health_delta())
+		if difference is None and max(1, simulator.frame) != len(case.action_frames):
+			difference = '{} turn {}: {} frames predicted vs {} recorded'.format(name, case.turn, max(1, simulator.frame), len(case.action_frames))
+		tally.add(difference is None, difference)
+		totals['frames'] += max(1, simulator.frame)
+		totals['points'][0] -= simulator.health_delta[1]
+		totals['points'][1] -= simulator.health_delta[0]
+
+
+def check_batch(name, cases, tally):
+	'''Runs each turn as a one scenario BatchSimulator and compares how the turn ended'''
+	for case in cases:
+		game_state, mobiles = case.build_state()
+		if not mobiles:
+			continue
+		start = time.time()
+		result = batch_simulator.BatchSimulator(game_state, [[(unit_type, location, player_index, 1) for unit_type, location, player_index, _ in mobiles]]).run()
+		tally.seconds += time.time() - start
+		tally.frames += int(result.frames[0])
+
+		recorded = case.recorded_outcomes()
+		outcomes = list(result.mobile_outcomes[0][-len(mobiles):])
+		expected = [recorded.get(unit_id) for _, _, _, unit_id in mobiles]
+		difference = None
+		if not case.ended_by_crash and list(result.health_delta[0]) != case.recorded_health_delta():
+			difference = '{} turn {}: health change {} predicted vs {} recorded'.format(name, case.turn, list(result.health_delta[0]), case.recorded_health_delta())
+		elif int(result.frames[0]) != len(case.action_frames):
+			difference = '{} turn {}: {} frames predicted vs {} recorded'.format(name, case.turn, int(result.frames[0]), len(case.action_frames))
+		elif outcomes != expected:
+			difference = '{} turn {}: unit outcomes {} predicted vs {} recorded'.format(name, case.turn, outcomes, expected)
+		tally.add(difference is None, difference)
+		if difference is None:
+			tally.frames_matched += int(result.frames[0])
+
+
+def recorded_trails(case):
+	'''Maps the id of every mobile unit to the tiles it stood on until the first structure was destroyed'''
+	trails = {}
+	for (x, y), type_index, unit_id, player in case.action_frames[0]['events']['spawn']:
+		if type_index in MOBILE_TYPES:
+			trails[int(unit_id)] = [[x, y]]
+	for frame in case.action_frames:
+		events = frame['events']
+		for event in events['move']:
+			trails[int(event[4])].append(event[1])
+		if any(event[1] not in MOBILE_TYPES for event in events['death']):
+			return trails, False
+	return trails, True
+
+
+def check_paths(name, cases, tally):
+	for case in cases:
+		game_state, mobiles = case.build_state()
+		if not mobiles:
+			continue
+		trails, complete = recorded_trails(case)
+		outcomes = case.recorded_outcomes()
+		for unit_type, location, player_index, unit_id in mobiles:
+			start = time.time()
+			path = game_state.find_path_to_edge(location)
+			tally.seconds += time.time() - start
+			trail = trails[unit_id]
+			# A unit's walk only shows its whole path if the board never changed and it was not destroyed on the way
+			if complete and outcomes.get(unit_id) != 'destroyed':
+				matched = path == trail
+			else:
+				matched = path[:len(trail)] == trail
+			tally.add(matched, '{} turn {} unit {} from {}: predicted {} recorded {}'.format(name, case.turn, unit_id, location, path, trail))
+
+
+def ended_by_crash(frames):
+	end_stats = frames[-1].get('endStats', {})
+	return any(end_stats.get(player, {}).get(key) for player in ('player1', 'player2') for key in ('crashed', 'timeout_death'))
+
+
+def check_end_stats(name, frames, totals, tally):
+	end_stats = frames[-1].get('endStats')
+	if end_stats is None or ended_by_crash(frames):
+		return
+	recorded_points = [end_stats['player1']['points_scored'], end_stats['player2']['points_scored']]
+	difference = None
+	if totals['points'] != recorded_points:
+		difference = '{}: points scored {} predicted vs {} recorded'.format(name, totals['points'], recorded_points)
+	elif totals['frames'] != end_stats['frames']:
+		difference = '{}: {} action frames predicted vs {} recorded'.format(name, totals['frames'], end_stats['frames'])
+	tally.add(difference is None, difference)
+
+
+def find_replays(args):
+	if args['file']:
+		return args['file']
+	files = glob.glob(os.path.join(KIT_DIR, 'replays', '*.replay'))
+	files = sorted(files, key=os.path.getmtime, reverse=True)
+	if args['num'] is not None:
+		files = files[:args['num']]
+	return sorted(files)
+
+
+def parse_args():
+	ap = argparse.ArgumentParser(add_help=False, formatter_class=argparse.RawTextHelpFormatter)
+	ap.add_argument('-h', '--help', action='help', help='show this help message and exit\n\n')
+	ap.add_argument(
+		"-f", "--file",
+		nargs='*',
+		default=[],
+		help="replay files to check, every replay in the replays directory if left out\n\n")
+	ap.add_argument(
+		"-n", "--num",
+		type=int,
+		default=None,
+		help="check only the n most recent replays\n\n")
+	ap.add_argument(
+		"-p", "--predictors",
+		nargs='*',
+		default=['sim', 'batch', 'path'],
+		choices=['sim', 'batch', 'path'],
+		help="which predictors to check\n\n")
+	ap.add_argument(
+		"-v", "--verbose",
+		action='store_true',
+		help="print every mismatch\n\n")
+	return vars(ap.parse_args())
+
+
+if __name__ == '__main__':
+	args = parse_args()
+	predictors = args['predictors']
+	if 'batch' in predictors and batch_simulator.np is None:
+		print('numpy is not installed, skipping the batch predictor')
+		predictors = [predictor for predictor in predictors if predictor != 'batch']
+
+	tallies = {
+		'sim': Tally('Simulator'),
+		'batch': Tally('BatchSimulator'),
+		'path': Tally('find_path_to_edge'),
+		'end': Tally('endStats totals (Simulator)'),
+	}
+	replays = find_replays(args)
+	if not replays:
+		print('No replays found')
+		sys.exit()
+
+	for path in replays:
+		name = os.path.basename(path)
+		config, lines, frames = load_replay(path)
+		cases = turn_cases(config, lines, frames)
+		if cases and ended_by_crash(frames):
+			cases[-1].ended_by_crash = True
+		print('Checking {} ({} turns)'.format(name, len(cases)))
+		if 'sim' in predictors:
+			totals = {'frames': 0, 'points': [0.0, 0.0]}
+			check_simulator(name, cases, tallies['sim'], totals)
+			check_end_stats(name, frames, totals, tallies['end'])
+		if 'batch' in predictors:
+			check_batch(name, cases, tallies['batch'])
+		if 'path' in predictors:
+			check_paths(name, cases, tallies['path'])
+
+	print()
+	for key in ('sim', 'batch', 'path', 'end'):
+		if key in predictors or (key == 'end' and 'sim' in predictors):
+			print(tallies[key].report(args['verbose'], unit={'path': 'paths', 'end': 'replays'}.get(key, 'turns')))
+
+	if any(tally.mismatches for tally in tallies.values()):
+		sys.exit(1)
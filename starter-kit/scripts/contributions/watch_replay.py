@@ -190,9 +190,9 @@ try:
 	import os
 	import sys
 	import time
-	import json
 	import glob
 	import random
+	import bisect
 	import warnings
 	import argparse
 	import subprocess
@@ -201,6 +201,8 @@ except ImportError as e:
 	sys.stderr.write("WARNING: Module not found, full error:\n\n")
 	sys.stderr.write(e)
 
+from replay_reader import ReplayReader
+
 try:
 	import matplotlib.pyplot as plt
 	import matplotlib.animation as animation
@@ -359,7 +361,7 @@ class Unit:
 			 self.unit_type == EMP or \
 			 self.unit_type == SCRAMBLER:
 				verts = GET_VERTS[self.unit_type](self.x, self.y)
-				polygon = Polygon(verts, True)
+				polygon = Polygon(verts, closed=True)
 
 				self.polygons.append(polygon)
 				self.patches.append(ax.add_patch(polygon))
@@ -400,7 +402,7 @@ class Unit:
 		if self.unit_type == ENCRYPTOR:
 			self.patches[1].set_alpha(0.3)
 
-		if self.stability > MAX_HP[self.unit_type]:
+		if self.stability > MAX_HP[self.unit_type] and len(self.patches) > 1:
 			self.patches[1].set_fill(False)
 			self.patches[1].set_alpha(0.5)
 
@@ -447,7 +449,7 @@ class Unit:
 class PatchWrapper:
 	def __init__(self):
 		self.units = {}		# stores every unit currently on the board with each ID as the key
-		self.loc = {}		# stores the number of units at a location with each location tuple (x,y) as the key
+		self.loc = {}		# the number of units at each location (x,y) with more than 1 unit, as currently labeled
 		self.lbls = []		# stores the text labels if a location has more than 1 unit
 
 	# creates a unit and stores it in self.units
@@ -457,13 +459,11 @@ class PatchWrapper:
 
 	# removes a unit by ID from both the board and self.units
 	def remove_unit(self, ID):
-		for key, val in self.units.items():
-			if val == ID:
-				self.units[ID].remove()
-				self.units.pop(ID, None)
-				break
+		unit = self.units.pop(ID, None)
+		if unit is not None:
+			unit.remove()
 
-	# clears the entire board - not used anymore (very inefficient mode of updating)
+	# clears the entire board
 	def clear_board(self):
 		self.loc = {}
 
@@ -479,45 +479,25 @@ class PatchWrapper:
 			lbl.remove()
 		self.lbls = []
 
-	# removes all previous labels and creates new ones at locations with more than one unit, then resets self.loc
-	def update_lbls(self, ax):
+	# relabels the locations with more than one unit, if they changed
+	def update_lbls(self, loc, ax):
+		if loc == self.loc:
+			return
 		self.remove_lbls()
-		for pos, val in self.loc.items():
-			if val > 1:
-				self.plot_text(val, pos, ax)
-		self.loc = {}
+		for pos, val in loc.items():
+			self.plot_text(val, pos, ax)
+		self.loc = loc
 
-	# updates all units
-	def update_units(self, units, ax):
-		ids = [u[4] for u in units]
-
-		# get all units that are no longer on the board
-		# (you cannot use the engines remove since using the slider does not remove them)
-		remove = []
-		for unit in self.units.values():
-			if unit not in ids:
-				remove.append(unit.ID)
-
-		# remove all the units (cannot do it from the above loop - RuntimeError)
-		for ID in remove:
+	# applies the changes between two frames (see Playback) - units that did not change are not touched
+	def apply(self, spawned, changed, removed, ax):
+		for ID in removed:
 			self.remove_unit(ID)
 
-		# loop through all the units given by the engine
-		for unit_raw in units:
-			unit_type, (x, y), stability, p_index, ID = unit_raw
-
-			# update the board locations count of units
-			try:
-				self.loc[(x,y)] += 1
-			except KeyError:
-				self.loc[(x,y)] = 1
-
-			# if a unit already exists, update it. If not, create it
-			try:
-				self.units[ID].update(x, y, stability, p_index, ID, self.loc[(x,y)], ax)
-			except KeyError:
-				self.create_unit(unit_type, (x,y), stability, p_index, ID, self.loc[(x,y)], ax)
+		for ID, (unit_type, x, y, stability, p_index, count) in changed:
+			self.units[ID].update(x, y, stability, p_index, ID, count, ax)
 
+		for ID, (unit_type, x, y, stability, p_index, count) in spawned:
+			self.create_unit(unit_type, (x,y), stability, p_index, ID, count, ax)
 
 	# adds the count lable to a position on the board
 	def plot_text(self, txt, pos, ax):
@@ -533,6 +513,8 @@ class PatchWrapper:
 class Info:
 	def __init__(self, endStats, ax, slider_exists=False):
 		self.lbls = []											# holds every text object that needs to be updated
+		self.stats = None										# the stats currently shown
+		self.winner_shown = False
 		self.color = {True:'C0', False:'r', 1:'C0', 2:'r'}		# color reference based on player index
 		self.ax = ax 											# reference to the right plt axes
 
@@ -571,6 +553,7 @@ class Info:
 			lbl.remove()
 
 		self.lbls = []
+		self.winner_shown = False
 
 	# display all text that won't change
 	def disp_static(self, endStats):
@@ -604,6 +587,9 @@ class Info:
 
 	# remove previous information and add all new data
 	def update(self, p1Stats, p2Stats):
+		if (p1Stats, p2Stats) == self.stats:
+			return
+		self.stats = (p1Stats, p2Stats)
 		self.clear_info()
 
 		self.add_data('health', 1, int(p1Stats[0]))
@@ -618,10 +604,15 @@ class Info:
 
 	# if the end of game is reached, show the winner
 	def show_winner(self):
+		if self.winner_shown:
+			return
+		self.winner_shown = True
 		try:
 			self.lbls.append(self.ax.text(.5, .67, '{} wins!'.format(self.winner_name), color=self.color[self.winner], verticalalignment='bottom', horizontalalignment='center', fontsize=24))
 		except TypeError:
 			print ('tried and failed to show winner - no endStats')
+		except AttributeError:
+			self.winner_shown = False							# the game is still running
 
 
 # this contains all data for the health plot on the right side
@@ -645,6 +636,8 @@ class Plot:
 		self.lines[1].set_xdata(list(range(0, 100)))				# set the x_range for the line to always be 100
 
 		self.ax.set_xlim(0, 100)									# set the x_range for the plot to always be 100
+		self.ax.set_xticks(list(range(0, 101, 20)))					# the labels move with the frame, the ticks do not
+		self.x_0 = None												# the first frame currently labeled
 
 		self.update(frame)											# update the plot
 
@@ -668,7 +661,9 @@ class Plot:
 			line1 = nulls + self.data[0][x_0:frame]
 			line2 = nulls + self.data[1][x_0:frame]
 
-		self.ax.set_xticklabels(list(range(x_0, frames+1, 20)))		# updates the x_labels
+		if x_0 != self.x_0:
+			self.ax.set_xticklabels(list(range(x_0, frames+1, 20)))	# updates the x_labels
+			self.x_0 = x_0
 
 		self.lines[0].set_ydata(line1)								# set the data for line1
 		self.lines[1].set_ydata(line2)								# set the data for line2
@@ -676,14 +671,16 @@ class Plot:
 
 # this class contains all information regarding the entire window
 class Graph:
-	def __init__(self, data, frames_in_turn, healths, writers, keep_trying, save='', fh=None):
+	def __init__(self, replay, writers, keep_trying, save='', real_time=False):
 
 		# pretty clear, if no data, raise an Error
-		if len(data) < 1:
+		if len(replay.frames) < 1:
 			raise RuntimeError('no data')
 
-		self.fh = fh 																# reference to file handler
-		self.real_time = False if self.fh == None else True 						# tracks whether real-time
+		self.replay = replay 														# the replay, which is tailed when in real-time
+		self.real_time = real_time 													# tracks whether real-time
+		self.playback = Playback(replay)											# the changes between frames, worked out once
+		self.shown = None															# the index of the frame the board shows
 
 		plt.style.use('dark_background')											# sets black background
 
@@ -692,7 +689,7 @@ class Graph:
 		self.board_ax, self.info_ax = ax 											# assign left and right side references
 		self.plot_ax = self.fig.add_subplot(324)									# add the plot and assing it's reference
 
-		self.general_init(data, frames_in_turn, healths)							# handles general initialization (called again if in real-time)
+		self.general_init()															# handles general initialization
 
 		self.head = (0,-1)															# tracks the current turn, frame pair
 		self.end_of_game = False													# end of game flag
@@ -710,10 +707,10 @@ class Graph:
 
 		# if in real-time, use a generator function to update number of frames, otherwise frames is static
 		if not self.real_time:
-			self.anim = animation.FuncAnimation(self.fig, self.update, init_func=self.init, frames=self.num_frames, interval=100, blit=BLIT, repeat=False)
+			self.anim = animation.FuncAnimation(self.fig, self.update, init_func=self.init, frames=self.num_frames, interval=100, blit=BLIT, repeat=False, cache_frame_data=False)
 		else:
 			self.frame_generator = self.gen_frames()
-			self.anim = animation.FuncAnimation(self.fig, self.update, init_func=self.init, frames=self.frame_generator, interval=100, blit=BLIT, repeat=False)
+			self.anim = animation.FuncAnimation(self.fig, self.update, init_func=self.init, frames=self.frame_generator, interval=100, blit=BLIT, repeat=False, cache_frame_data=False)
 
 		self.change_play_speed('3')													# initialize the playback speed ('3' is default)
 
@@ -815,33 +812,49 @@ class Graph:
 					return False
 			return False
 
-	# extension of __init__(), called every frame when real-time
-	def general_init(self, data, frames_in_turn, healths):
-		self.data = data 													# dict with keys of (turn, frame) tuple and values of a Frame object
-		self.frames_in_turn = frames_in_turn								# dict with keys of turn and values of number of frames in that turn
-		self.healths = healths												# all known health data, tuple containing two lists, player1 and player2 healths
+	# extension of __init__()
+	def general_init(self):
+		self.data = self.replay.frames 										# a ReplayReader, used like a dict with keys of (turn, frame) tuples and the frame's data as values
+		self.frames_in_turn = self.replay.frames_in_turn					# dict with keys of turn and values of number of frames in that turn
+		self.healths = self.replay.healths									# all known health data, tuple containing two lists, player1 and player2 healths
 		self.num_frames = len(self.data)									# the number of total frames
 		self.slider_exists = False											# begin by assuming the slider does not exist
 
 		self.plot = Plot(self.healths, self.plot_ax)						# create the Plot object (plots the health)
 
-		# try and get endStats, if not then file is still being created by engine (game is still running)
-		try:
-			last_frame = max(self.data, key=lambda f: (f[0], f[1]))			# the last frame of the entire match (single number)
-			endStats = self.data[last_frame].data['endStats']				# here is where the error would be thrown - if endStats exists
+		# if there are no endStats the file is still being created by engine (game is still running)
+		endStats = self.replay.reader.end_stats
+		if endStats != None:
+			self.end_init(endStats)
+		else:
+			self.info = Info(None, self.info_ax)							# endStats doesn't exist, create Info with default values
 
-			# From here on we know we have all data for entire game - endStats exists
+	# from here on we know we have all data for entire game - endStats exists
+	def end_init(self, endStats):
+		# if blit is on, do not create the slider
+		if not BLIT:
+			self.slider = Slider(self.fig.add_axes([0.6, 0.03, 0.3, 0.03]), 'Turn Slider', 0, self.num_frames, valfmt='%1i', valstep=1, color='w')
+			self.slider.on_changed(self.slider_active)
+			self.slider_exists = True 										# tracks whether the slider exists
+
+		self.info_ax.clear()												# remove the default values if the game was watched in real-time
+		self.info = Info(endStats, self.info_ax, True)						# create the Info (right side) with endStates information
+		self.real_time = False												# not longer running in real-time
+
+	# in real-time, reads the frames the engine added since the last check - only the new bytes of the file are read
+	def tail(self):
+		new = self.replay.refresh()
+		if len(new) == 0:
+			return
 
-			# if blit is on, do not create the slider
-			if not BLIT:
-				self.slider = Slider(self.fig.add_axes([0.6, 0.03, 0.3, 0.03]), 'Turn Slider', 0, self.num_frames, valfmt='%1i', valstep=1, color='w')
-				self.slider.on_changed(self.slider_active)
-				self.slider_exists = True 									# tracks whether the slider exists
+		self.playback.extend(new)
+		self.frames_in_turn = self.replay.frames_in_turn
+		self.healths = self.replay.healths
+		self.num_frames = len(self.data)
+		self.plot.data = self.healths
 
-			self.info = Info(endStats, self.info_ax, True)					# create the Info (right side) with endStates information
-			self.real_time = False											# not longer running in real-time
-		except KeyError as e:
-			self.info = Info(None, self.info_ax)							# endStats doesn't exist, create Info with default values
+		if self.replay.reader.finished:
+			self.end_init(self.replay.reader.end_stats)
 
 	# change the interval speed between frames
 	def change_play_speed(self, speed):
@@ -853,8 +866,8 @@ class Graph:
 		self.board_ax.set_xticks(range(-1, 29))
 		self.board_ax.set_yticks(range(-1, 29))
 		self.board_ax.tick_params(axis=u'both', which=u'both',length=0)
-		self.board_ax.set_xticklabels(['']+list(range(28)))
-		self.board_ax.set_yticklabels(['']+list(range(28)))
+		self.board_ax.set_xticklabels(['']+list(range(28))+[''])
+		self.board_ax.set_yticklabels(['']+list(range(28))+[''])
 		[spine.set_visible(False) for n, spine in self.board_ax.spines.items()]
 		self.board_ax.set_title('Local Match Visualizer')
 
@@ -916,11 +929,8 @@ class Graph:
 			turn += 1
 		frame = val - 1
 
-		try:
-			self.data[(int(turn), int(frame))]
-		except KeyError:
-			if frame > 0:
-				frame -= 1
+		if (int(turn), int(frame)) not in self.data and frame > 0:
+			frame -= 1
 
 		return (int(turn), int(frame))
 
@@ -976,17 +986,14 @@ class Graph:
 			return
 
 		# while you can, increment the frame by 1
-		try:
-			self.data[self.head[0],self.head[1]+1]
+		if (self.head[0], self.head[1]+1) in self.data:
 			self.head = self.head[0], self.head[1]+1
-		except KeyError:
-			# outside of frames for that turn, try incrementing turn by 1
-			try:
-				self.data[self.head[0]+1,-1]
-				self.head = self.head[0]+1, -1
-			except KeyError as e:
-				# outside both turns and frames - must be the end of game
-				self.end_of_game = True
+		# outside of frames for that turn, try incrementing turn by 1
+		elif (self.head[0]+1, -1) in self.data:
+			self.head = self.head[0]+1, -1
+		# outside both turns and frames - must be the end of game
+		else:
+			self.end_of_game = True
 
 
 		# only update the slider if it exits
@@ -999,36 +1006,11 @@ class Graph:
 	def data_stream(self):
 		while True:
 
-			# everything in this block (real-time) is extrememly inefficient, becuase it has to constantly load new data
+			# in real-time, pick up whatever the engine has written since the last frame
 			if self.real_time:
-				self.info_ax.clear()															# clear the inforation side
-
-				self.fh.load_files(1,False,args['file']) 										# load latest replay (again)
-				replay = self.fh.get_last_replay()												# get latest replay (again)
-
-				# user paused game, don't advance
-				if not self.is_manual:
-					self.advance()
-
-				self.general_init(replay.frames, replay.frames_in_turn, replay.healths)			# call general initialization
-
-				# this is for the first call - cannot send before yield is reached (function called)
-				try:
-					self.frame_generator.send(self.num_frames)		# send the inverval generator the number of frames loaded
-				except TypeError:
-					pass
+				self.tail()
 
-			# get the data
-			p1Units = self.data[self.head]['p1Units']
-			p2Units = self.data[self.head]['p2Units']
-			p1Stats = self.data[self.head]['p1Stats']
-			p2Stats = self.data[self.head]['p2Stats']
-
-			units = self.cache_units(p1Units, 1) + self.cache_units(p2Units, 2)						# format the unit data into how it is passed to my functions
-			self.patches.update_units(units, self.board_ax)											# update all the units
-			self.patches.update_lbls(self.board_ax)													# update all the unit count labels
-
-			self.info.update(p1Stats, p2Stats)														# update the information board
+			self.show_frame()																		# bring the board to the head
 			self.plot.update(self.frame_turn_to_val(self.head[0], self.head[1]))					# update the health plot
 
 			self.advance()																			# move the head forward 1
@@ -1036,43 +1018,36 @@ class Graph:
 
 			yield self.patches.values() + self.patches.lbls + self.info.lbls + self.plot.lines		# send all dynamic data to the matplotlib animator
 
+	# updates only the units that differ between the frame on the board and the head
+	def show_frame(self):
+		index = self.playback.positions[self.head]
+		if index != self.shown:
+			spawned, changed, removed = self.playback.changes(self.shown, index)
+			self.patches.apply(spawned, changed, removed, self.board_ax)							# update the units that changed
+			self.patches.update_lbls(self.playback.labels[index], self.board_ax)					# update the unit count labels if they changed
+			self.shown = index
+
+		p1Stats, p2Stats = self.playback.stats[index]
+		self.info.update(p1Stats, p2Stats)															# update the information board
+
 	# called by the animator everytime it's interval finishes
 	def update(self, i=0):
-		# self.patches.clear_board()	# inefficient, no longer used
 		return next(self.stream) 		# sends the data to the animator
 
 	# if blit is used, animator requires an init function to get intial graph values
 	def init(self):
 		return next(self.stream)
 
-	# generator function to give the animator the number of total frames when running real-time
+	# generator function to keep the animator going while running real-time
 	def gen_frames(self):
 		while True:
-			num = yield
-			yield num
-
-	# format all of the raw unit data into how my functions recieve it
-	def cache_units(self, units, p_index):
-		filters, encryptors, destructors, pings, emps, scramblers, removes = units
-		units_new = []
-		for unit in filters: units_new.append((FILTER, (unit[0], unit[1]), unit[2], p_index, unit[3]))
-		for unit in encryptors: units_new.append((ENCRYPTOR, (unit[0], unit[1]), unit[2], p_index, unit[3]))
-		for unit in destructors: units_new.append((DESTRUCTOR, (unit[0], unit[1]), unit[2], p_index, unit[3]))
-		for unit in pings: units_new.append((PING, (unit[0], unit[1]), unit[2], p_index, unit[3]))
-		for unit in emps: units_new.append((EMP, (unit[0], unit[1]), unit[2], p_index, unit[3]))
-		for unit in scramblers: units_new.append((SCRAMBLER, (unit[0], unit[1]), unit[2], p_index, unit[3]))
-
-		return units_new
+			yield self.num_frames
 
 	# checks if reached the final frame - if so, display winner
 	def check_end_of_game(self):
 		self.end_of_game = False
-		try:
-			self.data[self.head[0]+1,-1]
-		except KeyError as e:								# outside of turn limit
-			try:
-				self.data[self.head[0],self.head[1]+1]		
-			except KeyError as e:							# outside of frame limit
+		if (self.head[0]+1, -1) not in self.data:			# outside of turn limit
+			if (self.head[0], self.head[1]+1) not in self.data:		# outside of frame limit
 				self.end_of_game = True 					# must be end of game
 
 		if self.end_of_game: self.info.show_winner()		# show the winner if it is the end of game
@@ -1127,30 +1102,84 @@ class Graph:
 		return grid
 
 
-# a simple data storage class to hold the data for a single frame
-class Frame:
-	def __init__(self, t, f, data):
-		self.turn = t 					# the turn for this frame
-		self.frame = f 					# the local frame for this frame
-		self.data = data 				# the data for this frame
-
-	def __repr__(self):
-		return ('({}, {})'.format(self.turn, self.frame))
-
-	def __getitem__(self, key):
-		return self.data[key]
+# the units of a frame keyed by ID, with the order of each unit among those on its location (count)
+def board_units(frame):
+	units = {}
+	loc = {}
+	for p_index, key in ((1, 'p1Units'), (2, 'p2Units')):
+		for unit_type, typed_units in enumerate(frame[key][:SCRAMBLER+1]):
+			for x, y, stability, ID in typed_units:
+				count = loc[(x,y)] = loc.get((x,y), 0) + 1
+				units[ID] = (unit_type, x, y, stability, p_index, count)
+	return units, loc
+
+
+# works out once how the units change from each frame to the next (spawned, moved or damaged, and destroyed, by ID),
+# so playing a frame only touches what changed
+class Playback:
+	def __init__(self, replay):
+		self.reader = replay.reader
+		self.positions = {}				# the index of each (turn, frame)
+		self.deltas = []				# per frame, the (spawned, changed, removed) units compared with the frame before
+		self.stats = []					# per frame, (p1Stats, p2Stats)
+		self.labels = []				# per frame, the number of units at every location with more than 1 unit
+		self.keyframes = {}				# every unit at the start of each turn by frame index, to jump around from
+		self.keyframe_indexes = []
+		self.last = {}					# every unit in the last frame added
+
+		self.extend(self.reader.keys())
+
+	# decodes the given frames, which follow the ones already added, and stores their changes
+	def extend(self, keys):
+		for key, data in self.reader.iter_frames(keys):
+			units, loc = board_units(data)
+			spawned = [(ID, unit) for ID, unit in units.items() if ID not in self.last]
+			changed = [(ID, unit) for ID, unit in units.items() if ID in self.last and self.last[ID] != unit]
+			removed = [ID for ID in self.last if ID not in units]
+
+			index = len(self.deltas)
+			self.positions[key] = index
+			self.deltas.append((spawned, changed, removed))
+			self.stats.append((data['p1Stats'], data['p2Stats']))
+			self.labels.append(dict((pos, val) for pos, val in loc.items() if val > 1))
+			if key[1] == -1 or index == 0:
+				self.keyframes[index] = units
+				self.keyframe_indexes.append(index)
+			self.last = units
+
+	# every unit on a frame, rebuilt from the closest keyframe before it
+	def units_at(self, index):
+		start = self.keyframe_indexes[bisect.bisect_right(self.keyframe_indexes, index) - 1]
+		units = dict(self.keyframes[start])
+		for spawned, changed, removed in self.deltas[start+1:index+1]:
+			for ID in removed:
+				del units[ID]
+			units.update(spawned)
+			units.update(changed)
+		return units
+
+	# the changes that take the board from one frame to another. Moving forward one frame, these are already known
+	def changes(self, shown, index):
+		if shown != None and shown + 1 == index:
+			return self.deltas[index]
+
+		before = self.units_at(shown) if shown != None else {}
+		after = self.units_at(index)
+		spawned = [(ID, unit) for ID, unit in after.items() if ID not in before]
+		changed = [(ID, unit) for ID, unit in after.items() if ID in before and before[ID] != unit]
+		removed = [ID for ID in before if ID not in after]
+		return spawned, changed, removed
 
 
 # Stores data from a single replay
 class Replay:
 	def __init__(self, f_name):
 		self.fname = f_name 			# the file name of the replay
+		self.reader = ReplayReader(f_name)	# indexes the file, frames are only decoded when they are shown
 		self.ref = None					# stores the raw dict data as a reference
-		self.frames = {}				# dict containing all data, keys are turn, frame tuple with Frame objects as values
-		self.frames_in_turn = {}		# number of frames in each turn
-		self.healths = ([], [])			# contains the healths for player1 and player2
-
-		self.load_data()				# handles loading all the data from file into python variables
+		self.frames = self.reader		# acts like a dict with keys of turn, frame tuples and the frame's data as values
+		self.frames_in_turn = self.reader.frames_in_turn()		# number of frames in each turn
+		self.healths = self.reader.healths()		# contains the healths for player1 and player2, taken from the index
 
 	def __eq__(self, other):
 		return self.fname == other.fname
@@ -1161,32 +1190,13 @@ class Replay:
 	def __repr__(self):
 		return self.__string()
 
-	# loads all data from a replay into the python variables
-	def load_data(self):
-		with open(self.fname) as f:
-			i = 0
-			for line in f:
-				line = line.replace("\n", "")
-				line = line.replace("\t", "")
-
-				if (line != ''):
-					data = json.loads(line)
-
-					try:
-						data['debug']
-						self.ref = data
-					except:
-						turn_num = data['turnInfo'][1]
-						frame_num = data['turnInfo'][2]
-						self.frames[(turn_num, frame_num)] = Frame(turn_num, frame_num, data)
-
-						self.healths[0].append(data['p1Stats'][0])
-						self.healths[1].append(data['p2Stats'][0])
-
-						try:
-							self.frames_in_turn[turn_num] += 1
-						except KeyError:
-							self.frames_in_turn[turn_num] = 1
+	# reads the frames added to the file since it was last read, returns their (turn, frame) keys
+	def refresh(self):
+		new = self.reader.refresh()
+		if len(new) > 0:
+			self.frames_in_turn = self.reader.frames_in_turn()
+			self.healths = self.reader.healths()
+		return new
 
 # handles opening multiple games (replays)
 class FileHandler:
@@ -1319,7 +1329,7 @@ def main(args):
 			try:
 				fh.load_files(1,False,args['file'])
 				replay = fh.get_last_replay()
-				animatedReplay = Graph(replay.frames, replay.frames_in_turn, replay.healths, writers, keep_trying, fh=fh)		# create our Graph object
+				animatedReplay = Graph(replay, writers, keep_trying, real_time=True)		# create our Graph object
 				break
 			except RuntimeError:																		# we raised this error when data was nothing in Graph init()
 				time.sleep(.5)
@@ -1336,7 +1346,7 @@ def main(args):
 		fh.load_files(1,False,args['file'])															# load latest replay
 		replay = fh.get_last_replay()																# get latest replay
 
-		animatedReplay = Graph(replay.frames, replay.frames_in_turn, replay.healths, writers, keep_trying, save=save)		# create our Graph object
+		animatedReplay = Graph(replay, writers, keep_trying, save=save)		# create our Graph object
 
 
 if __name__ == '__main__':